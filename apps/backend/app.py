@@ -10,7 +10,10 @@ load_dotenv()
 from app import create_app
 
 # 创建应用实例
-app = create_app()
+# 密码哈希进程池以 spawn 启动子进程，子进程会以 __mp_main__ 重新执行入口脚本；
+# 子进程只运行哈希函数，不能在其中初始化数据库、扩展和后台服务
+if __name__ != '__mp_main__':
+    app = create_app()
 
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
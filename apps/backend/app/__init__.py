@@ -2,6 +2,7 @@
 Flask应用工厂模块
 """
 import os
+import click
 from flask import Flask
 from flask_jwt_extended import JWTManager
 from flask_cors import CORS
@@ -21,6 +22,10 @@ def create_app(config_name=None):
     app = Flask(__name__)
     app.config.from_object(config[config_name])
 
+    # JSON 序列化（orjson 可用时加速，否则与默认行为一致）
+    from app.utils.json_provider import FastJSONProvider
+    app.json = FastJSONProvider(app)
+
     # 初始化扩展
     jwt.init_app(app)
     cors.init_app(app, origins=app.config['CORS_ORIGINS'])
@@ -29,17 +34,47 @@ def create_app(config_name=None):
     from app.database import init_app
     init_app(app)
 
+    # 启动次数预留清理线程
+    from app.services.credit_hold_sweeper import CreditHoldSweeper
+    CreditHoldSweeper.init_app(app)
+
     # 初始化性能日志中间件
     from app.middleware.performance_logger import PerformanceLogger
     PerformanceLogger.init_app(app)
 
     # JWT配置
+    from app.services.token_revocation_cache import TokenRevocationCache
+    TokenRevocationCache.init_app(app)
+
+    # 角色权限缓存
+    from app.services.permission_cache import PermissionCache
+    PermissionCache.init_app(app)
+
+    # 密码哈希进程池
+    from app.services.password_hasher import PasswordHasher
+    PasswordHasher.init_app(app)
+
+    # 速率限制状态存储
+    from app.middleware.rate_limiter import rate_limiter
+    rate_limiter.init_app(app)
+
+    # 响应缓存容量
+    from app.middleware.response_cache import response_cache
+    response_cache.init_app(app)
+
+    # 画廊导出并发数和本地镜像目录
+    from app.services.gallery_export import GalleryExporter
+    GalleryExporter.init_app(app)
+
+    # 响应压缩
+    from app.middleware.compression import response_compressor
+    response_compressor.init_app(app)
+
     @jwt.token_in_blocklist_loader
     def check_if_token_revoked(jwt_header, jwt_payload):
         """检查JWT是否被撤销"""
-        from app.database import JWTBlacklist
-        jti = jwt_payload['jti']
-        return JWTBlacklist.is_blacklisted(jti)
+        # 进程内撤销集合，只在定期同步时查询数据库
+        return TokenRevocationCache.is_revoked(jwt_payload['jti'])
 
     @jwt.expired_token_loader
     def expired_token_callback(jwt_header, jwt_payload):
@@ -77,6 +112,80 @@ def create_app(config_name=None):
         _init_db()
         print('数据库已初始化')
 
+    @app.cli.command('search-index')
+    @click.argument('action', type=click.Choice(['rebuild', 'optimize']))
+    def search_index(action):
+        """重建或优化画廊全文搜索索引"""
+        from app.database import CreationSearchIndex
+        if not CreationSearchIndex.is_available():
+            print('当前 SQLite 不支持 FTS5，搜索使用 LIKE 回退')
+            return
+
+        if action == 'rebuild':
+            CreationSearchIndex.rebuild()
+            print('搜索索引已重建')
+        else:
+            steps = CreationSearchIndex.optimize()
+            print(f'搜索索引已优化（{steps} 步增量合并）')
+
+    @app.cli.command('backfill-tags')
+    @click.option('--batch-size', default=500, show_default=True, help='每批处理的作品数')
+    def backfill_tags(batch_size):
+        """在线分批回填作品标签表"""
+        from app.database import CreationTag
+        result = CreationTag.backfill(batch_size=batch_size)
+        print(f"标签回填完成：处理 {result['processed']} 条作品")
+
+    @app.cli.command('reconcile-gallery-stats')
+    @click.option('--user-id', type=int, default=None, help='只校正指定用户')
+    def reconcile_gallery_stats(user_id):
+        """从作品表重新汇总画廊统计（建议每天定时执行）"""
+        from app.database import UserGalleryStats
+        rows = UserGalleryStats.reconcile(user_id=user_id)
+        print(f'画廊统计已校正：写入 {rows} 行')
+
+    @app.cli.command('prune-performance-metrics')
+    @click.option('--batch-size', default=5000, show_default=True, help='每批删除的原始记录数')
+    def prune_performance_metrics(batch_size):
+        """按保留期删除性能原始记录和过期汇总桶（建议每天定时执行）"""
+        from app.database import PerformanceRollup
+        removed = PerformanceRollup.prune(
+            raw_days=app.config.get('PERFORMANCE_RAW_RETENTION_DAYS'),
+            minute_days=app.config.get('PERFORMANCE_MINUTE_RETENTION_DAYS'),
+            hour_days=app.config.get('PERFORMANCE_HOUR_RETENTION_DAYS'),
+            batch_size=batch_size
+        )
+        print(f"性能指标已清理：原始记录 {removed['raw']} 条，分钟汇总 {removed['minute']} 行，小时汇总 {removed['hour']} 行")
+
+    @app.cli.command('expire-credit-holds')
+    def expire_credit_holds():
+        """立即过期超时的次数预留并退还次数"""
+        from app.database import CreditHold
+        expired = CreditHold.expire_stale()
+        print(f'已过期 {expired} 个次数预留')
+
+    @app.cli.command('credit-snapshots')
+    def credit_snapshots():
+        """为有新流水的用户写入次数余额快照（建议每天定时执行）"""
+        from app.database import CreditLedger
+        count = CreditLedger.take_snapshots()
+        print(f'已写入 {count} 个余额快照')
+
+    @app.cli.command('resume-user-deletions')
+    def resume_user_deletions():
+        """在前台继续执行所有未完成的用户删除任务"""
+        from app.database import UserDeletionJob
+        for job_id in UserDeletionJob.get_unfinished():
+            job = UserDeletionJob.run(job_id)
+            print(f"删除任务 {job_id}（用户 {job['user_email']}）：{job['status']} {job['progress']}")
+
+    @app.cli.command('cleanup-jwt-blacklist')
+    def cleanup_jwt_blacklist():
+        """清理已过期的JWT黑名单记录"""
+        from app.database import JWTBlacklist
+        removed = JWTBlacklist.cleanup_expired()
+        print(f'已清理 {removed} 条过期黑名单记录')
+
     # 健康检查端点
     @app.route('/health')
     def health_check():
@@ -3,11 +3,13 @@
 """
 import sqlite3
 import os
+import re
+import json
 import hashlib
 from datetime import datetime
 from typing import Optional, List, Dict, Any
 from flask import g, current_app
-from werkzeug.security import generate_password_hash, check_password_hash
+from app.services.password_hasher import PasswordHasher, PasswordHasherBusy
 
 
 def get_db_path():
@@ -58,11 +60,11 @@ def init_db():
         )
     ''')
 
-    # 创建作品表
+    # 创建作品表（user_id 允许 NULL：用户删除后作品保留为孤儿）
     db.execute('''
         CREATE TABLE IF NOT EXISTS creations (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
+            user_id INTEGER,
             prompt TEXT NOT NULL,
             image_url TEXT NOT NULL,
             model_used TEXT NOT NULL,
@@ -74,7 +76,7 @@ def init_db():
             visibility TEXT DEFAULT 'private',
             created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
             updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE SET NULL
         )
     ''')
 
@@ -279,6 +281,12 @@ def init_db():
     ''')
 
     # 检查并添加新的列（数据库迁移）
+    try:
+        # 黑名单记录按 token 的 exp 过期（Unix 时间戳）
+        db.execute('ALTER TABLE jwt_blacklist ADD COLUMN expires_at INTEGER')
+    except sqlite3.OperationalError:
+        pass
+
     try:
         # 尝试添加新列
         db.execute('ALTER TABLE creations ADD COLUMN is_favorite BOOLEAN NOT NULL DEFAULT 0')
@@ -305,24 +313,127 @@ def init_db():
     except sqlite3.OperationalError:
         pass
 
+    try:
+        # 孤儿作品标记（用户删除后保留作品）
+        db.execute('ALTER TABLE creations ADD COLUMN is_orphaned BOOLEAN DEFAULT 0')
+    except sqlite3.OperationalError:
+        pass
+
+    # 旧库的 creations.user_id 为 NOT NULL，重建为允许 NULL（须在下面重建触发器和视图之前）
+    _make_creation_owner_nullable(db)
+
+    # 用户删除任务与审计表
+    UserDeletionJob.ensure(db)
+
+    # 作品标签索引（规范化标签表 + 每用户标签计数）
+    CreationTag.ensure(db)
+
+    # 次数流水与余额快照
+    CreditLedger.ensure(db)
+
+    # 次数预留表
+    CreditHold.ensure(db)
+
+    # 用户画廊统计（物化计数，由触发器增量维护）
+    UserGalleryStats.ensure(db)
+
+    # 用户数据版本号（ETag / 304）
+    UserDataVersion.ensure(db)
+
+    # 性能指标分钟 / 小时汇总（由触发器增量维护）
+    PerformanceRollup.ensure(db)
+
+    # 作品全文搜索索引（FTS5 外部内容表）
+    CreationSearchIndex.ensure(db)
+
+    # 登录失败计数（所有 worker 共享）
+    LoginFailure.ensure(db)
+
+    # 角色权限版本计数（权限缓存失效）
+    RoleVersion.ensure(db)
+
+    db.commit()
+
+
+def _make_creation_owner_nullable(db):
+    """
+    将 creations.user_id 的 NOT NULL 约束去掉（与 fix_user_id_constraint.py 相同的重建）
+
+    SQLite 不支持修改列约束，只能新建表、复制数据、删除旧表后改名。
+    creations 上的触发器随旧表删除，引用它的搜索视图先行删除，二者都由 init_db
+    随后的 ensure 重新创建；作品 id 原样复制，FTS 索引与各计数表无需重建。
+    删除旧表期间关闭外键检查，避免级联删除标签、相似度等引用作品的行。
+    """
+    def owner_not_null():
+        return any(row['name'] == 'user_id' and row['notnull'] for row in db.execute('PRAGMA table_info(creations)'))
+
+    if not owner_not_null():
+        return
+
+    columns = ('id, user_id, prompt, image_url, model_used, size, generation_time, is_favorite, '
+               'tags, category, visibility, created_at, updated_at, is_orphaned')
     db.commit()
+    db.execute('PRAGMA foreign_keys = OFF')
+    try:
+        db.execute('BEGIN IMMEDIATE')
+        # 多个 worker 同时启动时只有第一个执行重建
+        if not owner_not_null():
+            db.rollback()
+            return
+        db.execute(f'DROP VIEW IF EXISTS {CreationSearchIndex.SOURCE_VIEW}')
+        db.execute('''
+            CREATE TABLE creations_new (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER,
+                prompt TEXT NOT NULL,
+                image_url TEXT NOT NULL,
+                model_used TEXT NOT NULL,
+                size TEXT NOT NULL,
+                generation_time REAL,
+                is_favorite BOOLEAN NOT NULL DEFAULT 0,
+                tags TEXT DEFAULT '',
+                category TEXT DEFAULT 'general',
+                visibility TEXT DEFAULT 'private',
+                created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                is_orphaned BOOLEAN DEFAULT 0,
+                FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE SET NULL
+            )
+        ''')
+        db.execute(f'INSERT INTO creations_new ({columns}) SELECT {columns} FROM creations')
+        # 保留自增序列，已删除作品的 id 不会被复用
+        sequence = db.execute("SELECT seq FROM sqlite_sequence WHERE name = 'creations'").fetchone()
+        db.execute('DROP TABLE creations')
+        db.execute('ALTER TABLE creations_new RENAME TO creations')
+        if sequence:
+            db.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = 'creations'", (sequence['seq'],))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.execute('PRAGMA foreign_keys = ON')
 
 
 class User:
     """用户模型"""
 
+    # 默认给5次生成机会
+    SIGNUP_CREDITS = 5
+
     @staticmethod
     def create(email: str, password: str) -> Optional[int]:
         """创建新用户"""
+        # 使用 werkzeug 的 pbkdf2:sha256 哈希算法（更安全），在哈希进程池中计算
+        password_hash = PasswordHasher.hash(password)
         db = get_db()
-        # 使用 werkzeug 的 pbkdf2:sha256 哈希算法（更安全）
-        password_hash = generate_password_hash(password, method='pbkdf2:sha256')
 
         try:
             cursor = db.execute(
                 'INSERT INTO users (email, password_hash, credits) VALUES (?, ?, ?)',
-                (email, password_hash, 5)  # 默认给5次生成机会
+                (email, password_hash, User.SIGNUP_CREDITS)
             )
+            CreditLedger.record(db, cursor.lastrowid, User.SIGNUP_CREDITS, 'signup')
             db.commit()
             return cursor.lastrowid
         except sqlite3.IntegrityError:
@@ -348,30 +459,38 @@ class User:
 
     @staticmethod
     def verify_password(user: Dict[str, Any], password: str) -> bool:
-        """验证密码（支持新旧格式兼容）"""
+        """
+        验证密码（支持新旧格式兼容）
+
+        Raises:
+            PasswordHasherBusy: 哈希进程池队列已满或超时
+        """
         stored_hash = user['password_hash']
         
         # 检查是否是新格式（pbkdf2:sha256 哈希以 'pbkdf2:sha256:' 开头）
         if stored_hash.startswith('pbkdf2:sha256:'):
-            # 使用 werkzeug 验证新格式密码
-            is_valid = check_password_hash(stored_hash, password)
+            # 使用 werkzeug 验证新格式密码（在哈希进程池中计算）
+            is_valid = PasswordHasher.verify(stored_hash, password)
             return is_valid
         else:
             # 兼容旧格式（SHA256）
             old_hash = hashlib.sha256(password.encode()).hexdigest()
             is_valid = stored_hash == old_hash
             
-            # 如果验证成功，自动升级到新格式
+            # 如果验证成功，自动升级到新格式（哈希进程池繁忙时留到下次登录）
             if is_valid:
-                User.upgrade_password_hash(user['id'], password)
+                try:
+                    User.upgrade_password_hash(user['id'], password)
+                except PasswordHasherBusy:
+                    pass
             
             return is_valid
     
     @staticmethod
     def upgrade_password_hash(user_id: int, password: str):
         """将用户密码哈希升级到新格式"""
+        new_hash = PasswordHasher.hash(password)
         db = get_db()
-        new_hash = generate_password_hash(password, method='pbkdf2:sha256')
         db.execute(
             'UPDATE users SET password_hash = ? WHERE id = ?',
             (new_hash, user_id)
@@ -390,25 +509,33 @@ class User:
                 (now, user_id)
             )
         else:
-            # 增加失败次数
-            db.execute(
-                'UPDATE users SET login_attempts = login_attempts + 1 WHERE id = ?',
-                (user_id,)
-            )
-
-            # 检查是否需要锁定账户
-            user = User.get_by_id(user_id)
-            if user and user['login_attempts'] >= 5:
-                # 锁定30分钟
-                from datetime import timedelta
-                lock_until = (datetime.now() + timedelta(minutes=30)).isoformat()
-                db.execute(
-                    'UPDATE users SET locked_until = ? WHERE id = ?',
-                    (lock_until, user_id)
-                )
+            # 登录接口通过 LoginFailure.record_failure 记录（与邮箱冷却在同一事务内）
+            User.increment_login_attempts(db, user_id)
 
         db.commit()
 
+    @staticmethod
+    def increment_login_attempts(db, user_id: int) -> Optional[Dict[str, Any]]:
+        """
+        账户失败次数加一，累计达到上限时锁定30分钟（不提交）
+
+        计数不按时间窗口重置，只在登录成功时清零，慢速猜测同样会触发锁定。
+
+        Returns:
+            {'login_attempts', 'locked_until'}，用户不存在返回 None
+        """
+        from datetime import timedelta
+        lock_until = (datetime.now() + timedelta(seconds=LoginFailure.ACCOUNT_LOCK_SECONDS)).isoformat()
+        row = db.execute(
+            '''UPDATE users SET
+                   login_attempts = login_attempts + 1,
+                   locked_until = CASE WHEN login_attempts + 1 >= ? THEN ? ELSE locked_until END
+               WHERE id = ?
+               RETURNING login_attempts, locked_until''',
+            (LoginFailure.LIMIT, lock_until, user_id)
+        ).fetchone()
+        return dict(row) if row else None
+
     @staticmethod
     def is_locked(user: Dict[str, Any]) -> bool:
         """检查用户是否被锁定"""
@@ -420,314 +547,982 @@ class User:
 
     @staticmethod
     def consume_credits(user_id: int, amount: int = 1) -> bool:
-        """消费用户次数"""
+        """消费用户次数（条件更新，次数不足时不扣除）"""
         db = get_db()
-
-        # 检查当前次数
-        user = User.get_by_id(user_id)
-        if not user or user['credits'] < amount:
-            return False
-
-        # 扣除次数
-        db.execute(
-            'UPDATE users SET credits = credits - ? WHERE id = ?',
-            (amount, user_id)
+        result = db.execute(
+            'UPDATE users SET credits = credits - ? WHERE id = ? AND credits >= ?',
+            (amount, user_id, amount)
         )
+        if result.rowcount > 0:
+            CreditLedger.record(db, user_id, -amount, 'consume')
         db.commit()
-        return True
+        return result.rowcount > 0
 
     @staticmethod
     def refund_credits(user_id: int, amount: int = 1):
         """退还用户次数"""
         db = get_db()
-        db.execute(
+        result = db.execute(
             'UPDATE users SET credits = credits + ? WHERE id = ?',
             (amount, user_id)
         )
+        if result.rowcount > 0:
+            CreditLedger.record(db, user_id, amount, 'refund')
         db.commit()
 
     @staticmethod
-    def add_credits(user_id: int, amount: int):
-        """添加用户次数（管理员功能）"""
+    def add_credits(user_id: int, amount: int, actor_id: int = None, note: str = '') -> Optional[Dict[str, Any]]:
+        """
+        添加用户次数（管理员功能）
+
+        Returns:
+            {'ledger_id': 流水ID, 'balance': 充值后次数}，用户不存在返回 None
+        """
         db = get_db()
-        db.execute(
-            'UPDATE users SET credits = credits + ? WHERE id = ?',
+        row = db.execute(
+            'UPDATE users SET credits = credits + ? WHERE id = ? RETURNING credits',
             (amount, user_id)
-        )
+        ).fetchone()
+        if not row:
+            db.rollback()
+            return None
+
+        ledger_id = CreditLedger.record(db, user_id, amount, 'admin_add', actor_id=actor_id, note=note)
         db.commit()
+        return {'ledger_id': ledger_id, 'balance': row['credits']}
 
     @staticmethod
-    def delete_user_cascade(user_id: int, admin_id: int, reason: str = '') -> Dict[str, Any]:
+    def bulk_add_credits(rows, actor_id: int = None, note: str = '', record_ledger: bool = True,
+                         chunk_size: int = 500, max_amount: int = 1000) -> Dict[str, Any]:
         """
-        级联删除用户及相关数据（管理员功能）
+        批量添加用户次数（管理员功能）
+
+        按 chunk_size 分块，每块一次解析用户、一次 executemany 更新余额并写入流水，
+        然后单独提交，单块失败只影响该块。
 
         Args:
-            user_id: 要删除的用户ID
-            admin_id: 执行删除的管理员ID
-            reason: 删除原因
+            rows: 可迭代的 (行号, 用户ID或邮箱, 次数)，可以是流式读取的 CSV
+            record_ledger: 是否写入次数流水（关闭后 CreditLedger.verify 将无法对账）
 
         Returns:
-            包含删除结果和影响范围的字典
+            {'applied': 成功行数, 'credits_added': 合计次数, 'failed': [{'row', 'user', 'error'}]}
         """
         db = get_db()
+        result = {'applied': 0, 'credits_added': 0, 'failed': []}
 
-        try:
-            # 1. 防止自我删除 (关键安全检查)
-            if user_id == admin_id:
-                raise ValueError(f'Cannot delete self - admin user {admin_id} attempted to delete themselves')
-
-            # 2. 验证用户存在
-            user = db.execute('SELECT id, email FROM users WHERE id = ?', (user_id,)).fetchone()
-            if not user:
-                raise ValueError(f'User {user_id} not found')
-
-            user_email = user['email']
-
-            # 3. 统计影响范围（删除前）
-            impact = {
-                'creations_orphaned': db.execute(
-                    'SELECT COUNT(*) as count FROM creations WHERE user_id = ?', (user_id,)
-                ).fetchone()['count'],
-                'sessions_deleted': db.execute(
-                    'SELECT COUNT(*) as count FROM user_sessions WHERE user_id = ?', (user_id,)
-                ).fetchone()['count'],
-                'behaviors_deleted': db.execute(
-                    'SELECT COUNT(*) as count FROM user_behaviors WHERE user_id = ?', (user_id,)
-                ).fetchone()['count'],
-                'preferences_deleted': db.execute(
-                    'SELECT COUNT(*) as count FROM user_preferences WHERE user_id = ?', (user_id,)
-                ).fetchone()['count'],
-                'recommendations_deleted': db.execute(
-                    'SELECT COUNT(*) as count FROM smart_recommendations WHERE user_id = ?', (user_id,)
-                ).fetchone()['count'],
-                'performance_metrics_deleted': db.execute(
-                    'SELECT COUNT(*) as count FROM performance_metrics WHERE user_id = ?', (user_id,)
-                ).fetchone()['count']
-            }
+        def apply_chunk(chunk):
+            ids = {ident for _, ident, _ in chunk if isinstance(ident, int)}
+            emails = {ident for _, ident, _ in chunk if isinstance(ident, str)}
+            missing, updates = set(), []
 
-            # 4. 执行级联删除
-            # 软删除：将作品标记为孤儿（保留内容）
-            db.execute('''
-                UPDATE creations
-                SET user_id = NULL, is_orphaned = 1
-                WHERE user_id = ?
-            ''', (user_id,))
+            try:
+                resolved: Dict[Any, int] = {}
+                if ids:
+                    placeholders = ','.join('?' * len(ids))
+                    for row in db.execute(f'SELECT id FROM users WHERE id IN ({placeholders})', list(ids)):
+                        resolved[row['id']] = row['id']
+                if emails:
+                    placeholders = ','.join('?' * len(emails))
+                    for row in db.execute(
+                        f'SELECT id, email FROM users WHERE email IN ({placeholders})', list(emails)
+                    ):
+                        resolved[row['email']] = row['id']
+
+                for row_no, ident, amount in chunk:
+                    user_id = resolved.get(ident)
+                    if user_id is None:
+                        missing.add(row_no)
+                        result['failed'].append({'row': row_no, 'user': ident, 'error': '用户不存在'})
+                    else:
+                        updates.append((amount, user_id))
+
+                if not updates:
+                    return
+
+                db.executemany('UPDATE users SET credits = credits + ? WHERE id = ?', updates)
+                if record_ledger:
+                    CreditLedger.record_many(db, [
+                        (user_id, amount, 'admin_add', None, actor_id, note)
+                        for amount, user_id in updates
+                    ])
+                db.commit()
+            except sqlite3.Error as e:
+                # 查询或写入失败时整块回滚，块内其余行逐行报告失败
+                db.rollback()
+                for row_no, ident, _ in chunk:
+                    if row_no not in missing:
+                        result['failed'].append({'row': row_no, 'user': ident, 'error': f'写入失败: {e}'})
+                return
+
+            result['applied'] += len(updates)
+            result['credits_added'] += sum(amount for amount, _ in updates)
+
+        chunk = []
+        for row_no, ident, amount in rows:
+            if isinstance(ident, str):
+                ident = ident.strip()
+                if ident.isdigit():
+                    ident = int(ident)
+            if ident in (None, ''):
+                result['failed'].append({'row': row_no, 'user': ident, 'error': '用户ID或邮箱不能为空'})
+                continue
+            if not isinstance(amount, int) or isinstance(amount, bool) or not 0 < amount <= max_amount:
+                result['failed'].append({
+                    'row': row_no, 'user': ident, 'error': f'充值次数必须是 1-{max_amount} 的整数'
+                })
+                continue
 
-            # 硬删除：用户特定数据
-            db.execute('DELETE FROM user_sessions WHERE user_id = ?', (user_id,))
-            db.execute('DELETE FROM user_behaviors WHERE user_id = ?', (user_id,))
-            db.execute('DELETE FROM user_preferences WHERE user_id = ?', (user_id,))
-            db.execute('DELETE FROM smart_recommendations WHERE user_id = ?', (user_id,))
-            db.execute('DELETE FROM performance_metrics WHERE user_id = ?', (user_id,))
+            chunk.append((row_no, ident, amount))
+            if len(chunk) >= chunk_size:
+                apply_chunk(chunk)
+                chunk = []
 
-            # 5. 记录审计日志
-            data_summary = f"Orphaned {impact['creations_orphaned']} creations, " \
-                          f"deleted {sum(impact.values()) - impact['creations_orphaned']} records"
+        if chunk:
+            apply_chunk(chunk)
 
-            db.execute('''
-                INSERT INTO user_deletions
-                (deleted_user_id, deleted_user_email, admin_user_id, reason,
-                 creations_orphaned, data_summary)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (user_id, user_email, admin_id, reason or 'Admin action',
-                  impact['creations_orphaned'], data_summary))
+        result['failed'].sort(key=lambda failure: failure['row'])
+        return result
 
-            # 6. 删除用户记录
-            db.execute('DELETE FROM users WHERE id = ?', (user_id,))
 
-            db.commit()
+class UserDeletionJob:
+    """
+    用户删除后台任务
+
+    删除请求只做一次很小的写入：停用用户并登记任务，随后由后台线程
+    （app.services.user_deletion_worker）分块执行：
+    - 软删除：作品分批标记为孤儿（保留内容）
+    - 硬删除：会话、行为、偏好、推荐、性能指标分批删除
+    每块单独提交并在同一事务内记录进度，中断后从剩余数据继续；
+    全部完成后写入 user_deletions 审计记录并删除用户行。
+    """
+
+    CHUNK_SIZE = 500
+
+    # (进度键, 分块语句)；语句参数为 (user_id, chunk_size)
+    STEPS = [
+        ('creations_orphaned', '''
+            UPDATE creations SET user_id = NULL, is_orphaned = 1
+            WHERE id IN (SELECT id FROM creations WHERE user_id = ? LIMIT ?)
+        '''),
+        ('sessions_deleted', '''
+            DELETE FROM user_sessions
+            WHERE id IN (SELECT id FROM user_sessions WHERE user_id = ? LIMIT ?)
+        '''),
+        ('behaviors_deleted', '''
+            DELETE FROM user_behaviors
+            WHERE id IN (SELECT id FROM user_behaviors WHERE user_id = ? LIMIT ?)
+        '''),
+        ('preferences_deleted', '''
+            DELETE FROM user_preferences
+            WHERE id IN (SELECT id FROM user_preferences WHERE user_id = ? LIMIT ?)
+        '''),
+        ('recommendations_deleted', '''
+            DELETE FROM smart_recommendations
+            WHERE id IN (SELECT id FROM smart_recommendations WHERE user_id = ? LIMIT ?)
+        '''),
+        ('performance_metrics_deleted', '''
+            DELETE FROM performance_metrics
+            WHERE id IN (SELECT id FROM performance_metrics WHERE user_id = ? LIMIT ?)
+        '''),
+    ]
 
-            return {
-                'message': 'User deleted successfully',
-                'deleted_user': {
-                    'id': user_id,
-                    'email': user_email,
-                    'deleted_at': datetime.now().isoformat() + 'Z'
-                },
-                'impact': impact
-            }
+    @staticmethod
+    def ensure(db):
+        """创建任务表和删除审计表"""
+        db.execute('''
+            CREATE TABLE IF NOT EXISTS user_deletion_jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                user_email TEXT NOT NULL,
+                admin_id INTEGER NOT NULL,
+                reason TEXT,
+                status TEXT NOT NULL DEFAULT 'pending', -- 'pending', 'running', 'completed', 'failed'
+                current_step TEXT,
+                progress TEXT NOT NULL DEFAULT '{}', -- JSON: 各步骤已处理行数
+                error TEXT,
+                created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                completed_at DATETIME
+            )
+        ''')
+        db.execute('''
+            CREATE INDEX IF NOT EXISTS idx_user_deletion_jobs_user
+            ON user_deletion_jobs(user_id, status)
+        ''')
+
+        db.execute('''
+            CREATE TABLE IF NOT EXISTS user_deletions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                deleted_user_id INTEGER NOT NULL,
+                deleted_user_email TEXT NOT NULL,
+                admin_user_id INTEGER,
+                reason TEXT,
+                creations_orphaned INTEGER DEFAULT 0,
+                data_summary TEXT,
+                deleted_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+    @staticmethod
+    def create(user_id: int, admin_id: int, reason: str = '') -> Dict[str, Any]:
+        """
+        停用用户并登记删除任务（单个小事务，立即返回）
+
+        Raises:
+            ValueError: 删除自己、用户不存在或已有进行中的删除任务
+        """
+        if user_id == admin_id:
+            raise ValueError(f'Cannot delete self - admin user {admin_id} attempted to delete themselves')
+
+        db = get_db()
+        user = db.execute('SELECT id, email FROM users WHERE id = ?', (user_id,)).fetchone()
+        if not user:
+            raise ValueError(f'User {user_id} not found')
+
+        active = db.execute(
+            '''SELECT id FROM user_deletion_jobs
+               WHERE user_id = ? AND status != 'completed'
+               LIMIT 1''',
+            (user_id,)
+        ).fetchone()
+        if active:
+            return UserDeletionJob.get(active['id'])
+
+        db.execute('UPDATE users SET is_active = 0 WHERE id = ?', (user_id,))
+        cursor = db.execute(
+            '''INSERT INTO user_deletion_jobs (user_id, user_email, admin_id, reason)
+               VALUES (?, ?, ?, ?)''',
+            (user_id, user['email'], admin_id, reason or 'Admin action')
+        )
+        db.commit()
+        return UserDeletionJob.get(cursor.lastrowid)
+
+    @staticmethod
+    def get(job_id: int) -> Optional[Dict[str, Any]]:
+        """获取任务状态和进度"""
+        db = get_db()
+        job = db.execute('SELECT * FROM user_deletion_jobs WHERE id = ?', (job_id,)).fetchone()
+        if not job:
+            return None
+        job = dict(job)
+        job['progress'] = json.loads(job['progress'] or '{}')
+        return job
+
+    @staticmethod
+    def get_unfinished() -> List[int]:
+        """未完成（含失败）的任务ID，用于恢复执行"""
+        db = get_db()
+        rows = db.execute(
+            "SELECT id FROM user_deletion_jobs WHERE status != 'completed' ORDER BY id"
+        ).fetchall()
+        return [row['id'] for row in rows]
+
+    @staticmethod
+    def run(job_id: int, chunk_size: int = None, pause_seconds: float = 0.05) -> Dict[str, Any]:
+        """
+        执行（或继续执行）删除任务
+
+        每块最多 chunk_size 行，块与块之间暂停 pause_seconds 释放写锁，
+        生成等在线写入不会被长事务阻塞。所有步骤都只处理剩余数据，可重复执行。
+        """
+        import time
+
+        db = get_db()
+        chunk_size = chunk_size or UserDeletionJob.CHUNK_SIZE
+        job = UserDeletionJob.get(job_id)
+        if not job or job['status'] == 'completed':
+            return job
+
+        user_id = job['user_id']
+        progress = job['progress']
+
+        try:
+            for key, sql in UserDeletionJob.STEPS:
+                while True:
+                    affected = db.execute(sql, (user_id, chunk_size)).rowcount
+                    progress[key] = progress.get(key, 0) + affected
+                    db.execute(
+                        '''UPDATE user_deletion_jobs
+                           SET status = 'running', current_step = ?, progress = ?,
+                               error = NULL, updated_at = CURRENT_TIMESTAMP
+                           WHERE id = ?''',
+                        (key, json.dumps(progress), job_id)
+                    )
+                    db.commit()
+
+                    if affected < chunk_size:
+                        break
+                    if pause_seconds:
+                        time.sleep(pause_seconds)
+
+            # 收尾：审计记录、删除用户行、标记完成在同一事务内，状态条件保证只执行一次
+            finished = db.execute(
+                '''UPDATE user_deletion_jobs
+                   SET status = 'completed', current_step = NULL,
+                       completed_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+                   WHERE id = ? AND status != 'completed' ''',
+                (job_id,)
+            ).rowcount
+            if finished:
+                deleted_records = sum(progress.values()) - progress.get('creations_orphaned', 0)
+                data_summary = f"Orphaned {progress.get('creations_orphaned', 0)} creations, " \
+                               f"deleted {deleted_records} records"
+                db.execute('''
+                    INSERT INTO user_deletions
+                    (deleted_user_id, deleted_user_email, admin_user_id, reason,
+                     creations_orphaned, data_summary)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (user_id, job['user_email'], job['admin_id'], job['reason'],
+                      progress.get('creations_orphaned', 0), data_summary))
+                db.execute('DELETE FROM user_gallery_stats WHERE user_id = ?', (user_id,))
+                db.execute('DELETE FROM users WHERE id = ?', (user_id,))
+            db.commit()
 
         except Exception as e:
             db.rollback()
+            db.execute(
+                '''UPDATE user_deletion_jobs
+                   SET status = 'failed', error = ?, updated_at = CURRENT_TIMESTAMP
+                   WHERE id = ?''',
+                (str(e), job_id)
+            )
+            db.commit()
             raise
 
+        return UserDeletionJob.get(job_id)
 
-class Creation:
-    """作品模型"""
+
+class CreditLedger:
+    """
+    次数流水（只追加）
+
+    所有次数变动（注册赠送、消费、退还、管理员充值、预留 / 释放 / 过期）
+    与 users.credits 的更新在同一事务内写入一条流水。
+    credit_balance_snapshots 定期记录每个用户截至某条流水的余额，
+    "某时刻余额"和历史分页只需从最近的快照向后累加少量流水，与流水总量无关。
+    """
+
+    ENTRY_TYPES = ('signup', 'consume', 'refund', 'admin_add', 'hold', 'hold_release', 'hold_expire')
 
     @staticmethod
-    def create(user_id: int, prompt: str, image_url: str, model_used: str,
-               size: str, generation_time: float = None, tags: str = '',
-               category: str = 'general', visibility: str = 'private') -> int:
-        """创建新作品记录"""
-        db = get_db()
+    def ensure(db):
+        """创建流水表和快照表，首次创建时为现有用户写入期初快照"""
+        exists = db.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'credit_ledger'"
+        ).fetchone()
+
+        # 不设外键：用户删除后流水仍保留用于审计
+        db.execute('''
+            CREATE TABLE IF NOT EXISTS credit_ledger (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                delta INTEGER NOT NULL,
+                entry_type TEXT NOT NULL,
+                reference TEXT, -- 关联对象，如次数预留ID
+                actor_id INTEGER, -- 操作人（管理员充值）
+                note TEXT,
+                created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        db.execute('''
+            CREATE INDEX IF NOT EXISTS idx_credit_ledger_user
+            ON credit_ledger(user_id, id)
+        ''')
+
+        db.execute('''
+            CREATE TABLE IF NOT EXISTS credit_balance_snapshots (
+                user_id INTEGER NOT NULL,
+                ledger_id INTEGER NOT NULL, -- 快照包含的最后一条流水，0 表示期初
+                balance INTEGER NOT NULL,
+                taken_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (user_id, ledger_id)
+            ) WITHOUT ROWID
+        ''')
+
+        if not exists:
+            # 流水启用前的余额没有来源记录，以期初快照作为起点
+            db.execute('''
+                INSERT OR IGNORE INTO credit_balance_snapshots (user_id, ledger_id, balance)
+                SELECT id, 0, credits FROM users
+            ''')
+
+    @staticmethod
+    def record(db, user_id: int, delta: int, entry_type: str, reference: str = None,
+               actor_id: int = None, note: str = None) -> int:
+        """写入一条流水（不提交，由调用方与余额更新一起提交）"""
         cursor = db.execute(
-            '''INSERT INTO creations
-               (user_id, prompt, image_url, model_used, size, generation_time, tags, category, visibility)
-               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-            (user_id, prompt, image_url, model_used, size, generation_time, tags, category, visibility)
+            '''INSERT INTO credit_ledger (user_id, delta, entry_type, reference, actor_id, note)
+               VALUES (?, ?, ?, ?, ?, ?)''',
+            (user_id, delta, entry_type, reference, actor_id, note)
         )
-        db.commit()
         return cursor.lastrowid
 
     @staticmethod
-    def get_by_user(user_id: int, limit: int = 50, offset: int = 0) -> List[Dict[str, Any]]:
-        """获取用户的作品列表"""
-        db = get_db()
-        creations = db.execute(
-            '''SELECT * FROM creations
-               WHERE user_id = ?
-               ORDER BY created_at DESC
-               LIMIT ? OFFSET ?''',
-            (user_id, limit, offset)
-        ).fetchall()
-        return [dict(creation) for creation in creations]
+    def record_many(db, entries: List[tuple]):
+        """批量写入流水（不提交），entries 为 (user_id, delta, entry_type, reference, actor_id, note)"""
+        db.executemany(
+            '''INSERT INTO credit_ledger (user_id, delta, entry_type, reference, actor_id, note)
+               VALUES (?, ?, ?, ?, ?, ?)''',
+            entries
+        )
 
     @staticmethod
-    def get_by_id(creation_id: int) -> Optional[Dict[str, Any]]:
-        """根据ID获取作品"""
+    def balance_at(user_id: int, ledger_id: int = None, at: str = None) -> int:
+        """
+        计算截至某条流水（含）或某时刻的余额
+
+        Args:
+            ledger_id: 流水ID，None 表示不限
+            at: 时间（'YYYY-MM-DD HH:MM:SS'，UTC），None 表示不限
+        """
         db = get_db()
-        creation = db.execute(
-            'SELECT * FROM creations WHERE id = ?', (creation_id,)
+
+        snapshot_conditions = ['user_id = ?']
+        snapshot_params: List[Any] = [user_id]
+        ledger_conditions = ['user_id = ?', 'id > ?']
+        ledger_params: List[Any] = [user_id]
+        if ledger_id is not None:
+            snapshot_conditions.append('ledger_id <= ?')
+            snapshot_params.append(ledger_id)
+            ledger_conditions.append('id <= ?')
+        if at is not None:
+            snapshot_conditions.append('taken_at <= ?')
+            snapshot_params.append(at)
+            ledger_conditions.append('created_at <= ?')
+
+        snapshot = db.execute(
+            f'''SELECT ledger_id, balance FROM credit_balance_snapshots
+                WHERE {' AND '.join(snapshot_conditions)}
+                ORDER BY ledger_id DESC
+                LIMIT 1''',
+            snapshot_params
         ).fetchone()
-        return dict(creation) if creation else None
+        base_id = snapshot['ledger_id'] if snapshot else 0
+        balance = snapshot['balance'] if snapshot else 0
+
+        ledger_params.append(base_id)
+        if ledger_id is not None:
+            ledger_params.append(ledger_id)
+        if at is not None:
+            ledger_params.append(at)
+
+        # 只累加快照之后的流水，走 (user_id, id) 索引范围扫描
+        row = db.execute(
+            f'''SELECT COALESCE(SUM(delta), 0) AS total FROM credit_ledger
+                WHERE {' AND '.join(ledger_conditions)}''',
+            ledger_params
+        ).fetchone()
+        return balance + row['total']
 
     @staticmethod
-    def delete(creation_id: int, user_id: int) -> bool:
-        """删除作品（仅限作品所有者）"""
+    def get_history(user_id: int, limit: int = 20, before_id: int = None) -> Dict[str, Any]:
+        """
+        按流水ID倒序分页获取次数历史，每条附带变动后余额
+
+        Returns:
+            {'entries': [...], 'next_before_id': 下一页游标（没有更多时为 None）}
+        """
         db = get_db()
-        result = db.execute(
-            'DELETE FROM creations WHERE id = ? AND user_id = ?',
-            (creation_id, user_id)
-        )
+        conditions = ['user_id = ?']
+        params: List[Any] = [user_id]
+        if before_id is not None:
+            conditions.append('id < ?')
+            params.append(before_id)
+        params.append(limit)
+
+        entries = [dict(row) for row in db.execute(
+            f'''SELECT id, delta, entry_type, reference, actor_id, note, created_at
+                FROM credit_ledger
+                WHERE {' AND '.join(conditions)}
+                ORDER BY id DESC
+                LIMIT ?''',
+            params
+        ).fetchall()]
+
+        if entries:
+            # 本页第一条的余额由快照推算，其余逐条回退
+            balance = CreditLedger.balance_at(user_id, ledger_id=entries[0]['id'])
+            for entry in entries:
+                entry['balance_after'] = balance
+                balance -= entry['delta']
+
+        next_before_id = entries[-1]['id'] if len(entries) == limit else None
+        return {'entries': entries, 'next_before_id': next_before_id}
+
+    @staticmethod
+    def take_snapshots() -> int:
+        """
+        为自上次快照以来有新流水的用户写入余额快照（建议每天定时执行）
+
+        Returns:
+            写入的快照数量
+        """
+        db = get_db()
+        cursor = db.execute('''
+            INSERT INTO credit_balance_snapshots (user_id, ledger_id, balance)
+            WITH latest AS (
+                SELECT user_id, MAX(ledger_id) AS ledger_id
+                FROM credit_balance_snapshots
+                GROUP BY user_id
+            ),
+            pending AS (
+                SELECT l.user_id,
+                       MAX(l.id) AS ledger_id,
+                       SUM(l.delta) AS delta,
+                       COALESCE(latest.ledger_id, 0) AS base_id
+                FROM credit_ledger l
+                LEFT JOIN latest ON latest.user_id = l.user_id
+                WHERE l.id > COALESCE(latest.ledger_id, 0)
+                GROUP BY l.user_id
+            )
+            SELECT p.user_id, p.ledger_id, COALESCE(s.balance, 0) + p.delta
+            FROM pending p
+            LEFT JOIN credit_balance_snapshots s
+                ON s.user_id = p.user_id AND s.ledger_id = p.base_id
+        ''')
         db.commit()
-        return result.rowcount > 0
+        return cursor.rowcount
 
     @staticmethod
-    def get_by_user_with_filters(user_id: int, limit: int = 20, offset: int = 0,
-                                category: str = None, tags: str = None,
-                                search: str = None, is_favorite: bool = None) -> List[Dict[str, Any]]:
-        """获取用户的作品列表（带筛选功能）"""
+    def verify(user_id: int) -> Dict[str, Any]:
+        """核对流水推算余额与 users.credits 是否一致"""
         db = get_db()
+        user = db.execute('SELECT credits FROM users WHERE id = ?', (user_id,)).fetchone()
+        ledger_balance = CreditLedger.balance_at(user_id)
+        return {
+            'credits': user['credits'] if user else None,
+            'ledger_balance': ledger_balance,
+            'consistent': bool(user) and user['credits'] == ledger_balance
+        }
 
-        # 构建查询条件
-        conditions = ['user_id = ?']
-        params = [user_id]
 
-        if category and category != 'all':
-            conditions.append('category = ?')
-            params.append(category)
+class CreditHold:
+    """
+    生成次数预留
 
-        if tags:
-            conditions.append('tags LIKE ?')
-            params.append(f'%{tags}%')
+    生成前以一条条件 UPDATE 预扣次数并记录预留，成功后确认，失败时释放退还。
+    进程在生成过程中退出时预留保持 held 状态，过期后由后台清理线程
+    （app.services.credit_hold_sweeper）退还，次数不会丢失。
+    每个预留只能从 held 转换一次，确认 / 释放 / 过期互斥，不会重复退还。
+    """
 
-        if search:
-            # 优化：使用 FTS5 全文搜索（如果表存在）
-            try:
-                # 检查 FTS5 表是否存在
-                fts_check = db.execute(
-                    "SELECT name FROM sqlite_master WHERE type='table' AND name='creations_fts'"
-                ).fetchone()
-                
-                if fts_check:
-                    # 使用 FTS5 全文搜索（性能提升 90%+）
-                    fts_results = db.execute('''
-                        SELECT creation_id FROM creations_fts 
-                        WHERE creations_fts MATCH ? 
-                        ORDER BY rank
-                        LIMIT 1000
-                    ''', (search,)).fetchall()
-                    
-                    if fts_results:
-                        creation_ids = [r['creation_id'] for r in fts_results]
-                        placeholders = ','.join('?' * len(creation_ids))
-                        conditions.append(f'id IN ({placeholders})')
-                        params.extend(creation_ids)
-                    else:
-                        # FTS5 搜索无结果，返回空
-                        conditions.append('1 = 0')
-                else:
-                    # FTS5 表不存在，回退到 LIKE 搜索
-                    conditions.append('(prompt LIKE ? OR tags LIKE ?)')
-                    params.extend([f'%{search}%', f'%{search}%'])
-            except Exception:
-                # 如果 FTS5 查询失败，回退到 LIKE 搜索
-                conditions.append('(prompt LIKE ? OR tags LIKE ?)')
-                params.extend([f'%{search}%', f'%{search}%'])
+    # 预留有效期需覆盖 AI 服务的最长耗时（3 次尝试 × 180 秒超时）
+    DEFAULT_TTL_SECONDS = 900
 
-        if is_favorite is not None:
-            conditions.append('is_favorite = ?')
-            params.append(1 if is_favorite else 0)
+    @staticmethod
+    def ensure(db):
+        """创建预留表"""
+        db.execute('''
+            CREATE TABLE IF NOT EXISTS credit_holds (
+                id TEXT PRIMARY KEY,
+                user_id INTEGER NOT NULL,
+                amount INTEGER NOT NULL,
+                status TEXT NOT NULL DEFAULT 'held', -- 'held', 'confirmed', 'released', 'expired'
+                created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                expires_at DATETIME NOT NULL,
+                resolved_at DATETIME,
+                FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+            )
+        ''')
+        # 清理线程只扫描未结算的预留
+        db.execute('''
+            CREATE INDEX IF NOT EXISTS idx_credit_holds_expiry
+            ON credit_holds(expires_at) WHERE status = 'held'
+        ''')
 
-        where_clause = ' AND '.join(conditions)
-        params.extend([limit, offset])
+    @staticmethod
+    def place(user_id: int, amount: int = 1, ttl_seconds: int = None) -> Optional[Dict[str, Any]]:
+        """
+        预扣次数
 
-        creations = db.execute(
-            f'''SELECT * FROM creations
-                WHERE {where_clause}
-                ORDER BY created_at DESC
-                LIMIT ? OFFSET ?''',
-            params
-        ).fetchall()
+        次数检查与扣除在同一条 UPDATE 中完成，并发请求不会扣成负数。
 
-        return [dict(creation) for creation in creations]
+        Returns:
+            {'hold_id': 预留ID, 'available': 预扣后的可用次数}，次数不足或用户不存在返回 None
+        """
+        import uuid
 
-    @staticmethod
-    def get_user_stats(user_id: int) -> Dict[str, Any]:
-        """获取用户作品统计信息（优化版：减少查询次数）"""
         db = get_db()
+        ttl_seconds = ttl_seconds or CreditHold.DEFAULT_TTL_SECONDS
 
-        # 优化：使用单次查询计算 total, favorites, recent_week
-        stats = db.execute(
-            '''SELECT 
-                   COUNT(*) as total,
-                   SUM(CASE WHEN is_favorite = 1 THEN 1 ELSE 0 END) as favorites,
-                   SUM(CASE WHEN created_at >= datetime('now', '-7 days') THEN 1 ELSE 0 END) as recent_week
-               FROM creations 
-               WHERE user_id = ?''',
-            (user_id,)
+        row = db.execute(
+            '''UPDATE users SET credits = credits - ?
+               WHERE id = ? AND credits >= ?
+               RETURNING credits''',
+            (amount, user_id, amount)
         ).fetchone()
+        if not row:
+            db.rollback()
+            return None
 
-        # 按分类统计（保持独立查询，但添加用户过滤）
-        categories = db.execute(
-            '''SELECT category, COUNT(*) as count
-               FROM creations 
-               WHERE user_id = ?
-               GROUP BY category''',
-            (user_id,)
-        ).fetchall()
+        hold_id = uuid.uuid4().hex
+        db.execute(
+            '''INSERT INTO credit_holds (id, user_id, amount, expires_at)
+               VALUES (?, ?, ?, datetime('now', ?))''',
+            (hold_id, user_id, amount, f'+{int(ttl_seconds)} seconds')
+        )
+        CreditLedger.record(db, user_id, -amount, 'hold', reference=hold_id)
+        db.commit()
 
-        return {
-            'total': stats['total'] or 0,
-            'favorites': stats['favorites'] or 0,
-            'recent_week': stats['recent_week'] or 0,
-            'categories': [dict(cat) for cat in categories]
-        }
+        return {'hold_id': hold_id, 'available': row['credits']}
 
     @staticmethod
-    def update_favorite(creation_id: int, user_id: int, is_favorite: bool) -> bool:
-        """更新作品收藏状态"""
-        db = get_db()
+    def confirm(hold_id: str, db=None, commit: bool = True) -> bool:
+        """确认预留（次数正式扣除），预留已被释放或过期时返回 False"""
+        db = db or get_db()
         result = db.execute(
-            '''UPDATE creations SET is_favorite = ?, updated_at = CURRENT_TIMESTAMP
-               WHERE id = ? AND user_id = ?''',
-            (1 if is_favorite else 0, creation_id, user_id)
+            '''UPDATE credit_holds SET status = 'confirmed', resolved_at = CURRENT_TIMESTAMP
+               WHERE status = 'held' AND id = ?''',
+            (hold_id,)
         )
-        db.commit()
-        return result.rowcount > 0
+        if commit:
+            db.commit()
+
+        if result.rowcount == 0:
+            current_app.logger.warning(f"次数预留 {hold_id} 确认失败：已释放或已过期")
+            return False
+        return True
 
     @staticmethod
-    def update_tags(creation_id: int, user_id: int, tags: str) -> bool:
-        """更新作品标签"""
+    def release(hold_id: str) -> bool:
+        """释放预留并退还次数，可重复调用，只会退还一次"""
         db = get_db()
-        result = db.execute(
-            '''UPDATE creations SET tags = ?, updated_at = CURRENT_TIMESTAMP
-               WHERE id = ? AND user_id = ?''',
-            (tags, creation_id, user_id)
-        )
+        hold = db.execute(
+            '''UPDATE credit_holds SET status = 'released', resolved_at = CURRENT_TIMESTAMP
+               WHERE status = 'held' AND id = ?
+               RETURNING user_id, amount''',
+            (hold_id,)
+        ).fetchone()
+
+        if hold:
+            db.execute(
+                'UPDATE users SET credits = credits + ? WHERE id = ?',
+                (hold['amount'], hold['user_id'])
+            )
+            CreditLedger.record(db, hold['user_id'], hold['amount'], 'hold_release', reference=hold_id)
         db.commit()
-        return result.rowcount > 0
+        return hold is not None
+
+    @staticmethod
+    def expire_stale(db=None) -> int:
+        """
+        过期超时未结算的预留并退还次数
+
+        Returns:
+            过期的预留数量
+        """
+        db = db or get_db()
+        holds = db.execute(
+            '''UPDATE credit_holds SET status = 'expired', resolved_at = CURRENT_TIMESTAMP
+               WHERE status = 'held' AND expires_at < CURRENT_TIMESTAMP
+               RETURNING id, user_id, amount'''
+        ).fetchall()
+
+        refunds: Dict[int, int] = {}
+        for hold in holds:
+            refunds[hold['user_id']] = refunds.get(hold['user_id'], 0) + hold['amount']
+
+        if refunds:
+            db.executemany(
+                'UPDATE users SET credits = credits + ? WHERE id = ?',
+                [(amount, user_id) for user_id, amount in refunds.items()]
+            )
+            for hold in holds:
+                CreditLedger.record(db, hold['user_id'], hold['amount'], 'hold_expire', reference=hold['id'])
+        db.commit()
+        return len(holds)
+
+
+class Creation:
+    """作品模型"""
+
+    # 列表接口可投影的列（fields 参数白名单，顺序即默认输出顺序）
+    LIST_COLUMNS = ('id', 'user_id', 'prompt', 'image_url', 'model_used', 'size', 'generation_time',
+                    'is_favorite', 'tags', 'category', 'visibility', 'created_at', 'updated_at')
+    # 精简模式默认列：省去列表中不展示的列
+    COMPACT_COLUMNS = ('id', 'prompt', 'image_url', 'model_used', 'size', 'is_favorite',
+                       'tags', 'category', 'created_at')
+    # 精简模式下提示词保留的字符数
+    PROMPT_PREVIEW_CHARS = 100
+
+    @staticmethod
+    def list_columns(fields: str = None, compact: bool = False, alias: str = 'c') -> str:
+        """
+        生成列表查询的列清单（替代 SELECT *）
+
+        Args:
+            fields: 逗号分隔的列名，须在 LIST_COLUMNS 内；id 始终返回（翻页和游标需要）
+            compact: 精简模式，未指定 fields 时使用 COMPACT_COLUMNS，
+                     提示词截断为 PROMPT_PREVIEW_CHARS 个字符并附带 prompt_truncated 标记
+
+        Raises:
+            ValueError: fields 包含不支持的列
+        """
+        if fields:
+            requested = [name.strip() for name in fields.split(',') if name.strip()]
+            unknown = [name for name in requested if name not in Creation.LIST_COLUMNS]
+            if unknown:
+                raise ValueError(f"不支持的字段: {', '.join(unknown)}")
+            columns = [name for name in Creation.LIST_COLUMNS if name == 'id' or name in requested]
+        else:
+            columns = Creation.COMPACT_COLUMNS if compact else Creation.LIST_COLUMNS
+
+        select = []
+        for name in columns:
+            if compact and name == 'prompt':
+                # substr 按字符截取，不会截断 UTF-8 多字节字符
+                limit = Creation.PROMPT_PREVIEW_CHARS
+                select.append(f'substr({alias}.prompt, 1, {limit}) AS prompt')
+                select.append(f'length({alias}.prompt) > {limit} AS prompt_truncated')
+            else:
+                select.append(f'{alias}.{name}')
+        return ', '.join(select)
+
+    @staticmethod
+    def create(user_id: int, prompt: str, image_url: str, model_used: str,
+               size: str, generation_time: float = None, tags: str = '',
+               category: str = 'general', visibility: str = 'private') -> int:
+        """创建新作品记录"""
+        db = get_db()
+        cursor = db.execute(
+            '''INSERT INTO creations
+               (user_id, prompt, image_url, model_used, size, generation_time, tags, category, visibility)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+            (user_id, prompt, image_url, model_used, size, generation_time, tags, category, visibility)
+        )
+        CreationTag.sync(db, cursor.lastrowid, user_id, tags)
+        db.commit()
+        return cursor.lastrowid
+
+    @staticmethod
+    def create_many(user_id: int, prompt: str, image_urls: List[str], model_used: str,
+                    size: str, generation_time: float = None, tags: str = '',
+                    category: str = 'general', visibility: str = 'private',
+                    hold_id: str = None) -> Dict[str, Any]:
+        """
+        批量创建同一次生成的多张作品（一个事务、一条 INSERT ... RETURNING）
+
+        传入 hold_id 时在同一事务内确认次数预留（见 CreditHold）；没有图片时释放预留，
+        不扣次数。任一步骤失败时回滚整个事务（作品和确认都不落库）后抛出异常，
+        调用方随后释放预留即可退还次数。
+
+        Returns:
+            {'creations': 完整作品行列表（按 id 升序）, 'remaining_credits': 用户剩余次数}
+        """
+        if not image_urls:
+            if hold_id:
+                CreditHold.release(hold_id)
+            return {'creations': [], 'remaining_credits': None}
+
+        db = get_db()
+        placeholders = ', '.join(['(?, ?, ?, ?, ?, ?, ?, ?, ?)'] * len(image_urls))
+        params = []
+        for image_url in image_urls:
+            params.extend([user_id, prompt, image_url, model_used, size,
+                           generation_time, tags, category, visibility])
+        params.append(user_id)
+
+        try:
+            # 剩余次数以子查询随 RETURNING 一并返回，省去额外的 User.get_by_id
+            rows = db.execute(
+                f'''INSERT INTO creations
+                    (user_id, prompt, image_url, model_used, size, generation_time, tags, category, visibility)
+                    VALUES {placeholders}
+                    RETURNING *, (SELECT credits FROM users WHERE id = ?) AS remaining_credits''',
+                params
+            ).fetchall()
+
+            creations = sorted((dict(row) for row in rows), key=lambda row: row['id'])
+            remaining_credits = creations[0].pop('remaining_credits')
+            for creation in creations[1:]:
+                creation.pop('remaining_credits')
+
+            if tags:
+                for creation in creations:
+                    CreationTag.sync(db, creation['id'], user_id, tags)
+
+            if hold_id:
+                CreditHold.confirm(hold_id, db=db, commit=False)
+
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        return {'creations': creations, 'remaining_credits': remaining_credits}
+
+    @staticmethod
+    def get_by_user(user_id: int, limit: int = 50, offset: int = 0,
+                    fields: str = None, compact: bool = False) -> List[sqlite3.Row]:
+        """获取用户的作品列表（fields / compact 见 list_columns）"""
+        db = get_db()
+        return db.execute(
+            f'''SELECT {Creation.list_columns(fields, compact)} FROM creations c
+                WHERE c.user_id = ?
+                ORDER BY c.created_at DESC
+                LIMIT ? OFFSET ?''',
+            (user_id, limit, offset)
+        ).fetchall()
+
+    @staticmethod
+    def iter_for_export(user_id: int, batch_size: int = 200):
+        """
+        按创建时间倒序分批读取用户全部作品
+
+        以 (created_at, id) 做 keyset 分页，每批沿 (user_id, created_at) 索引继续读取，
+        内存占用与作品数无关。
+        """
+        db = get_db()
+        columns = 'id, prompt, image_url, model_used, size, tags, category, is_favorite, created_at'
+        rows = db.execute(
+            f'''SELECT {columns} FROM creations
+                WHERE user_id = ?
+                ORDER BY created_at DESC, id DESC
+                LIMIT ?''',
+            (user_id, batch_size)
+        ).fetchall()
+        while rows:
+            yield from rows
+            if len(rows) < batch_size:
+                return
+            last = rows[-1]
+            rows = db.execute(
+                f'''SELECT {columns} FROM creations
+                    WHERE user_id = ? AND (created_at < ? OR (created_at = ? AND id < ?))
+                    ORDER BY created_at DESC, id DESC
+                    LIMIT ?''',
+                (user_id, last['created_at'], last['created_at'], last['id'], batch_size)
+            ).fetchall()
+
+    @staticmethod
+    def get_by_id(creation_id: int) -> Optional[Dict[str, Any]]:
+        """根据ID获取作品"""
+        db = get_db()
+        creation = db.execute(
+            'SELECT * FROM creations WHERE id = ?', (creation_id,)
+        ).fetchone()
+        return dict(creation) if creation else None
+
+    @staticmethod
+    def delete(creation_id: int, user_id: int) -> bool:
+        """删除作品（仅限作品所有者）"""
+        db = get_db()
+        result = db.execute(
+            'DELETE FROM creations WHERE id = ? AND user_id = ?',
+            (creation_id, user_id)
+        )
+        db.commit()
+        return result.rowcount > 0
+
+    @staticmethod
+    def get_by_user_with_filters(user_id: int, limit: int = 20, offset: int = 0,
+                                category: str = None, tags: str = None,
+                                search: str = None, is_favorite: bool = None,
+                                cursor: str = None, search_mode: str = 'auto',
+                                fields: str = None, compact: bool = False) -> List[sqlite3.Row]:
+        """
+        获取用户的作品列表（带筛选功能）
+
+        带 search 时优先走 FTS5 索引：在 SQLite 内按 user_id 过滤、按 BM25 排序，
+        结果行附带 search_rank，可配合 cursor 做 keyset 分页（见 CreationSearchIndex.make_cursor）。
+        search_mode 见 CreationSearchIndex.SEARCH_MODES，中文输入默认走 trigram 子串搜索。
+
+        只查询 fields 指定的列（见 list_columns），直接返回 sqlite3.Row，
+        由 JSON provider 序列化，不再逐行复制为 dict。
+        """
+        db = get_db()
+        columns = Creation.list_columns(fields, compact)
+
+        # 构建查询条件
+        conditions = ['c.user_id = ?']
+        params = [user_id]
+
+        if category and category != 'all':
+            conditions.append('c.category = ?')
+            params.append(category)
+
+        if tags:
+            if CreationTag.is_ready():
+                # 多个标签用逗号分隔，须同时命中；经 (user_id, tag) 索引只读取命中的作品
+                for tag in CreationTag.normalize(tags):
+                    conditions.append(
+                        'c.id IN (SELECT creation_id FROM creation_tags WHERE user_id = ? AND tag = ?)'
+                    )
+                    params.extend([user_id, tag])
+            else:
+                # 标签表尚未回填完成，回退到 LIKE
+                conditions.append('c.tags LIKE ?')
+                params.append(f'%{tags}%')
+
+        if is_favorite is not None:
+            conditions.append('c.is_favorite = ?')
+            params.append(1 if is_favorite else 0)
+
+        if search:
+            mode = CreationSearchIndex.resolve_mode(search, search_mode)
+            table = (CreationSearchIndex.TRIGRAM_INDEX if mode == 'substring'
+                     else CreationSearchIndex.WORD_INDEX)
+
+            if CreationSearchIndex.is_available(table):
+                if mode == 'substring':
+                    # 不足 3 个字符的词 trigram 无法命中，在已按用户过滤的结果上用 LIKE 补充
+                    for term in CreationSearchIndex.short_terms(search):
+                        conditions.append('(c.prompt LIKE ? OR c.tags LIKE ?)')
+                        params.extend([f'%{term}%', f'%{term}%'])
+
+                match_query = CreationSearchIndex.build_match_query(search, mode)
+                if match_query:
+                    return CreationSearchIndex.search(
+                        db, user_id, match_query, conditions, params, limit, offset, cursor, table,
+                        columns=columns
+                    )
+                if mode == 'prefix':
+                    return []
+            else:
+                # 对应索引不可用，回退到 LIKE 搜索
+                conditions.append('(c.prompt LIKE ? OR c.tags LIKE ?)')
+                params.extend([f'%{search}%', f'%{search}%'])
+
+        where_clause = ' AND '.join(conditions)
+        params.extend([limit, offset])
+
+        return db.execute(
+            f'''SELECT {columns} FROM creations c
+                WHERE {where_clause}
+                ORDER BY c.created_at DESC
+                LIMIT ? OFFSET ?''',
+            params
+        ).fetchall()
+
+    @staticmethod
+    def get_user_stats(user_id: int) -> Dict[str, Any]:
+        """获取用户作品统计信息（读取物化统计，见 UserGalleryStats）"""
+        return UserGalleryStats.get(user_id)
+
+    @staticmethod
+    def update_favorite(creation_id: int, user_id: int, is_favorite: bool) -> bool:
+        """更新作品收藏状态"""
+        db = get_db()
+        result = db.execute(
+            '''UPDATE creations SET is_favorite = ?, updated_at = CURRENT_TIMESTAMP
+               WHERE id = ? AND user_id = ?''',
+            (1 if is_favorite else 0, creation_id, user_id)
+        )
+        db.commit()
+        return result.rowcount > 0
+
+    @staticmethod
+    def update_tags(creation_id: int, user_id: int, tags: str) -> bool:
+        """更新作品标签"""
+        db = get_db()
+        result = db.execute(
+            '''UPDATE creations SET tags = ?, updated_at = CURRENT_TIMESTAMP
+               WHERE id = ? AND user_id = ?''',
+            (tags, creation_id, user_id)
+        )
+        if result.rowcount > 0:
+            CreationTag.sync(db, creation_id, user_id, tags)
+        db.commit()
+        return result.rowcount > 0
 
     @staticmethod
     def update_category(creation_id: int, user_id: int, category: str) -> bool:
@@ -741,6 +1536,88 @@ class Creation:
         db.commit()
         return result.rowcount > 0
 
+    # 批量操作：单次请求最多包含的操作数
+    MAX_BATCH_OPERATIONS = 200
+    BATCH_ACTIONS = ('favorite', 'tags', 'category', 'delete')
+
+    @staticmethod
+    def apply_batch(user_id: int, operations: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        批量修改用户作品（画廊多选操作），一个事务、一次提交
+
+        Args:
+            operations: [{'id': 作品ID, 'action': 'favorite'|'tags'|'category'|'delete',
+                          'is_favorite' / 'tags' / 'category': 对应取值}, ...]，由调用方校验格式
+
+        同类操作合并为一次 executemany，按 favorite、category、tags、delete 的顺序执行
+        （同一作品既修改又删除时以删除为准）。所有权在写锁内检查，
+        不属于该用户或不存在的作品不做修改。
+
+        Returns:
+            与 operations 顺序一致的结果列表 [{'id', 'action', 'success', 'error'?}]
+        """
+        db = get_db()
+        ids = {op['id'] for op in operations}
+
+        if not db.in_transaction:
+            # 先取得写锁，所有权检查与后续写入之间不会有其他写入
+            db.execute('BEGIN IMMEDIATE')
+        try:
+            owned = set()
+            id_list = list(ids)
+            for start in range(0, len(id_list), 500):
+                chunk = id_list[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                owned.update(row['id'] for row in db.execute(
+                    f'SELECT id FROM creations WHERE user_id = ? AND id IN ({placeholders})',
+                    [user_id] + chunk
+                ))
+
+            grouped = {action: [] for action in Creation.BATCH_ACTIONS}
+            for op in operations:
+                if op['id'] in owned:
+                    grouped[op['action']].append(op)
+
+            if grouped['favorite']:
+                db.executemany(
+                    '''UPDATE creations SET is_favorite = ?, updated_at = CURRENT_TIMESTAMP
+                       WHERE id = ? AND user_id = ?''',
+                    [(1 if op['is_favorite'] else 0, op['id'], user_id) for op in grouped['favorite']]
+                )
+            if grouped['category']:
+                db.executemany(
+                    '''UPDATE creations SET category = ?, updated_at = CURRENT_TIMESTAMP
+                       WHERE id = ? AND user_id = ?''',
+                    [(op['category'], op['id'], user_id) for op in grouped['category']]
+                )
+            if grouped['tags']:
+                db.executemany(
+                    '''UPDATE creations SET tags = ?, updated_at = CURRENT_TIMESTAMP
+                       WHERE id = ? AND user_id = ?''',
+                    [(op['tags'], op['id'], user_id) for op in grouped['tags']]
+                )
+                for op in grouped['tags']:
+                    CreationTag.sync(db, op['id'], user_id, op['tags'])
+            if grouped['delete']:
+                db.executemany(
+                    'DELETE FROM creations WHERE id = ? AND user_id = ?',
+                    [(op['id'], user_id) for op in grouped['delete']]
+                )
+
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+        results = []
+        for op in operations:
+            if op['id'] in owned:
+                results.append({'id': op['id'], 'action': op['action'], 'success': True})
+            else:
+                results.append({'id': op['id'], 'action': op['action'], 'success': False,
+                                'error': '作品不存在或无权修改'})
+        return results
+
     @staticmethod
     def get_available_categories(user_id: int) -> List[str]:
         """获取用户使用过的所有分类"""
@@ -756,8 +1633,11 @@ class Creation:
     @staticmethod
     def get_popular_tags(user_id: int, limit: int = 20) -> List[str]:
         """获取用户常用标签"""
+        if CreationTag.is_ready():
+            return CreationTag.get_popular(user_id, limit)
+
         db = get_db()
-        # 简单的标签统计，假设标签用逗号分隔
+        # 标签表尚未回填完成：简单的标签统计，假设标签用逗号分隔
         creations = db.execute(
             'SELECT tags FROM creations WHERE user_id = ? AND tags IS NOT NULL AND tags != ""',
             (user_id,)
@@ -776,6 +1656,696 @@ class Creation:
         return [tag for tag, count in sorted_tags[:limit]]
 
 
+class CreationTag:
+    """
+    作品标签索引
+
+    creation_tags 保存 (作品, 标签) 对，user_tag_counts 保存每个用户各标签的作品数，
+    计数由 creation_tags 上的触发器维护，与标签写入处于同一事务。
+    creations.tags 仍保留原始逗号分隔字符串，供展示和全文搜索使用。
+    """
+
+    BACKFILL_SETTING_KEY = 'creation_tags_backfill'
+    BACKFILL_DONE = 'done'
+    BACKFILL_BATCH_SIZE = 500
+    MAX_TAG_LENGTH = 50
+
+    # 回填完成后进程内缓存，避免每次请求都查询 system_settings
+    _ready: bool = False
+
+    @staticmethod
+    def ensure(db):
+        """创建标签表、索引和维护计数的触发器"""
+        db.execute('''
+            CREATE TABLE IF NOT EXISTS creation_tags (
+                creation_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                tag TEXT NOT NULL COLLATE NOCASE,
+                PRIMARY KEY (creation_id, tag),
+                FOREIGN KEY (creation_id) REFERENCES creations (id) ON DELETE CASCADE
+            ) WITHOUT ROWID
+        ''')
+        db.execute('''
+            CREATE INDEX IF NOT EXISTS idx_creation_tags_user_tag
+            ON creation_tags(user_id, tag, creation_id)
+        ''')
+
+        db.execute('''
+            CREATE TABLE IF NOT EXISTS user_tag_counts (
+                user_id INTEGER NOT NULL,
+                tag TEXT NOT NULL COLLATE NOCASE,
+                count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (user_id, tag)
+            ) WITHOUT ROWID
+        ''')
+        db.execute('''
+            CREATE INDEX IF NOT EXISTS idx_user_tag_counts_popular
+            ON user_tag_counts(user_id, count DESC)
+        ''')
+
+        db.execute('''
+            CREATE TRIGGER IF NOT EXISTS creation_tags_count_insert
+            AFTER INSERT ON creation_tags
+            BEGIN
+                INSERT INTO user_tag_counts (user_id, tag, count)
+                VALUES (new.user_id, new.tag, 1)
+                ON CONFLICT(user_id, tag) DO UPDATE SET count = count + 1;
+            END
+        ''')
+        db.execute('''
+            CREATE TRIGGER IF NOT EXISTS creation_tags_count_delete
+            AFTER DELETE ON creation_tags
+            BEGIN
+                UPDATE user_tag_counts SET count = count - 1
+                WHERE user_id = old.user_id AND tag = old.tag;
+                DELETE FROM user_tag_counts
+                WHERE user_id = old.user_id AND tag = old.tag AND count <= 0;
+            END
+        ''')
+
+        # 作品删除或转移所有者时清理标签（外键级联依赖 PRAGMA foreign_keys，触发器不依赖）
+        db.execute('''
+            CREATE TRIGGER IF NOT EXISTS creations_tags_delete
+            AFTER DELETE ON creations
+            BEGIN
+                DELETE FROM creation_tags WHERE creation_id = old.id;
+            END
+        ''')
+        db.execute('''
+            CREATE TRIGGER IF NOT EXISTS creations_tags_owner_update
+            AFTER UPDATE OF user_id ON creations
+            WHEN old.user_id IS NOT new.user_id
+            BEGIN
+                DELETE FROM creation_tags WHERE creation_id = old.id;
+            END
+        ''')
+
+        # 新库无需回填，直接标记完成
+        has_state = db.execute(
+            'SELECT 1 FROM system_settings WHERE key = ?', (CreationTag.BACKFILL_SETTING_KEY,)
+        ).fetchone()
+        if not has_state and not db.execute('SELECT 1 FROM creations LIMIT 1').fetchone():
+            CreationTag._save_backfill_state(db, CreationTag.BACKFILL_DONE)
+
+    @staticmethod
+    def normalize(tags: str) -> List[str]:
+        """拆分逗号分隔的标签字符串：去除空白、忽略大小写去重、截断过长标签"""
+        result = []
+        seen = set()
+        for tag in (tags or '').replace('，', ',').split(','):
+            tag = tag.strip()[:CreationTag.MAX_TAG_LENGTH]
+            if tag and tag.casefold() not in seen:
+                seen.add(tag.casefold())
+                result.append(tag)
+        return result
+
+    @staticmethod
+    def sync(db, creation_id: int, user_id: int, tags: str):
+        """
+        按 creations.tags 重写作品的标签行（不提交，由调用方与作品写入一起提交）
+
+        只删除 / 插入有变化的标签，计数触发器随之增减。
+        """
+        wanted = {tag.casefold(): tag for tag in CreationTag.normalize(tags)}
+        existing = {
+            row['tag'].casefold(): row['tag']
+            for row in db.execute(
+                'SELECT tag FROM creation_tags WHERE creation_id = ?', (creation_id,)
+            ).fetchall()
+        }
+
+        removed = [existing[key] for key in existing.keys() - wanted.keys()]
+        added = [wanted[key] for key in wanted.keys() - existing.keys()]
+
+        if removed:
+            db.executemany(
+                'DELETE FROM creation_tags WHERE creation_id = ? AND tag = ?',
+                [(creation_id, tag) for tag in removed]
+            )
+        if added:
+            db.executemany(
+                'INSERT INTO creation_tags (creation_id, user_id, tag) VALUES (?, ?, ?)',
+                [(creation_id, user_id, tag) for tag in added]
+            )
+
+    @staticmethod
+    def get_popular(user_id: int, limit: int = 20) -> List[str]:
+        """按作品数读取用户常用标签"""
+        db = get_db()
+        rows = db.execute(
+            '''SELECT tag FROM user_tag_counts
+               WHERE user_id = ? AND count > 0
+               ORDER BY count DESC, tag
+               LIMIT ?''',
+            (user_id, limit)
+        ).fetchall()
+        return [row['tag'] for row in rows]
+
+    @staticmethod
+    def is_ready() -> bool:
+        """历史数据是否已回填完成（未完成时标签筛选和标签云回退到旧逻辑）"""
+        if CreationTag._ready:
+            return True
+
+        db = get_db()
+        state = db.execute(
+            'SELECT value FROM system_settings WHERE key = ?', (CreationTag.BACKFILL_SETTING_KEY,)
+        ).fetchone()
+        CreationTag._ready = bool(state) and state['value'] == CreationTag.BACKFILL_DONE
+        return CreationTag._ready
+
+    @staticmethod
+    def backfill(batch_size: int = None, max_batches: int = None) -> Dict[str, Any]:
+        """
+        在线分批回填历史作品的标签
+
+        每批按 id 顺序处理 batch_size 条作品并单独提交，进度写入 system_settings，
+        中断后可从上次位置继续。回填期间新写入的作品由 create / update_tags 同步，
+        sync 是幂等的，重复处理不会导致计数错误。
+
+        Returns:
+            {'processed': 本次处理作品数, 'last_id': 进度位置, 'done': 是否完成}
+        """
+        db = get_db()
+        batch_size = batch_size or CreationTag.BACKFILL_BATCH_SIZE
+
+        state = db.execute(
+            'SELECT value FROM system_settings WHERE key = ?', (CreationTag.BACKFILL_SETTING_KEY,)
+        ).fetchone()
+        if state and state['value'] == CreationTag.BACKFILL_DONE:
+            return {'processed': 0, 'last_id': None, 'done': True}
+
+        last_id = int(state['value']) if state else 0
+        processed = 0
+        batches = 0
+
+        while max_batches is None or batches < max_batches:
+            rows = db.execute(
+                '''SELECT id, user_id, tags FROM creations
+                   WHERE id > ?
+                   ORDER BY id
+                   LIMIT ?''',
+                (last_id, batch_size)
+            ).fetchall()
+
+            for row in rows:
+                CreationTag.sync(db, row['id'], row['user_id'], row['tags'])
+
+            if rows:
+                last_id = rows[-1]['id']
+                processed += len(rows)
+
+            done = len(rows) < batch_size
+            CreationTag._save_backfill_state(db, CreationTag.BACKFILL_DONE if done else str(last_id))
+            db.commit()
+            batches += 1
+
+            if done:
+                CreationTag._ready = True
+                return {'processed': processed, 'last_id': last_id, 'done': True}
+
+        return {'processed': processed, 'last_id': last_id, 'done': False}
+
+    @staticmethod
+    def _save_backfill_state(db, value: str):
+        db.execute(
+            '''INSERT INTO system_settings (key, value, description, updated_at)
+               VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+               ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated_at = CURRENT_TIMESTAMP''',
+            (CreationTag.BACKFILL_SETTING_KEY, value, '作品标签表回填进度')
+        )
+
+
+class UserGalleryStats:
+    """
+    用户画廊物化统计
+
+    user_gallery_stats 按 (user_id, dimension, key) 聚簇存储计数：
+    - ('total', '') / ('favorites', ''): 作品总数、收藏数
+    - ('category', 分类名): 各分类作品数
+    - ('day', 'YYYY-MM-DD'): 按创建日期分桶的作品数，用于近 7 天统计
+
+    creations 上的触发器在插入、删除、收藏 / 分类 / 所有者变更时增量维护计数，
+    读取只需一次按 user_id 的范围扫描。reconcile 从 creations 重新汇总以修正漂移，
+    并清理过期的日期桶，由 flask reconcile-gallery-stats 定期执行。
+    """
+
+    RECENT_DAYS = 7
+
+    # 触发器中以 {row} 代替 new / old，{sign} 代替 +1 / -1
+    _APPLY_SQL = '''
+        INSERT INTO user_gallery_stats (user_id, dimension, key, count)
+        VALUES
+            ({row}.user_id, 'total', '', {sign}),
+            ({row}.user_id, 'favorites', '', CASE WHEN {row}.is_favorite THEN {sign} ELSE 0 END),
+            ({row}.user_id, 'category', COALESCE({row}.category, 'general'), {sign}),
+            ({row}.user_id, 'day', date({row}.created_at), {sign})
+        ON CONFLICT(user_id, dimension, key) DO UPDATE SET count = count + excluded.count;
+        DELETE FROM user_gallery_stats
+        WHERE user_id = {row}.user_id AND dimension IN ('category', 'day') AND count <= 0;
+    '''
+
+    @staticmethod
+    def ensure(db):
+        """创建统计表和维护触发器，首次创建时从现有作品汇总"""
+        exists = db.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'user_gallery_stats'"
+        ).fetchone()
+
+        db.execute('''
+            CREATE TABLE IF NOT EXISTS user_gallery_stats (
+                user_id INTEGER NOT NULL,
+                dimension TEXT NOT NULL,
+                key TEXT NOT NULL,
+                count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (user_id, dimension, key)
+            ) WITHOUT ROWID
+        ''')
+
+        add_new = UserGalleryStats._APPLY_SQL.format(row='new', sign='1')
+        remove_old = UserGalleryStats._APPLY_SQL.format(row='old', sign='-1')
+
+        db.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS creations_stats_insert
+            AFTER INSERT ON creations
+            BEGIN
+                {add_new}
+            END
+        ''')
+        db.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS creations_stats_delete
+            AFTER DELETE ON creations
+            WHEN old.user_id IS NOT NULL
+            BEGIN
+                {remove_old}
+            END
+        ''')
+        # 更新拆成先减旧值、再加新值两个触发器，所有者置空（孤儿作品）时只执行一侧
+        db.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS creations_stats_update_old
+            AFTER UPDATE OF is_favorite, category, user_id ON creations
+            WHEN old.user_id IS NOT NULL
+            BEGIN
+                {remove_old}
+            END
+        ''')
+        db.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS creations_stats_update_new
+            AFTER UPDATE OF is_favorite, category, user_id ON creations
+            WHEN new.user_id IS NOT NULL
+            BEGIN
+                {add_new}
+            END
+        ''')
+
+        if not exists:
+            UserGalleryStats.reconcile(db=db, commit=False)
+
+    @staticmethod
+    def get(user_id: int) -> Dict[str, Any]:
+        """读取用户统计，返回结构与原 Creation.get_user_stats 一致"""
+        db = get_db()
+        rows = db.execute(
+            'SELECT dimension, key, count FROM user_gallery_stats WHERE user_id = ?',
+            (user_id,)
+        ).fetchall()
+
+        recent_since = db.execute(
+            "SELECT date('now', ?) AS since", (f'-{UserGalleryStats.RECENT_DAYS - 1} days',)
+        ).fetchone()['since']
+
+        stats = {'total': 0, 'favorites': 0, 'recent_week': 0, 'categories': []}
+        for row in rows:
+            dimension = row['dimension']
+            if dimension in ('total', 'favorites'):
+                stats[dimension] = row['count']
+            elif dimension == 'category':
+                stats['categories'].append({'category': row['key'], 'count': row['count']})
+            elif dimension == 'day' and row['key'] >= recent_since:
+                stats['recent_week'] += row['count']
+
+        return stats
+
+    @staticmethod
+    def reconcile(user_id: int = None, db=None, commit: bool = True) -> int:
+        """
+        从 creations 重新汇总统计（修正漂移），并清理近 7 天以外的日期桶
+
+        Args:
+            user_id: 只汇总指定用户，None 表示全部用户
+
+        Returns:
+            写入的统计行数
+        """
+        db = db or get_db()
+        scope = 'WHERE user_id = ?' if user_id is not None else 'WHERE user_id IS NOT NULL'
+        params = (user_id,) if user_id is not None else ()
+
+        db.execute(f'DELETE FROM user_gallery_stats {scope}', params)
+        cursor = db.execute(
+            f'''INSERT INTO user_gallery_stats (user_id, dimension, key, count)
+                SELECT user_id, 'total', '', COUNT(*) FROM creations {scope} GROUP BY user_id
+                UNION ALL
+                SELECT user_id, 'favorites', '', SUM(CASE WHEN is_favorite THEN 1 ELSE 0 END)
+                FROM creations {scope} GROUP BY user_id
+                UNION ALL
+                SELECT user_id, 'category', COALESCE(category, 'general'), COUNT(*)
+                FROM creations {scope} GROUP BY user_id, COALESCE(category, 'general')
+                UNION ALL
+                SELECT user_id, 'day', date(created_at), COUNT(*)
+                FROM creations {scope} AND created_at >= date('now', ?)
+                GROUP BY user_id, date(created_at)''',
+            params * 4 + (f'-{UserGalleryStats.RECENT_DAYS} days',)
+        )
+
+        if commit:
+            db.commit()
+        return cursor.rowcount
+
+
+class UserDataVersion:
+    """
+    用户数据版本号
+
+    作品插入、删除、更新（收藏、标签、分类、所有者等）以及 users 行的任何更新
+    （次数、资料、登录信息）都由触发器递增对应用户的版本号，覆盖所有写入路径。
+    用户级 GET 接口以版本号生成弱 ETag（见 app.middleware.conditional），
+    版本未变时直接返回 304，不执行查询。
+    """
+
+    # 触发器中以 {user_id} 代替 new.user_id / old.user_id / new.id
+    _BUMP_SQL = '''
+        INSERT INTO user_data_versions (user_id, version)
+        SELECT {user_id}, 1 WHERE {user_id} IS NOT NULL
+        ON CONFLICT(user_id) DO UPDATE SET version = version + 1;
+    '''
+
+    # 作品更新：原所有者递增；所有者变更时新所有者也递增
+    _UPDATE_CREATION_SQL = '''
+        INSERT INTO user_data_versions (user_id, version)
+        SELECT old.user_id, 1 WHERE old.user_id IS NOT NULL
+        ON CONFLICT(user_id) DO UPDATE SET version = version + 1;
+        INSERT INTO user_data_versions (user_id, version)
+        SELECT new.user_id, 1 WHERE new.user_id IS NOT NULL AND new.user_id IS NOT old.user_id
+        ON CONFLICT(user_id) DO UPDATE SET version = version + 1;
+    '''
+
+    @staticmethod
+    def ensure(db):
+        """创建版本表和维护触发器"""
+        db.execute('''
+            CREATE TABLE IF NOT EXISTS user_data_versions (
+                user_id INTEGER PRIMARY KEY,
+                version INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+
+        bump = UserDataVersion._BUMP_SQL
+        triggers = {
+            'creations_user_version_insert': ('AFTER INSERT ON creations', bump.format(user_id='new.user_id')),
+            'creations_user_version_delete': ('AFTER DELETE ON creations', bump.format(user_id='old.user_id')),
+            'creations_user_version_update': ('AFTER UPDATE ON creations', UserDataVersion._UPDATE_CREATION_SQL),
+            'users_user_version_update': ('AFTER UPDATE ON users', bump.format(user_id='new.id')),
+        }
+        for name, (event, body) in triggers.items():
+            db.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {name}
+                {event}
+                BEGIN
+                    {body}
+                END
+            ''')
+
+    @staticmethod
+    def get(user_id: int) -> int:
+        """读取用户数据版本（主键查询，没有记录时为 0）"""
+        db = get_db()
+        row = db.execute(
+            'SELECT version FROM user_data_versions WHERE user_id = ?', (user_id,)
+        ).fetchone()
+        return row['version'] if row else 0
+
+
+class CreationSearchIndex:
+    """
+    作品全文搜索索引
+
+    两张以 creations_search_source 视图为外部内容表的 FTS5 索引（rowid = creations.id），
+    不重复存储正文：
+    - creations_fts: unicode61 分词，适合英文按词 / 前缀搜索
+    - creations_fts_trigram: trigram 分词，支持任意语言的子串搜索（中文提示词）
+
+    owner 列索引形如 "<42>" 的作者标记，查询时与搜索词求交集，
+    匹配成本只与该用户的作品量相关，不随平台总作品量增长。
+
+    触发器只在 INSERT / DELETE / UPDATE OF prompt, tags, user_id 时同步，
+    收藏、分类等字段的更新不会触碰索引。
+    """
+
+    WORD_INDEX = 'creations_fts'
+    TRIGRAM_INDEX = 'creations_fts_trigram'
+    SOURCE_VIEW = 'creations_search_source'
+    COLUMNS = ['prompt', 'tags', 'owner']
+
+    # 索引表名 -> FTS5 分词器选项
+    INDEXES = {
+        WORD_INDEX: '',
+        TRIGRAM_INDEX: ", tokenize='trigram'",
+    }
+
+    # trigram 分词下 MATCH 能命中的最短子串长度
+    TRIGRAM_MIN_LENGTH = 3
+
+    # BM25 列权重：prompt 命中比 tags 命中更相关，owner 不参与相关度
+    BM25_WEIGHTS = (1.0, 0.5, 0.0)
+
+    # optimize 时每步合并的页数，步与步之间提交事务以释放写锁
+    MERGE_PAGES = 500
+
+    # 搜索模式：auto 按输入自动选择，prefix 按词前缀，substring 按子串
+    SEARCH_MODES = ('auto', 'prefix', 'substring')
+
+    # 中日韩字符（含假名、谚文），unicode61 无法对其分词
+    CJK_PATTERN = re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]')
+
+    # 进程内缓存各索引是否可用，避免每次搜索查询 sqlite_master
+    _available: Dict[str, bool] = {}
+
+    @staticmethod
+    def ensure(db) -> bool:
+        """创建索引表和触发器，列结构不同的旧版索引会被替换并重建"""
+        db.execute(f'''
+            CREATE VIEW IF NOT EXISTS {CreationSearchIndex.SOURCE_VIEW} AS
+            SELECT id, prompt, COALESCE(tags, '') AS tags, '<' || user_id || '>' AS owner
+            FROM creations
+        ''')
+
+        for table, tokenize in CreationSearchIndex.INDEXES.items():
+            try:
+                CreationSearchIndex._ensure_index(db, table, tokenize)
+                CreationSearchIndex._available[table] = True
+            except sqlite3.OperationalError:
+                # SQLite 未编译 FTS5（或版本过低不支持 trigram），对应模式回退到 LIKE
+                CreationSearchIndex._available[table] = False
+
+        return CreationSearchIndex._available[CreationSearchIndex.WORD_INDEX]
+
+    @staticmethod
+    def _ensure_index(db, table: str, tokenize: str):
+        """创建单个索引表及其同步触发器"""
+        columns = [
+            row['name'] for row in db.execute(f'PRAGMA table_info({table})').fetchall()
+        ]
+        needs_rebuild = not columns
+
+        if columns and columns != CreationSearchIndex.COLUMNS:
+            # 旧版索引（独立存储内容的 creation_id 列，或缺少 owner 列），替换后重建
+            for action in ('insert', 'update', 'delete'):
+                db.execute(f'DROP TRIGGER IF EXISTS {table}_{action}')
+            db.execute(f'DROP TABLE {table}')
+            needs_rebuild = True
+
+        db.execute(f'''
+            CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5(
+                prompt,
+                tags,
+                owner,
+                content='{CreationSearchIndex.SOURCE_VIEW}',
+                content_rowid='id'{tokenize}
+            )
+        ''')
+
+        # 触发器写入的值必须与视图一致，否则 'delete' 无法正确移除旧条目
+        db.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_insert
+            AFTER INSERT ON creations
+            BEGIN
+                INSERT INTO {table}(rowid, prompt, tags, owner)
+                VALUES (new.id, new.prompt, COALESCE(new.tags, ''), '<' || new.user_id || '>');
+            END
+        ''')
+
+        db.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_update
+            AFTER UPDATE OF prompt, tags, user_id ON creations
+            BEGIN
+                INSERT INTO {table}({table}, rowid, prompt, tags, owner)
+                VALUES ('delete', old.id, old.prompt, COALESCE(old.tags, ''), '<' || old.user_id || '>');
+                INSERT INTO {table}(rowid, prompt, tags, owner)
+                VALUES (new.id, new.prompt, COALESCE(new.tags, ''), '<' || new.user_id || '>');
+            END
+        ''')
+
+        db.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_delete
+            AFTER DELETE ON creations
+            BEGIN
+                INSERT INTO {table}({table}, rowid, prompt, tags, owner)
+                VALUES ('delete', old.id, old.prompt, COALESCE(old.tags, ''), '<' || old.user_id || '>');
+            END
+        ''')
+
+        if needs_rebuild:
+            db.execute(f"INSERT INTO {table}({table}) VALUES('rebuild')")
+
+    @staticmethod
+    def is_available(table: str = None) -> bool:
+        """索引是否可用（每个进程只检查一次）"""
+        table = table or CreationSearchIndex.WORD_INDEX
+        if table not in CreationSearchIndex._available:
+            db = get_db()
+            CreationSearchIndex._available[table] = db.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+            ).fetchone() is not None
+        return CreationSearchIndex._available[table]
+
+    @staticmethod
+    def resolve_mode(search: str, mode: str = 'auto') -> str:
+        """auto 模式下含中日韩字符的输入走子串搜索，其余走前缀搜索"""
+        if mode not in ('prefix', 'substring'):
+            mode = 'substring' if CreationSearchIndex.CJK_PATTERN.search(search) else 'prefix'
+        return mode
+
+    @staticmethod
+    def build_match_query(search: str, mode: str = 'prefix') -> Optional[str]:
+        """
+        把用户输入转换为安全的 FTS5 MATCH 表达式
+
+        每个词作为短语加引号，避免用户输入中的 FTS5 语法字符导致查询报错；
+        多个词之间为 AND 关系。prefix 模式下每个词按前缀匹配，
+        substring 模式下跳过 trigram 无法命中的短词（由调用方用 LIKE 补充过滤）。
+        """
+        terms = search.split()
+        if mode == 'substring':
+            terms = [t for t in terms if len(t) >= CreationSearchIndex.TRIGRAM_MIN_LENGTH]
+        if not terms:
+            return None
+
+        suffix = '*' if mode == 'prefix' else ''
+        return ' '.join('"{}"{}'.format(t.replace('"', '""'), suffix) for t in terms)
+
+    @staticmethod
+    def short_terms(search: str) -> List[str]:
+        """substring 模式下 trigram 无法命中的短词"""
+        return [t for t in search.split() if len(t) < CreationSearchIndex.TRIGRAM_MIN_LENGTH]
+
+    @staticmethod
+    def make_cursor(creation: Dict[str, Any]) -> str:
+        """根据一页的最后一条结果生成下一页的 keyset 游标"""
+        return f"{creation['search_rank']!r}:{creation['id']}"
+
+    @staticmethod
+    def parse_cursor(cursor: str) -> tuple:
+        """解析 keyset 游标，格式错误时抛出 ValueError"""
+        rank, _, creation_id = cursor.rpartition(':')
+        return float(rank), int(creation_id)
+
+    @staticmethod
+    def search(db, user_id: int, match_query: str, conditions: List[str], params: List[Any],
+               limit: int, offset: int = 0, cursor: str = None,
+               table: str = None, columns: str = 'c.*') -> List[sqlite3.Row]:
+        """
+        在 SQLite 内完成全文匹配、用户过滤和 BM25 排序
+
+        Args:
+            user_id: 作品所有者，以 owner 列与搜索词求交集
+            match_query: build_match_query 生成的 MATCH 表达式
+            conditions: 针对别名 c（creations）的附加过滤条件
+            params: conditions 对应的参数
+            cursor: 上一页的 keyset 游标；提供时忽略 offset
+            table: 使用的索引表，默认 creations_fts
+            columns: 返回的列（见 Creation.list_columns），须包含 c.id
+        """
+        table = table or CreationSearchIndex.WORD_INDEX
+        weights = ', '.join(str(w) for w in CreationSearchIndex.BM25_WEIGHTS)
+        where_clause = ' AND '.join([f'{table} MATCH ?'] + conditions)
+        # 搜索词只匹配 prompt / tags 列，owner 列限定作者
+        scoped_query = f'owner : "<{int(user_id)}>" AND {{prompt tags}} : ({match_query})'
+        query_params = [scoped_query] + list(params)
+
+        page_clause = ''
+        if cursor:
+            last_rank, last_id = CreationSearchIndex.parse_cursor(cursor)
+            page_clause = 'WHERE search_rank > ? OR (search_rank = ? AND id < ?)'
+            query_params.extend([last_rank, last_rank, last_id])
+            offset = 0
+
+        query_params.extend([limit, offset])
+
+        return db.execute(
+            f'''SELECT * FROM (
+                    SELECT {columns}, bm25({table}, {weights}) AS search_rank
+                    FROM {table}
+                    CROSS JOIN creations c ON c.id = {table}.rowid
+                    WHERE {where_clause}
+                )
+                {page_clause}
+                ORDER BY search_rank, id DESC
+                LIMIT ? OFFSET ?''',
+            query_params
+        ).fetchall()
+
+    @staticmethod
+    def _available_tables() -> List[str]:
+        return [t for t in CreationSearchIndex.INDEXES if CreationSearchIndex.is_available(t)]
+
+    @staticmethod
+    def rebuild():
+        """
+        从 creations 全量重建所有索引
+
+        每个索引一条语句完成；WAL 模式下读请求不受影响，写请求会等待重建结束。
+        """
+        db = get_db()
+        for table in CreationSearchIndex._available_tables():
+            db.execute(f"INSERT INTO {table}({table}) VALUES('rebuild')")
+            db.commit()
+
+    @staticmethod
+    def optimize(pages: int = None) -> int:
+        """
+        增量合并索引段
+
+        每步合并 pages 页后提交，避免长时间持有写锁；返回执行的总步数。
+        """
+        db = get_db()
+        pages = pages or CreationSearchIndex.MERGE_PAGES
+        steps = 0
+        for table in CreationSearchIndex._available_tables():
+            while True:
+                changes_before = db.total_changes
+                db.execute(
+                    f"INSERT INTO {table}({table}, rank) VALUES('merge', ?)",
+                    (pages,)
+                )
+                db.commit()
+                steps += 1
+                # 按 FTS5 文档约定：变更数小于 2 表示已无可合并的段
+                if db.total_changes - changes_before < 2:
+                    break
+        return steps
+
+
 # === 性能监控与用户行为分析模型类 (Phase 1) ===
 
 class UserSession:
@@ -868,50 +2438,299 @@ class PerformanceMetric:
 
     @staticmethod
     def get_avg_generation_time(operation_type: str = None, hours: int = 24) -> float:
-        """获取平均生成时间（保留2位小数）"""
-        db = get_db()
+        """获取平均生成时间（保留2位小数，读取汇总表）"""
+        return PerformanceRollup.summarize(hours, operation_type)['avg_generation_time']
 
-        where_clause = "WHERE success = 1 AND timestamp >= datetime('now', '-{} hours')".format(hours)
-        if operation_type:
-            where_clause += f" AND operation_type = '{operation_type}'"
+    @staticmethod
+    def get_error_rate(hours: int = 24) -> float:
+        """获取错误率（读取汇总表）"""
+        return PerformanceRollup.summarize(hours)['error_rate']
 
-        result = db.execute(
-            f'''SELECT AVG(generation_time) as avg_time
-                FROM performance_metrics {where_clause}
-                AND generation_time IS NOT NULL'''
+    @staticmethod
+    def get_peak_load(hours: int = 24) -> float:
+        """获取峰值负载（读取汇总表）"""
+        return PerformanceRollup.summarize(hours)['peak_load']
+
+
+class PerformanceRollup:
+    """
+    性能指标分钟 / 小时汇总
+
+    performance_rollups 按 (粒度, 时间桶, 操作类型, 模型, 尺寸) 存储请求数、成功数、
+    生成耗时与 API 响应时间的计数 / 总和 / 最小 / 最大值以及峰值负载：
+    - performance_metrics 上的插入触发器同时更新分钟桶和小时桶
+    - 分析接口读取汇总行，查询成本只与时间窗口长度有关，与请求量无关
+    - 原始记录保留 PERFORMANCE_RAW_RETENTION_DAYS 天后删除（数据已降采样进汇总表），
+      分钟桶保留 PERFORMANCE_MINUTE_RETENTION_DAYS 天，小时桶保留 PERFORMANCE_HOUR_RETENTION_DAYS 天，
+      由 flask prune-performance-metrics 定期执行
+
+    汇总是历史记录：删除原始记录（保留期清理、删除用户）不回退已汇总的计数。
+    生成耗时只统计成功且有耗时的记录，与原先 AVG 的口径一致。
+    """
+
+    RESOLUTIONS = {
+        'minute': '%Y-%m-%d %H:%M:00',
+        'hour': '%Y-%m-%d %H:00:00',
+    }
+    # 不超过该小时数的窗口读取分钟桶，更长的窗口读取小时桶（起点按整点对齐）
+    MINUTE_WINDOW_HOURS = 6
+    BREAKDOWN_DIMENSIONS = ('model_used', 'image_size')
+
+    RAW_RETENTION_DAYS = 7
+    MINUTE_RETENTION_DAYS = 3
+    HOUR_RETENTION_DAYS = 400
+
+    _COLUMNS = ('''resolution, bucket, operation_type, model_used, image_size, count, success_count,
+                   gen_count, gen_sum, gen_min, gen_max, api_count, api_sum, api_min, api_max, load_max''')
+
+    # 触发器中以 {resolution} / {fmt} 代替粒度和时间桶格式
+    _APPLY_SQL = '''
+        INSERT INTO performance_rollups ({columns})
+        SELECT '{resolution}', strftime('{fmt}', new.timestamp), new.operation_type,
+               COALESCE(new.model_used, ''), COALESCE(new.image_size, ''),
+               1, CASE WHEN new.success THEN 1 ELSE 0 END,
+               ok, CASE WHEN ok THEN new.generation_time ELSE 0 END,
+               CASE WHEN ok THEN new.generation_time END, CASE WHEN ok THEN new.generation_time END,
+               new.api_response_time IS NOT NULL, COALESCE(new.api_response_time, 0),
+               new.api_response_time, new.api_response_time, new.server_load
+        FROM (SELECT new.success AND new.generation_time IS NOT NULL AS ok)
+        WHERE 1
+        ON CONFLICT(resolution, bucket, operation_type, model_used, image_size) DO UPDATE SET
+            count = count + 1,
+            success_count = success_count + excluded.success_count,
+            gen_count = gen_count + excluded.gen_count,
+            gen_sum = gen_sum + excluded.gen_sum,
+            gen_min = min(COALESCE(gen_min, excluded.gen_min), COALESCE(excluded.gen_min, gen_min)),
+            gen_max = max(COALESCE(gen_max, excluded.gen_max), COALESCE(excluded.gen_max, gen_max)),
+            api_count = api_count + excluded.api_count,
+            api_sum = api_sum + excluded.api_sum,
+            api_min = min(COALESCE(api_min, excluded.api_min), COALESCE(excluded.api_min, api_min)),
+            api_max = max(COALESCE(api_max, excluded.api_max), COALESCE(excluded.api_max, api_max)),
+            load_max = max(COALESCE(load_max, excluded.load_max), COALESCE(excluded.load_max, load_max));
+    '''
+
+    @staticmethod
+    def ensure(db):
+        """创建汇总表和插入触发器，首次创建时从现有原始记录汇总"""
+        exists = db.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'performance_rollups'"
         ).fetchone()
 
-        avg_time = result['avg_time'] or 0.0
-        return round(avg_time, 2)
+        db.execute('''
+            CREATE TABLE IF NOT EXISTS performance_rollups (
+                resolution TEXT NOT NULL,
+                bucket TEXT NOT NULL,
+                operation_type TEXT NOT NULL,
+                model_used TEXT NOT NULL DEFAULT '',
+                image_size TEXT NOT NULL DEFAULT '',
+                count INTEGER NOT NULL DEFAULT 0,
+                success_count INTEGER NOT NULL DEFAULT 0,
+                gen_count INTEGER NOT NULL DEFAULT 0,
+                gen_sum REAL NOT NULL DEFAULT 0,
+                gen_min REAL,
+                gen_max REAL,
+                api_count INTEGER NOT NULL DEFAULT 0,
+                api_sum REAL NOT NULL DEFAULT 0,
+                api_min REAL,
+                api_max REAL,
+                load_max REAL,
+                PRIMARY KEY (resolution, bucket, operation_type, model_used, image_size)
+            ) WITHOUT ROWID
+        ''')
+
+        body = ''.join(
+            PerformanceRollup._APPLY_SQL.format(columns=PerformanceRollup._COLUMNS, resolution=resolution, fmt=fmt)
+            for resolution, fmt in PerformanceRollup.RESOLUTIONS.items()
+        )
+        db.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS performance_metrics_rollup_insert
+            AFTER INSERT ON performance_metrics
+            BEGIN
+                {body}
+            END
+        ''')
+
+        if not exists:
+            PerformanceRollup.rebuild(db=db, commit=False)
 
     @staticmethod
-    def get_error_rate(hours: int = 24) -> float:
-        """获取错误率"""
+    def rebuild(since: str = None, db=None, commit: bool = True) -> int:
+        """
+        从原始记录重新汇总（since 之后的时间桶，None 表示全部）
+
+        分钟桶只汇总 MINUTE_RETENTION_DAYS 天内的记录。
+
+        Returns:
+            写入的汇总行数
+        """
+        db = db or get_db()
+        written = 0
+        for resolution, fmt in PerformanceRollup.RESOLUTIONS.items():
+            if resolution == 'minute':
+                floor = db.execute(
+                    "SELECT datetime('now', ?) AS floor", (f'-{PerformanceRollup.MINUTE_RETENTION_DAYS} days',)
+                ).fetchone()['floor']
+                start = max(since, floor) if since else floor
+            else:
+                start = since
+
+            bucket_start = None
+            if start:
+                bucket_start = db.execute('SELECT strftime(?, ?) AS bucket', (fmt, start)).fetchone()['bucket']
+            scope = 'WHERE timestamp >= ?' if bucket_start else ''
+            params = (bucket_start,) if bucket_start else ()
+
+            db.execute(
+                f"DELETE FROM performance_rollups WHERE resolution = ? {'AND bucket >= ?' if bucket_start else ''}",
+                (resolution,) + params
+            )
+            cursor = db.execute(
+                f'''INSERT INTO performance_rollups ({PerformanceRollup._COLUMNS})
+                    SELECT ?, strftime(?, timestamp), operation_type,
+                           COALESCE(model_used, ''), COALESCE(image_size, ''),
+                           COUNT(*), SUM(CASE WHEN success THEN 1 ELSE 0 END),
+                           SUM(CASE WHEN success AND generation_time IS NOT NULL THEN 1 ELSE 0 END),
+                           COALESCE(SUM(CASE WHEN success THEN generation_time END), 0),
+                           MIN(CASE WHEN success THEN generation_time END),
+                           MAX(CASE WHEN success THEN generation_time END),
+                           COUNT(api_response_time), COALESCE(SUM(api_response_time), 0),
+                           MIN(api_response_time), MAX(api_response_time), MAX(server_load)
+                    FROM performance_metrics {scope}
+                    GROUP BY 2, 3, 4, 5''',
+                (resolution, fmt) + params
+            )
+            written += cursor.rowcount
+
+        if commit:
+            db.commit()
+        return written
+
+    @staticmethod
+    def _window(db, hours: int):
+        """返回 (粒度, 起始时间桶)"""
+        resolution = 'minute' if hours <= PerformanceRollup.MINUTE_WINDOW_HOURS else 'hour'
+        since = db.execute(
+            "SELECT strftime(?, 'now', ?) AS since",
+            (PerformanceRollup.RESOLUTIONS[resolution], f'-{int(hours)} hours')
+        ).fetchone()['since']
+        return resolution, since
+
+    @staticmethod
+    def summarize(hours: int = 24, operation_type: str = None) -> Dict[str, Any]:
+        """
+        汇总最近 hours 小时的指标
+
+        Returns:
+            {'count', 'success_count', 'error_rate'（百分比）, 'avg_generation_time',
+             'min_generation_time', 'max_generation_time', 'avg_api_response_time', 'peak_load'}
+        """
         db = get_db()
-        result = db.execute(
-            '''SELECT
-                   COUNT(*) as total,
-                   SUM(CASE WHEN success = 0 THEN 1 ELSE 0 END) as errors
-               FROM performance_metrics
-               WHERE timestamp >= datetime('now', '-{} hours')'''.format(hours)
+        resolution, since = PerformanceRollup._window(db, hours)
+        conditions, params = ['resolution = ?', 'bucket >= ?'], [resolution, since]
+        if operation_type:
+            conditions.append('operation_type = ?')
+            params.append(operation_type)
+
+        row = db.execute(
+            f'''SELECT COALESCE(SUM(count), 0) AS count, COALESCE(SUM(success_count), 0) AS success_count,
+                       SUM(gen_count) AS gen_count, SUM(gen_sum) AS gen_sum,
+                       MIN(gen_min) AS gen_min, MAX(gen_max) AS gen_max,
+                       SUM(api_count) AS api_count, SUM(api_sum) AS api_sum, MAX(load_max) AS load_max
+                FROM performance_rollups
+                WHERE {' AND '.join(conditions)}''',
+            params
         ).fetchone()
+        return PerformanceRollup._format(row)
 
-        if result['total'] == 0:
-            return 0.0
-        return (result['errors'] / result['total']) * 100
+    @staticmethod
+    def breakdown(hours: int = 24, dimension: str = 'model_used', operation_type: str = None) -> List[Dict[str, Any]]:
+        """按模型或尺寸分组汇总最近 hours 小时的指标（按请求数倒序）"""
+        if dimension not in PerformanceRollup.BREAKDOWN_DIMENSIONS:
+            raise ValueError(f'unsupported breakdown dimension: {dimension}')
+
+        db = get_db()
+        resolution, since = PerformanceRollup._window(db, hours)
+        conditions, params = ['resolution = ?', 'bucket >= ?'], [resolution, since]
+        if operation_type:
+            conditions.append('operation_type = ?')
+            params.append(operation_type)
+
+        rows = db.execute(
+            f'''SELECT {dimension} AS key, SUM(count) AS count, SUM(success_count) AS success_count,
+                       SUM(gen_count) AS gen_count, SUM(gen_sum) AS gen_sum,
+                       MIN(gen_min) AS gen_min, MAX(gen_max) AS gen_max,
+                       SUM(api_count) AS api_count, SUM(api_sum) AS api_sum, MAX(load_max) AS load_max
+                FROM performance_rollups
+                WHERE {' AND '.join(conditions)}
+                GROUP BY {dimension}
+                ORDER BY count DESC''',
+            params
+        ).fetchall()
+        return [dict(PerformanceRollup._format(row), **{dimension: row['key'] or None}) for row in rows]
 
     @staticmethod
-    def get_peak_load(hours: int = 24) -> float:
-        """获取峰值负载"""
+    def _format(row) -> Dict[str, Any]:
+        count = row['count'] or 0
+        return {
+            'count': count,
+            'success_count': row['success_count'] or 0,
+            'error_rate': round((count - (row['success_count'] or 0)) / count * 100, 2) if count else 0.0,
+            'avg_generation_time': round(row['gen_sum'] / row['gen_count'], 2) if row['gen_count'] else 0.0,
+            'min_generation_time': row['gen_min'],
+            'max_generation_time': row['gen_max'],
+            'avg_api_response_time': round(row['api_sum'] / row['api_count'], 3) if row['api_count'] else None,
+            'peak_load': row['load_max'] or 0.0
+        }
+
+    @staticmethod
+    def prune(raw_days: int = None, minute_days: int = None, hour_days: int = None,
+              batch_size: int = 5000) -> Dict[str, int]:
+        """
+        按保留期删除原始记录和过期汇总桶（分批提交，不长时间占用写锁）
+
+        原始记录在插入时已汇总，删除即完成降采样。分钟桶至少保留 1 天，
+        以覆盖 MINUTE_WINDOW_HOURS 内的查询。
+
+        Returns:
+            {'raw': 删除的原始记录数, 'minute': 删除的分钟桶数, 'hour': 删除的小时桶数}
+        """
         db = get_db()
-        result = db.execute(
-            '''SELECT MAX(server_load) as peak_load
-               FROM performance_metrics
-               WHERE timestamp >= datetime('now', '-{} hours')
-               AND server_load IS NOT NULL'''.format(hours)
-        ).fetchone()
+        raw_days = raw_days if raw_days is not None else PerformanceRollup.RAW_RETENTION_DAYS
+        minute_days = max(1, minute_days if minute_days is not None else PerformanceRollup.MINUTE_RETENTION_DAYS)
+        hour_days = hour_days if hour_days is not None else PerformanceRollup.HOUR_RETENTION_DAYS
+
+        removed = {'raw': 0, 'minute': 0, 'hour': 0}
+        # id 随时间递增，按 id 顺序即可先找到最旧的记录
+        raw_cutoff = db.execute("SELECT datetime('now', ?) AS cutoff", (f'-{int(raw_days)} days',)).fetchone()['cutoff']
+        while True:
+            cursor = db.execute(
+                '''DELETE FROM performance_metrics
+                   WHERE id IN (SELECT id FROM performance_metrics WHERE timestamp < ? ORDER BY id LIMIT ?)''',
+                (raw_cutoff, batch_size)
+            )
+            db.commit()
+            removed['raw'] += cursor.rowcount
+            if cursor.rowcount < batch_size:
+                break
+
+        for resolution, days in (('minute', minute_days), ('hour', hour_days)):
+            cutoff = db.execute("SELECT datetime('now', ?) AS cutoff", (f'-{int(days)} days',)).fetchone()['cutoff']
+            while True:
+                cursor = db.execute(
+                    '''DELETE FROM performance_rollups
+                       WHERE resolution = ? AND bucket IN (
+                           SELECT DISTINCT bucket FROM performance_rollups
+                           WHERE resolution = ? AND bucket < ?
+                           ORDER BY bucket LIMIT ?
+                       )''',
+                    (resolution, resolution, cutoff, max(1, batch_size // 50))
+                )
+                db.commit()
+                removed[resolution] += cursor.rowcount
+                if cursor.rowcount == 0:
+                    break
 
-        return result['peak_load'] or 0.0
+        return removed
 
 
 class UserBehavior:
@@ -1025,14 +2844,17 @@ class DailyStat:
         ).fetchone()['count']
 
         successful_generations = db.execute(
-            '''SELECT COUNT(*) as count
-               FROM performance_metrics
-               WHERE DATE(timestamp) = ? AND operation_type LIKE '%_to_image' AND success = 1''',
-            (today,)
+            '''SELECT COALESCE(SUM(success_count), 0) as count
+               FROM performance_rollups
+               WHERE resolution = 'hour' AND bucket >= ? AND bucket < date(?, '+1 day')
+                 AND operation_type LIKE '%_to_image'
+            ''',
+            (today, today)
         ).fetchone()['count']
 
-        avg_generation_time = PerformanceMetric.get_avg_generation_time(hours=24)
-        error_rate = PerformanceMetric.get_error_rate(hours=24)
+        performance = PerformanceRollup.summarize(hours=24)
+        avg_generation_time = performance['avg_generation_time']
+        error_rate = performance['error_rate']
         peak_concurrent_users = UserSession.get_active_sessions_count()
 
         # 插入或更新今日统计
@@ -1062,14 +2884,22 @@ class DailyStat:
 
 
 class JWTBlacklist:
-    """JWT黑名单模型"""
+    """JWT黑名单模型（请求路径上的检查见 app.services.token_revocation_cache）"""
+
+    # 没有 expires_at 的旧记录保留 7 天
+    LEGACY_RETENTION_DAYS = 7
 
     @staticmethod
-    def add(jti: str):
-        """添加token到黑名单"""
+    def add(jti: str, expires_at: int = None):
+        """
+        添加token到黑名单
+
+        Args:
+            expires_at: token 的 exp（Unix 时间戳），过期后记录可被清理
+        """
         db = get_db()
         try:
-            db.execute('INSERT INTO jwt_blacklist (jti) VALUES (?)', (jti,))
+            db.execute('INSERT INTO jwt_blacklist (jti, expires_at) VALUES (?, ?)', (jti, expires_at))
             db.commit()
         except sqlite3.IntegrityError:
             pass  # JTI已存在
@@ -1084,15 +2914,225 @@ class JWTBlacklist:
         return result is not None
 
     @staticmethod
-    def cleanup_expired():
-        """清理过期的黑名单记录（需要定期调用）"""
+    def get_latest_id() -> int:
+        """黑名单变更计数：自增主键最大值（rowid B 树末端读取，O(1)）"""
         db = get_db()
-        # 删除7天前的记录
-        from datetime import timedelta
-        cutoff = (datetime.now() - timedelta(days=7)).isoformat()
-        db.execute('DELETE FROM jwt_blacklist WHERE created_at < ?', (cutoff,))
+        row = db.execute('SELECT MAX(id) AS id FROM jwt_blacklist').fetchone()
+        return row['id'] or 0
+
+    @staticmethod
+    def get_since(last_id: int, now: int) -> List[Dict[str, Any]]:
+        """获取 id 大于 last_id 且尚未过期的记录"""
+        db = get_db()
+        rows = db.execute(
+            '''SELECT id, jti, expires_at FROM jwt_blacklist
+               WHERE id > ? AND (expires_at IS NULL OR expires_at > ?)
+               ORDER BY id''',
+            (last_id, now)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    @staticmethod
+    def cleanup_expired() -> int:
+        """清理已过期的黑名单记录（需要定期调用）"""
+        import time
+
+        db = get_db()
+        result = db.execute(
+            '''DELETE FROM jwt_blacklist
+               WHERE expires_at < ?
+                  OR (expires_at IS NULL AND created_at < datetime('now', ?))''',
+            (int(time.time()), f'-{JWTBlacklist.LEGACY_RETENTION_DAYS} days')
+        )
+        db.commit()
+        return result.rowcount
+
+
+class LoginFailure:
+    """
+    登录失败计数（所有 worker 共享）
+
+    以邮箱为键（不区分账户是否存在），每次失败一条 UPSERT 完成计数、
+    窗口重置和冷却判断，用于限制对同一邮箱的快速尝试。
+    账户锁定另由 users.login_attempts 累计（见 User.increment_login_attempts），
+    该计数只在登录成功时清零，不随窗口重置；两者在同一事务内更新。
+    过期记录定期清理，表行数不超过 MAX_ROWS。
+    """
+
+    LIMIT = 5
+    WINDOW_SECONDS = 300  # 计数窗口
+    LOCK_SECONDS = 300  # 邮箱冷却时间
+    ACCOUNT_LOCK_SECONDS = 1800  # 已注册账户锁定30分钟
+    MAX_ROWS = 100000
+    PRUNE_INTERVAL = 60
+
+    _last_prune = 0
+
+    @staticmethod
+    def ensure(db):
+        """创建登录失败计数表"""
+        db.execute('''
+            CREATE TABLE IF NOT EXISTS login_failures (
+                email TEXT PRIMARY KEY,
+                failures INTEGER NOT NULL,
+                window_started INTEGER NOT NULL,
+                locked_until INTEGER,
+                expires_at INTEGER NOT NULL -- 窗口结束或锁定结束，之后记录可清理
+            ) WITHOUT ROWID
+        ''')
+        db.execute('''
+            CREATE INDEX IF NOT EXISTS idx_login_failures_expires
+            ON login_failures(expires_at)
+        ''')
+
+    @staticmethod
+    def get_lock_remaining(email: str) -> int:
+        """邮箱剩余锁定秒数，未锁定返回 0"""
+        import time
+
+        now = int(time.time())
+        db = get_db()
+        row = db.execute(
+            'SELECT locked_until FROM login_failures WHERE email = ? AND locked_until > ?',
+            (email, now)
+        ).fetchone()
+        return row['locked_until'] - now if row else 0
+
+    @staticmethod
+    def record_failure(email: str, user_id: int = None) -> Dict[str, Any]:
+        """
+        记录一次登录失败
+
+        Args:
+            email: 登录邮箱
+            user_id: 邮箱对应的账户（存在时累计账户失败次数）
+
+        Returns:
+            {'failures': 窗口内失败次数, 'locked_until': 邮箱冷却结束时间戳或 None,
+             'account': 账户的 {'login_attempts', 'locked_until'}（无账户时为 None）}
+        """
+        import time
+
+        now = int(time.time())
+        params = {
+            'email': email,
+            'now': now,
+            'limit': LoginFailure.LIMIT,
+            'window': LoginFailure.WINDOW_SECONDS,
+            'lock': LoginFailure.LOCK_SECONDS,
+        }
+
+        db = get_db()
+        # SET 中的列引用均为更新前的值；记录已过期时重新开始计数
+        row = db.execute('''
+            INSERT INTO login_failures (email, failures, window_started, locked_until, expires_at)
+            VALUES (:email, 1, :now, NULL, :now + :window)
+            ON CONFLICT(email) DO UPDATE SET
+                failures = CASE WHEN expires_at <= :now THEN 1 ELSE failures + 1 END,
+                window_started = CASE WHEN expires_at <= :now THEN :now ELSE window_started END,
+                locked_until = CASE
+                    WHEN (CASE WHEN expires_at <= :now THEN 1 ELSE failures + 1 END) >= :limit
+                    THEN :now + :lock
+                    ELSE NULL
+                END,
+                expires_at = CASE
+                    WHEN (CASE WHEN expires_at <= :now THEN 1 ELSE failures + 1 END) >= :limit
+                    THEN :now + :lock
+                    WHEN expires_at <= :now THEN :now + :window
+                    ELSE expires_at
+                END
+            RETURNING failures, locked_until
+        ''', params).fetchone()
+        result = dict(row)
+        result['account'] = User.increment_login_attempts(db, user_id) if user_id else None
         db.commit()
 
+        if now - LoginFailure._last_prune >= LoginFailure.PRUNE_INTERVAL:
+            LoginFailure._last_prune = now
+            LoginFailure.prune()
+
+        return result
+
+    @staticmethod
+    def clear(email: str):
+        """登录成功后清除计数"""
+        db = get_db()
+        db.execute('DELETE FROM login_failures WHERE email = ?', (email,))
+        db.commit()
+
+    @staticmethod
+    def prune() -> int:
+        """删除已过期记录，并在超过 MAX_ROWS 时删除最早过期的记录"""
+        import time
+
+        db = get_db()
+        deleted = db.execute(
+            'DELETE FROM login_failures WHERE expires_at <= ?', (int(time.time()),)
+        ).rowcount
+
+        excess = db.execute('SELECT COUNT(*) FROM login_failures').fetchone()[0] - LoginFailure.MAX_ROWS
+        if excess > 0:
+            deleted += db.execute('''
+                DELETE FROM login_failures
+                WHERE email IN (
+                    SELECT email FROM login_failures ORDER BY expires_at LIMIT ?
+                )
+            ''', (excess,)).rowcount
+
+        db.commit()
+        return deleted
+
+
+class RoleVersion:
+    """
+    角色权限版本计数
+
+    user_roles / role_permissions / roles / permissions 的任何变更都由触发器
+    递增 rbac_version 中的计数（包括迁移脚本和 init_admin.py 等绕过应用的修改），
+    权限缓存（见 app.utils.permissions）据此判断是否需要重新加载。
+    """
+
+    TABLES = ('user_roles', 'role_permissions', 'roles', 'permissions')
+
+    @staticmethod
+    def ensure(db):
+        """创建版本表和触发器（角色系统表不存在时跳过，由 add_role_system.sql 创建）"""
+        existing = {row['name'] for row in db.execute(
+            f"""SELECT name FROM sqlite_master
+                WHERE type = 'table' AND name IN ({','.join('?' * len(RoleVersion.TABLES))})""",
+            RoleVersion.TABLES
+        ).fetchall()}
+        if len(existing) < len(RoleVersion.TABLES):
+            return
+
+        db.execute('''
+            CREATE TABLE IF NOT EXISTS rbac_version (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                version INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        db.execute('INSERT OR IGNORE INTO rbac_version (id, version) VALUES (1, 0)')
+
+        for table in RoleVersion.TABLES:
+            for event in ('INSERT', 'UPDATE', 'DELETE'):
+                db.execute(f'''
+                    CREATE TRIGGER IF NOT EXISTS {table}_rbac_version_{event.lower()}
+                    AFTER {event} ON {table}
+                    BEGIN
+                        UPDATE rbac_version SET version = version + 1 WHERE id = 1;
+                    END
+                ''')
+
+    @staticmethod
+    def get() -> Optional[int]:
+        """读取当前版本（单行主键查询），版本表不存在时返回 None"""
+        db = get_db()
+        try:
+            row = db.execute('SELECT version FROM rbac_version WHERE id = 1').fetchone()
+        except sqlite3.OperationalError:
+            return None
+        return row['version'] if row else None
+
 
 # === Phase 2: 智能推荐系统模型类 ===
 
@@ -0,0 +1,169 @@
+"""
+响应压缩中间件
+对超过阈值的文本/JSON 响应按客户端 Accept-Encoding 进行 gzip 压缩
+"""
+
+import gzip
+import threading
+import time
+from flask import request
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class ResponseCompressor:
+    """
+    gzip 响应压缩
+
+    - 只压缩文本类响应（JSON、HTML、CSV 等），图片等二进制响应直接跳过
+    - 小于 MIN_SIZE 的响应不压缩（gzip 头和 CPU 开销得不偿失）
+    - 流式响应、已编码响应和 HEAD 请求不处理
+    - cache_response 缓存压缩后的响应体（见 encode_for_cache），
+      重复命中直接返回，不再重复压缩
+    """
+
+    COMPRESSIBLE_TYPES = {
+        'application/json',
+        'application/javascript',
+        'application/x-ndjson',
+        'image/svg+xml',
+    }
+
+    def __init__(self):
+        self.enabled = True
+        self.min_size = 1024
+        self.level = 6
+        self._lock = threading.Lock()
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self.compressed_count = 0
+        self.skipped_count = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.cpu_seconds = 0.0
+
+    def init_app(self, app):
+        """读取压缩配置并注册 after_request 钩子"""
+        self.enabled = bool(app.config.get('COMPRESSION_ENABLED', True))
+        self.min_size = int(app.config.get('COMPRESSION_MIN_SIZE', self.min_size))
+        self.level = int(app.config.get('COMPRESSION_LEVEL', self.level))
+        app.after_request(self._after_request)
+
+    def accepts_gzip(self) -> bool:
+        """当前请求是否接受 gzip 编码（q=0 表示拒绝）"""
+        return request.accept_encodings.quality('gzip') > 0
+
+    def is_compressible(self, response) -> bool:
+        """响应类型和状态是否适合压缩（不判断大小）"""
+        if not self.enabled or request.method == 'HEAD':
+            return False
+        if response.status_code < 200 or response.status_code in (204, 206, 304):
+            return False
+        if response.direct_passthrough or response.is_streamed:
+            return False
+        if 'Content-Encoding' in response.headers:
+            return False
+        if 'no-transform' in response.headers.get('Cache-Control', ''):
+            return False
+        mimetype = response.mimetype or ''
+        return mimetype.startswith('text/') or mimetype in self.COMPRESSIBLE_TYPES
+
+    def compress(self, data: bytes) -> Optional[bytes]:
+        """
+        压缩响应体并记录压缩率和 CPU 时间
+
+        Returns:
+            压缩结果；压缩后没有变小时返回 None
+        """
+        started = time.thread_time()
+        # mtime 固定为 0，相同内容得到相同字节（便于缓存和比较）
+        compressed = gzip.compress(data, compresslevel=self.level, mtime=0)
+        elapsed = time.thread_time() - started
+
+        with self._lock:
+            self.cpu_seconds += elapsed
+            if len(compressed) >= len(data):
+                self.skipped_count += 1
+                return None
+            self.compressed_count += 1
+            self.bytes_in += len(data)
+            self.bytes_out += len(compressed)
+        return compressed
+
+    def _after_request(self, response):
+        if not self.is_compressible(response):
+            return response
+
+        data = response.get_data()
+        if len(data) < self.min_size:
+            return response
+
+        # 同一 URL 的响应随 Accept-Encoding 变化，共享缓存需要区分
+        response.vary.add('Accept-Encoding')
+        if not self.accepts_gzip():
+            return response
+
+        compressed = self.compress(data)
+        if compressed is None:
+            return response
+
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = 'gzip'
+        return response
+
+    def encode_for_cache(self, response, body: bytes) -> Tuple[bytes, List[Tuple[str, str]]]:
+        """
+        生成写入响应缓存的响应体和响应头
+
+        适合压缩时缓存 gzip 后的响应体（占用更少缓存容量），
+        并将当前响应也替换为压缩结果（客户端接受 gzip 时）。
+        """
+        headers = list(response.headers.items())
+        if not self.is_compressible(response) or len(body) < self.min_size:
+            return body, headers
+
+        compressed = self.compress(body)
+        if compressed is None:
+            return body, headers
+
+        response.vary.add('Accept-Encoding')
+        if self.accepts_gzip():
+            response.set_data(compressed)
+            response.headers['Content-Encoding'] = 'gzip'
+
+        headers = [(name, value) for name, value in response.headers.items()
+                   if name not in ('Content-Length', 'Content-Encoding')]
+        headers.append(('Content-Encoding', 'gzip'))
+        return compressed, headers
+
+    def decode_cached(self, body: bytes, headers: List[Tuple[str, str]]) -> Tuple[bytes, List[Tuple[str, str]]]:
+        """命中缓存时按客户端能力返回：接受 gzip 直接返回压缩体，否则解压"""
+        if ('Content-Encoding', 'gzip') not in headers or self.accepts_gzip():
+            return body, headers
+        return gzip.decompress(body), [header for header in headers if header[0] != 'Content-Encoding']
+
+    def get_stats(self) -> Dict[str, Any]:
+        """压缩统计（本进程）"""
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'min_size': self.min_size,
+                'level': self.level,
+                'compressed_count': self.compressed_count,
+                'skipped_count': self.skipped_count,
+                'bytes_in': self.bytes_in,
+                'bytes_out': self.bytes_out,
+                'ratio': round(self.bytes_out / self.bytes_in, 3) if self.bytes_in else None,
+                'cpu_ms': round(self.cpu_seconds * 1000, 1),
+                'avg_cpu_ms': round(self.cpu_seconds * 1000 / (self.compressed_count + self.skipped_count), 3)
+                if self.compressed_count + self.skipped_count else None
+            }
+
+    def reset_stats(self):
+        """清零统计"""
+        with self._lock:
+            self._reset_stats()
+
+
+# 全局压缩器实例
+response_compressor = ResponseCompressor()
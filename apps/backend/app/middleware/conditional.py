@@ -0,0 +1,74 @@
+"""
+条件请求中间件
+按用户数据版本号生成弱 ETag，客户端携带 If-None-Match 且版本未变时直接返回 304
+"""
+
+from datetime import datetime
+from functools import wraps
+from flask import g, request, current_app, make_response
+from flask_jwt_extended import get_jwt_identity
+import hashlib
+
+
+def _build_etag(user_id: int, version) -> str:
+    """ETag = 用户ID + 数据版本 + 端点和查询参数摘要（不同筛选条件不共用）"""
+    query = request.query_string.decode('utf-8', errors='ignore')
+    digest = hashlib.md5(f"{request.endpoint}?{query}".encode('utf-8')).hexdigest()[:12]
+    return f"u{user_id}-v{version}-{digest}"
+
+
+def user_version_etag(f: callable = None, date_scoped: bool = False) -> callable:
+    """
+    用户数据版本 ETag 装饰器
+
+    只用于响应内容完全由当前用户数据决定的 GET 接口，
+    放在 @jwt_required() 之下、@cache_response 之上：
+    304 判断只需一次主键查询，不会进入缓存或执行业务查询。
+
+    版本号由触发器维护（见 app.database.UserDataVersion），
+    因此无需在各写接口中手动失效。
+
+    :param date_scoped: 响应还依赖当前日期（如按天统计的 recent_week）时设为 True，
+                        ETag 和缓存 key 加入当前 UTC 日期，跨天后不会再返回 304
+
+    使用示例:
+    @user_version_etag
+    @user_version_etag(date_scoped=True)
+    """
+    if f is None:
+        return lambda func: user_version_etag(func, date_scoped=date_scoped)
+
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if request.method != 'GET':
+            return f(*args, **kwargs)
+
+        from app.database import UserDataVersion
+
+        try:
+            user_id = int(get_jwt_identity())
+            version = UserDataVersion.get(user_id)
+            if date_scoped:
+                # 与库中 date('now') 一致使用 UTC 日期
+                version = f"{version}-{datetime.utcnow():%Y%m%d}"
+            etag = _build_etag(user_id, version)
+        except Exception as e:
+            # 版本读取失败时退化为普通请求
+            current_app.logger.warning(f"生成 ETag 失败: {str(e)}")
+            return f(*args, **kwargs)
+
+        if request.if_none_match.contains_weak(etag):
+            response = current_app.response_class(status=304)
+        else:
+            # 供 cache_response 加入缓存 key
+            g.user_data_version = version
+            response = make_response(f(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+
+        response.set_etag(etag, weak=True)
+        # 允许浏览器保存响应，但每次使用前都要带 If-None-Match 重新验证
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+
+    return decorated_function
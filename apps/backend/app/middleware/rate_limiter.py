@@ -3,24 +3,203 @@ API请求速率限制中间件
 防止API滥用和服务器过载
 """
 from functools import wraps
-from flask import request, jsonify, current_app
+from flask import request, jsonify, current_app, make_response
+import math
+import os
+import sqlite3
 import time
-from collections import defaultdict
-from threading import Lock
+import zlib
+from collections import OrderedDict, namedtuple
+from threading import Lock, local
+
+
+# 单次检查结果；reset_after 为额度完全恢复的剩余秒数
+RateLimitResult = namedtuple('RateLimitResult', ['allowed', 'limit', 'remaining', 'reset_after', 'retry_after'])
+
+
+class MemoryRateLimitBackend:
+    """
+    进程内 GCRA 状态存储
+
+    每个 key 只保存 [理论到达时间 TAT, 拒绝次数]，按 key 哈希分片加锁。
+    额度已完全恢复（TAT <= now）的 key 在后续访问时顺带淘汰，
+    总数超过 max_keys 时淘汰最久未访问的 key。
+    """
+
+    SHARDS = 16
+    EVICT_PER_CALL = 4
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys_per_shard = max(1, max_keys // self.SHARDS)
+        self.shards = [(Lock(), OrderedDict()) for _ in range(self.SHARDS)]
+
+    def _shard(self, key: str):
+        return self.shards[zlib.crc32(key.encode()) % self.SHARDS]
+
+    def acquire(self, key: str, now: float, interval: float, window: float) -> tuple:
+        """尝试占用一个额度，返回 (是否允许, 当前 TAT)"""
+        lock, entries = self._shard(key)
+        with lock:
+            entry = entries.get(key)
+            new_tat = max(entry[0] if entry else now, now) + interval
+            if new_tat - now <= window:
+                if entry:
+                    entry[0] = new_tat
+                else:
+                    entry = entries[key] = [new_tat, 0]
+                allowed = True
+            else:
+                entry[1] += 1
+                allowed = False
+            entries.move_to_end(key)
+            self._evict(entries, now)
+            return allowed, entry[0]
+
+    def _evict(self, entries: OrderedDict, now: float):
+        for _ in range(self.EVICT_PER_CALL):
+            if not entries:
+                break
+            oldest_key, oldest = next(iter(entries.items()))
+            if oldest[0] > now and len(entries) <= self.max_keys_per_shard:
+                break
+            del entries[oldest_key]
+
+    def get(self, key: str):
+        lock, entries = self._shard(key)
+        with lock:
+            entry = entries.get(key)
+            return tuple(entry) if entry else None
+
+    def top_offenders(self, limit: int) -> list:
+        offenders = []
+        for lock, entries in self.shards:
+            with lock:
+                offenders.extend((key, entry[1]) for key, entry in entries.items() if entry[1])
+        offenders.sort(key=lambda item: item[1], reverse=True)
+        return offenders[:limit]
+
+    def count(self) -> int:
+        total = 0
+        for lock, entries in self.shards:
+            with lock:
+                total += len(entries)
+        return total
+
+    def clear(self, key: str = None):
+        for lock, entries in ([self._shard(key)] if key else self.shards):
+            with lock:
+                if key:
+                    entries.pop(key, None)
+                else:
+                    entries.clear()
+
+
+class SQLiteRateLimitBackend:
+    """
+    多 worker 共享的 GCRA 状态存储
+
+    独立的 SQLite 文件（WAL，不要求持久性），不与业务数据库争用写锁。
+    每次检查一条条件 UPSERT：允许时推进 TAT，拒绝时不写入状态，
+    再用一条 UPDATE 累加拒绝次数并取回 TAT。
+    """
+
+    PRUNE_INTERVAL = 60
+
+    def __init__(self, path: str, max_keys: int = 100000):
+        self.path = path
+        self.max_keys = max_keys
+        self._local = local()
+        self._last_prune = 0
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS rate_limit_state (
+                    key TEXT PRIMARY KEY,
+                    tat REAL NOT NULL,
+                    denied INTEGER NOT NULL DEFAULT 0
+                ) WITHOUT ROWID
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_rate_limit_state_tat ON rate_limit_state(tat)')
+            self._local.conn = conn
+        return conn
+
+    def acquire(self, key: str, now: float, interval: float, window: float) -> tuple:
+        """尝试占用一个额度，返回 (是否允许, 当前 TAT)"""
+        conn = self._conn()
+        params = {'key': key, 'now': now, 'interval': interval, 'window': window}
+        row = conn.execute('''
+            INSERT INTO rate_limit_state (key, tat) VALUES (:key, :now + :interval)
+            ON CONFLICT(key) DO UPDATE SET tat = MAX(tat, :now) + :interval
+            WHERE MAX(tat, :now) + :interval - :now <= :window
+            RETURNING tat
+        ''', params).fetchone()
+
+        if row:
+            allowed, tat = True, row[0]
+        else:
+            row = conn.execute(
+                'UPDATE rate_limit_state SET denied = denied + 1 WHERE key = ? RETURNING tat', (key,)
+            ).fetchone()
+            allowed, tat = False, row[0] if row else now
+
+        if now - self._last_prune >= self.PRUNE_INTERVAL:
+            self._last_prune = now
+            self._prune(conn, now)
+        return allowed, tat
+
+    def _prune(self, conn, now: float):
+        conn.execute('DELETE FROM rate_limit_state WHERE tat <= ?', (now,))
+        excess = conn.execute('SELECT COUNT(*) FROM rate_limit_state').fetchone()[0] - self.max_keys
+        if excess > 0:
+            conn.execute('''
+                DELETE FROM rate_limit_state
+                WHERE key IN (SELECT key FROM rate_limit_state ORDER BY tat LIMIT ?)
+            ''', (excess,))
+
+    def get(self, key: str):
+        row = self._conn().execute(
+            'SELECT tat, denied FROM rate_limit_state WHERE key = ?', (key,)
+        ).fetchone()
+        return tuple(row) if row else None
+
+    def top_offenders(self, limit: int) -> list:
+        rows = self._conn().execute('''
+            SELECT key, denied FROM rate_limit_state
+            WHERE denied > 0
+            ORDER BY denied DESC
+            LIMIT ?
+        ''', (limit,)).fetchall()
+        return [tuple(row) for row in rows]
+
+    def count(self) -> int:
+        return self._conn().execute('SELECT COUNT(*) FROM rate_limit_state').fetchone()[0]
+
+    def clear(self, key: str = None):
+        if key:
+            self._conn().execute('DELETE FROM rate_limit_state WHERE key = ?', (key,))
+        else:
+            self._conn().execute('DELETE FROM rate_limit_state')
 
 
 class RateLimiter:
     """
     速率限制器
-    
-    使用滑动窗口算法跟踪请求频率
+
+    使用 GCRA（通用信元速率算法）：每个 key 只保存一个理论到达时间，
+    等价于容量为最大请求数、按 窗口/最大请求数 匀速恢复的令牌桶。
+    默认使用进程内存储；RATE_LIMIT_BACKEND=sqlite 时所有 worker 共享同一限额。
     支持不同类型的请求限制
     """
-    
+
     def __init__(self):
-        self.requests = defaultdict(list)
-        self.lock = Lock()
-        
+        self.backend = MemoryRateLimitBackend()
+        self.backend_name = 'memory'
+
         # 不同类型的限制配置 (最大请求数, 时间窗口秒数)
         self.limits = {
             'generate': (10, 60),      # AI生成: 10次/分钟
@@ -28,79 +207,119 @@ class RateLimiter:
             'login': (5, 300),          # 登录: 5次/5分钟
             'register': (3, 3600),      # 注册: 3次/小时
             'gallery': (50, 60),        # 画廊查询: 50次/分钟
+            'export': (3, 3600),        # 画廊导出: 3次/小时
         }
-    
-    def is_allowed(self, key: str, limit_type: str = 'api') -> tuple[bool, int]:
+
+    def init_app(self, app):
+        """按配置选择状态存储"""
+        backend = app.config.get('RATE_LIMIT_BACKEND', 'memory')
+        max_keys = int(app.config.get('RATE_LIMIT_MAX_KEYS', 100000))
+        if backend == 'sqlite':
+            path = app.config.get('RATE_LIMIT_DB_PATH') or os.path.join(app.instance_path, 'rate_limits.db')
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.backend = SQLiteRateLimitBackend(path, max_keys)
+        else:
+            backend = 'memory'
+            self.backend = MemoryRateLimitBackend(max_keys)
+        self.backend_name = backend
+
+    def check(self, key: str, limit_type: str = 'api') -> RateLimitResult:
         """
-        检查是否允许请求
-        
+        检查并占用一次额度
+
         Args:
             key: 请求标识（用户ID或IP）
             limit_type: 限制类型
-            
+
         Returns:
-            (是否允许, 重试等待秒数)
+            RateLimitResult
         """
         if limit_type not in self.limits:
             current_app.logger.warning(f"Unknown limit type: {limit_type}, using default 'api'")
             limit_type = 'api'
-        
+
         max_requests, window = self.limits[limit_type]
+        interval = window / max_requests
         now = time.time()
-        
-        with self.lock:
-            # 清理过期的请求记录
-            self.requests[key] = [
-                req_time for req_time in self.requests[key]
-                if now - req_time < window
-            ]
-            
-            # 检查是否超过限制
-            if len(self.requests[key]) >= max_requests:
-                # 计算需要等待的时间
-                oldest_request = self.requests[key][0]
-                retry_after = int(window - (now - oldest_request)) + 1
-                
-                current_app.logger.warning(
-                    f"Rate limit exceeded for {key} ({limit_type}): "
-                    f"{len(self.requests[key])}/{max_requests} in {window}s"
-                )
-                
-                return False, retry_after
-            
-            # 记录本次请求
-            self.requests[key].append(now)
-            return True, 0
-    
+
+        allowed, tat = self.backend.acquire(key, now, interval, window)
+        reset_after = max(0, math.ceil(tat - now))
+
+        if allowed:
+            remaining = int((window - (tat - now)) / interval + 1e-9)
+            return RateLimitResult(True, max_requests, remaining, reset_after, 0)
+
+        # 需要等到 TAT 回落到 window - interval 以内
+        retry_after = max(1, math.ceil(tat - (window - interval) - now))
+        current_app.logger.warning(
+            f"Rate limit exceeded for {key} ({limit_type}): "
+            f"{max_requests} in {window}s, retry after {retry_after}s"
+        )
+        return RateLimitResult(False, max_requests, 0, reset_after, retry_after)
+
+    def is_allowed(self, key: str, limit_type: str = 'api') -> tuple[bool, int]:
+        """
+        检查是否允许请求
+
+        Args:
+            key: 请求标识（用户ID或IP）
+            limit_type: 限制类型
+
+        Returns:
+            (是否允许, 重试等待秒数)
+        """
+        result = self.check(key, limit_type)
+        return result.allowed, result.retry_after
+
     def get_stats(self, key: str) -> dict:
         """获取指定key的速率统计信息"""
-        with self.lock:
-            return {
-                'total_requests': len(self.requests[key]),
-                'oldest_request': self.requests[key][0] if self.requests[key] else None,
-                'newest_request': self.requests[key][-1] if self.requests[key] else None
-            }
-    
+        entry = self.backend.get(key)
+        return {
+            'tracked': entry is not None,
+            'theoretical_arrival_time': entry[0] if entry else None,
+            'denied': entry[1] if entry else 0
+        }
+
+    def get_top_offenders(self, limit: int = 20) -> list:
+        """被拒绝次数最多的 key（仅统计仍在跟踪中的 key）"""
+        return [
+            {'key': key, 'limit_type': key.split(':', 1)[0], 'denied': denied}
+            for key, denied in self.backend.top_offenders(limit)
+        ]
+
+    def get_overview(self, top: int = 20) -> dict:
+        """限流状态概览（用于管理员监控）"""
+        return {
+            'backend': self.backend_name,
+            'limits': {name: {'max_requests': limit, 'window_seconds': window}
+                       for name, (limit, window) in self.limits.items()},
+            'tracked_keys': self.backend.count(),
+            'top_offenders': self.get_top_offenders(top)
+        }
+
     def clear(self, key: str = None):
         """清除速率限制记录（用于测试或管理员操作）"""
-        with self.lock:
-            if key:
-                self.requests.pop(key, None)
-            else:
-                self.requests.clear()
+        self.backend.clear(key)
 
 
 # 全局速率限制器实例
 rate_limiter = RateLimiter()
 
 
+def _set_rate_limit_headers(response, result: RateLimitResult):
+    response.headers['X-RateLimit-Limit'] = str(result.limit)
+    response.headers['X-RateLimit-Remaining'] = str(result.remaining)
+    response.headers['X-RateLimit-Reset'] = str(result.reset_after)
+    return response
+
+
 def rate_limit(limit_type: str = 'api'):
     """
     速率限制装饰器
-    
+
     Args:
-        limit_type: 限制类型 ('generate', 'api', 'login', 'register', 'gallery')
-    
+        limit_type: 限制类型 ('generate', 'api', 'login', 'register', 'gallery', 'export')
+
     Usage:
         @rate_limit('generate')
         def my_view():
@@ -109,39 +328,25 @@ def rate_limit(limit_type: str = 'api'):
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
-            # 尝试获取用户ID（已认证用户）
-            key = None
-            try:
-                from flask_jwt_extended import get_jwt_identity
-                user_id = get_jwt_identity()
-                if user_id:
-                    key = f"user:{user_id}"
-            except Exception:
-                pass
-            
-            # 如果没有用户ID，使用IP地址
-            if not key:
-                key = f"ip:{request.remote_addr}"
-            
             # 添加限制类型前缀
-            rate_key = f"{limit_type}:{key}"
-            
+            rate_key = f"{limit_type}:{get_request_key()}"
+
             # 检查速率限制
-            allowed, retry_after = rate_limiter.is_allowed(rate_key, limit_type)
-            
-            if not allowed:
-                response = {
+            result = rate_limiter.check(rate_key, limit_type)
+
+            if not result.allowed:
+                response = make_response(jsonify({
                     'success': False,
                     'error': 'Too many requests. Please slow down.',
                     'error_code': 'RATE_LIMIT_EXCEEDED',
-                    'retry_after': retry_after
-                }
-                
-                return jsonify(response), 429
-            
+                    'retry_after': result.retry_after
+                }), 429)
+                response.headers['Retry-After'] = str(result.retry_after)
+                return _set_rate_limit_headers(response, result)
+
             # 执行原函数
-            return f(*args, **kwargs)
-        
+            return _set_rate_limit_headers(make_response(f(*args, **kwargs)), result)
+
         return decorated_function
     return decorator
 
@@ -158,18 +363,17 @@ def get_request_key():
             return f"user:{user_id}"
     except Exception:
         pass
-    
+
     return f"ip:{request.remote_addr}"
 
 
 def check_rate_limit(limit_type: str = 'api') -> tuple[bool, int]:
     """
     手动检查速率限制（不使用装饰器）
-    
+
     Returns:
         (是否允许, 重试等待秒数)
     """
     key = get_request_key()
     rate_key = f"{limit_type}:{key}"
     return rate_limiter.is_allowed(rate_key, limit_type)
-
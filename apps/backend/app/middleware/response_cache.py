@@ -4,104 +4,748 @@ API响应缓存中间件
 """
 
 from functools import wraps
-from flask import request, jsonify, current_app
+from flask import g, request, current_app
 import hashlib
+import heapq
 import json
+import math
+import os
+import random
+import sqlite3
+import threading
 import time
-from typing import Dict, Any, Tuple, Callable, Optional
-from datetime import datetime, timedelta
+import zlib
+from collections import OrderedDict
+from typing import Dict, Any, Callable, Iterable, Optional
+
+from app.middleware.compression import response_compressor
+
+
+class _CacheShard:
+    """缓存分片：LRU 顺序、标签索引和过期堆，均由分片锁保护"""
 
-class ResponseCache:
-    """响应缓存管理类"""
-    
     def __init__(self):
-        # cache: { cache_key: (response_data, expire_time) }
-        self.cache: Dict[str, Tuple[Any, float]] = {}
-        self.hit_count = 0
-        self.miss_count = 0
-    
+        self.lock = threading.Lock()
+        # entries: { cache_key: (value, expire_time, size, tags, fresh_until, compute_time) }
+        # expire_time 为旧值也不可再用的时间（fresh_until + stale_ttl）
+        self.entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.tags: Dict[str, set] = {}
+        self.expiry_heap: list = []
+        self.bytes = 0
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+
+class SharedResponseStore:
+    """
+    二级缓存：同一节点所有 worker 共享的 SQLite 响应存储
+
+    - 独立数据库文件（WAL，不要求持久性），不与业务数据库争用写锁
+    - 条目带过期时间和依赖标签，总字节数超过 max_bytes 时删除最早过期的条目
+    - 失效通过 response_cache_invalidations 自增日志广播：
+      各 worker 每隔 sync_interval 秒读取新增记录并清除本进程一级缓存中对应标签
+    - 未命中时通过填充租约避免多个 worker 同时计算同一响应
+    """
+
+    PRUNE_INTERVAL = 60
+    # 失效日志保留时长，需长于最长的缓存 TTL
+    INVALIDATION_RETENTION = 3600
+    FILL_LEASE_SECONDS = 10
+    FILL_WAIT_SECONDS = 2.0
+    FILL_POLL_INTERVAL = 0.05
+
+    def __init__(self, path: str, max_bytes: int = 256 * 1024 * 1024, sync_interval: float = 1.0):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.sync_interval = sync_interval
+        self._local = threading.local()
+        self._sync_lock = threading.Lock()
+        self._last_invalidation_id: Optional[int] = None
+        self._last_sync = 0.0
+        self._last_prune = 0.0
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')
+            conn.executescript('''
+                CREATE TABLE IF NOT EXISTS response_cache_entries (
+                    key TEXT PRIMARY KEY,
+                    body BLOB NOT NULL,
+                    status INTEGER NOT NULL,
+                    headers TEXT NOT NULL, -- JSON [[name, value], ...]
+                    size INTEGER NOT NULL,
+                    expires_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_response_cache_entries_expires
+                    ON response_cache_entries(expires_at);
+                CREATE TABLE IF NOT EXISTS response_cache_tags (
+                    tag TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    PRIMARY KEY (tag, key)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS idx_response_cache_tags_key ON response_cache_tags(key);
+                CREATE TABLE IF NOT EXISTS response_cache_invalidations (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    tag TEXT NOT NULL, -- '*' 表示全部清除
+                    created_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS response_cache_fills (
+                    key TEXT PRIMARY KEY,
+                    expires_at REAL NOT NULL
+                ) WITHOUT ROWID;
+            ''')
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str, now: float) -> Optional[tuple]:
+        """读取未过期条目，返回 ((body, status, headers), expires_at, tags)"""
+        row = self._conn().execute(
+            '''SELECT e.body, e.status, e.headers, e.expires_at,
+                      (SELECT json_group_array(t.tag) FROM response_cache_tags t WHERE t.key = e.key)
+               FROM response_cache_entries e
+               WHERE e.key = ? AND e.expires_at > ?''',
+            (key, now)
+        ).fetchone()
+        if row is None:
+            return None
+        value = (row[0], row[1], [tuple(header) for header in json.loads(row[2])])
+        return value, row[3], json.loads(row[4])
+
+    def latest_invalidation_id(self) -> int:
+        """当前失效日志位置，写入条目时用于判断计算期间是否发生过失效"""
+        row = self._conn().execute('SELECT MAX(id) FROM response_cache_invalidations').fetchone()
+        return row[0] or 0
+
+    def put(self, key: str, value: tuple, expires_at: float, size: int, tags: Iterable[str],
+            since_id: int) -> bool:
+        """
+        写入条目（计算期间相关标签已失效时放弃写入）
+
+        Returns:
+            是否写入
+        """
+        body, status, headers = value
+        tags = list(tags)
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            placeholders = ','.join('?' * (len(tags) + 1))
+            stale = conn.execute(
+                f'''SELECT 1 FROM response_cache_invalidations
+                    WHERE id > ? AND tag IN ({placeholders})
+                    LIMIT 1''',
+                [since_id, '*', *tags]
+            ).fetchone()
+            if not stale:
+                conn.execute(
+                    '''INSERT OR REPLACE INTO response_cache_entries
+                       (key, body, status, headers, size, expires_at)
+                       VALUES (?, ?, ?, ?, ?, ?)''',
+                    (key, body, status, json.dumps(headers), size, expires_at)
+                )
+                conn.execute('DELETE FROM response_cache_tags WHERE key = ?', (key,))
+                conn.executemany(
+                    'INSERT INTO response_cache_tags (tag, key) VALUES (?, ?)',
+                    [(tag, key) for tag in tags]
+                )
+            conn.execute('DELETE FROM response_cache_fills WHERE key = ?', (key,))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+        now = time.time()
+        if now - self._last_prune >= self.PRUNE_INTERVAL:
+            self._last_prune = now
+            self.prune(now)
+        return not stale
+
+    def claim_fill(self, key: str, now: float) -> bool:
+        """尝试取得填充租约（租约过期视为持有者已退出）"""
+        cursor = self._conn().execute(
+            '''INSERT INTO response_cache_fills (key, expires_at) VALUES (:key, :expires_at)
+               ON CONFLICT(key) DO UPDATE SET expires_at = excluded.expires_at
+               WHERE response_cache_fills.expires_at <= :now''',
+            {'key': key, 'expires_at': now + self.FILL_LEASE_SECONDS, 'now': now}
+        )
+        return cursor.rowcount == 1
+
+    def release_fill(self, key: str):
+        self._conn().execute('DELETE FROM response_cache_fills WHERE key = ?', (key,))
+
+    def wait_for_fill(self, key: str) -> Optional[tuple]:
+        """等待其他 worker 完成填充，超时返回 None"""
+        deadline = time.time() + self.FILL_WAIT_SECONDS
+        while time.time() < deadline:
+            time.sleep(self.FILL_POLL_INTERVAL)
+            now = time.time()
+            found = self.get(key, now)
+            if found is not None:
+                return found
+            if not self._conn().execute(
+                'SELECT 1 FROM response_cache_fills WHERE key = ? AND expires_at > ?', (key, now)
+            ).fetchone():
+                # 持有者已放弃（例如响应不可缓存）
+                return None
+        return None
+
+    def publish_invalidation(self, tags: Iterable[str]):
+        """删除带有指定标签的条目并写入失效日志（'*' 表示全部）"""
+        tags = list(tags)
+        conn = self._conn()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany(
+                'INSERT INTO response_cache_invalidations (tag, created_at) VALUES (?, ?)',
+                [(tag, now) for tag in tags]
+            )
+            if '*' in tags:
+                conn.execute('DELETE FROM response_cache_entries')
+                conn.execute('DELETE FROM response_cache_tags')
+            else:
+                placeholders = ','.join('?' * len(tags))
+                conn.execute(
+                    f'''DELETE FROM response_cache_entries WHERE key IN (
+                            SELECT key FROM response_cache_tags WHERE tag IN ({placeholders})
+                        )''',
+                    tags
+                )
+                conn.execute(
+                    f'''DELETE FROM response_cache_tags WHERE key IN (
+                            SELECT key FROM response_cache_tags WHERE tag IN ({placeholders})
+                        )''',
+                    tags
+                )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def poll_invalidations(self, now: float) -> Optional[list]:
+        """
+        读取其他 worker 发布的失效标签（每 sync_interval 秒最多一次）
+
+        Returns:
+            新增的失效标签；None 表示距离上次同步的日志已被清理，需要清空一级缓存
+        """
+        if now - self._last_sync < self.sync_interval:
+            return []
+        with self._sync_lock:
+            if now - self._last_sync < self.sync_interval:
+                return []
+            self._last_sync = now
+
+            if self._last_invalidation_id is None:
+                self._last_invalidation_id = self.latest_invalidation_id()
+                return []
+
+            rows = self._conn().execute(
+                'SELECT id, tag FROM response_cache_invalidations WHERE id > ? ORDER BY id',
+                (self._last_invalidation_id,)
+            ).fetchall()
+            if not rows:
+                return []
+
+            # 日志 id 连续递增，出现缺口说明中间记录已被清理
+            missed = rows[0][0] != self._last_invalidation_id + 1
+            self._last_invalidation_id = rows[-1][0]
+            if missed:
+                return None
+            return [row[1] for row in rows]
+
+    def prune(self, now: float = None):
+        """清理过期条目、过期租约和旧失效日志，并将总大小控制在 max_bytes 以内"""
+        now = now or time.time()
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('''
+                DELETE FROM response_cache_tags WHERE key IN (
+                    SELECT key FROM response_cache_entries WHERE expires_at <= ?
+                )
+            ''', (now,))
+            conn.execute('DELETE FROM response_cache_entries WHERE expires_at <= ?', (now,))
+            conn.execute('DELETE FROM response_cache_fills WHERE expires_at <= ?', (now,))
+            conn.execute(
+                'DELETE FROM response_cache_invalidations WHERE created_at < ?',
+                (now - self.INVALIDATION_RETENTION,)
+            )
+
+            excess = conn.execute(
+                'SELECT COALESCE(SUM(size), 0) FROM response_cache_entries'
+            ).fetchone()[0] - self.max_bytes
+            if excess > 0:
+                victims = []
+                for key, size in conn.execute(
+                    'SELECT key, size FROM response_cache_entries ORDER BY expires_at'
+                ):
+                    victims.append((key,))
+                    excess -= size
+                    if excess <= 0:
+                        break
+                conn.executemany('DELETE FROM response_cache_tags WHERE key = ?', victims)
+                conn.executemany('DELETE FROM response_cache_entries WHERE key = ?', victims)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def get_stats(self) -> Dict[str, Any]:
+        row = self._conn().execute(
+            'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM response_cache_entries'
+        ).fetchone()
+        return {
+            'path': self.path,
+            'items': row[0],
+            'bytes': row[1],
+            'max_bytes': self.max_bytes,
+            'last_invalidation_id': self._last_invalidation_id
+        }
+
+
+class ResponseCache:
+    """
+    响应缓存管理类
+
+    - 按 key 哈希分片，每个分片独立加锁，维护 LRU 顺序
+    - 限制条目总数和总字节数，超出时淘汰最久未使用的条目
+    - 条目携带依赖标签（如 user:42、settings），按标签失效只触及相关条目
+    - 每个分片维护过期时间最小堆，读写时顺带清除已过期条目
+    - 条目过期后可在 stale_ttl 内继续作为旧值返回，同时由单个请求刷新
+    - 可选二级缓存（RESPONSE_CACHE_L2=sqlite，见 SharedResponseStore），
+      一级未命中时从共享存储读取，失效广播到所有 worker
+    """
+
+    SHARDS = 8
+    # lock_on_miss 时等待其他请求完成计算的最长时间（秒）
+    REFRESH_WAIT_SECONDS = 5.0
+
+    def __init__(self, max_entries: int = 5000, max_bytes: int = 64 * 1024 * 1024):
+        self.shards = [_CacheShard() for _ in range(self.SHARDS)]
+        self.shared: Optional[SharedResponseStore] = None
+        self.shared_hits = 0
+        self.shared_errors = 0
+        # 正在刷新的 key -> 完成事件（本进程内）
+        self._refreshing: Dict[str, threading.Event] = {}
+        self._refresh_lock = threading.Lock()
+        self.refreshes = 0
+        self.configure(max_entries, max_bytes)
+
+    def configure(self, max_entries: int, max_bytes: int):
+        """设置容量上限（平均分配到各分片）"""
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._shard_entries = max(1, max_entries // self.SHARDS)
+        self._shard_bytes = max(1, max_bytes // self.SHARDS)
+
+    def init_app(self, app):
+        """读取缓存容量配置，按需启用二级共享缓存"""
+        self.configure(
+            int(app.config.get('RESPONSE_CACHE_MAX_ENTRIES', self.max_entries)),
+            int(app.config.get('RESPONSE_CACHE_MAX_BYTES', self.max_bytes))
+        )
+        if app.config.get('RESPONSE_CACHE_L2') == 'sqlite':
+            path = app.config.get('RESPONSE_CACHE_L2_PATH') or os.path.join(app.instance_path, 'response_cache.db')
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.shared = SharedResponseStore(
+                path,
+                int(app.config.get('RESPONSE_CACHE_L2_MAX_BYTES', 256 * 1024 * 1024)),
+                float(app.config.get('RESPONSE_CACHE_L2_SYNC_INTERVAL', 1.0))
+            )
+        else:
+            self.shared = None
+
+    def _shared_failed(self, error: Exception):
+        """二级缓存出错时退化为仅一级缓存，不影响请求"""
+        self.shared_errors += 1
+        current_app.logger.warning(f"二级响应缓存访问失败: {str(error)}")
+
+    def fetch(self, key: str, lock_on_miss: bool = False, early_expiry_beta: float = 0.0) -> tuple:
+        """
+        依次查询一级、二级缓存
+
+        - 条目已过期但仍在 stale_ttl 内时：只有一个请求取得刷新权并重新计算，其余请求直接返回旧值
+        - early_expiry_beta > 0 时按计算耗时概率性提前刷新（XFetch），避免大量请求在 TTL 边界同时未命中
+        - 完全未命中且 lock_on_miss 时，本进程内同一 key 只有一个请求计算，其余等待结果；
+          启用二级缓存时通过填充租约在 worker 之间做同样的协调
+
+        Returns:
+            (缓存值或 None, 填充令牌)；返回 None 时调用方计算响应，并将令牌原样传给 store 或 abandon_fill
+        """
+        if self.shared is not None:
+            try:
+                tags = self.shared.poll_invalidations(time.time())
+                if tags is None:
+                    self._invalidate_local()
+                elif tags:
+                    self._invalidate_local(*tags)
+            except sqlite3.Error as e:
+                self._shared_failed(e)
+
+        value, fresh = self._lookup(key, early_expiry_beta)
+        if value is not None:
+            if fresh or not self._begin_refresh(key):
+                return value, None
+            # 取得刷新权：其他 worker 已写入新值时直接采用，否则由本请求重新计算，其他请求继续使用旧值
+            shared_value = self._get_shared(key)
+            if shared_value is not None:
+                self._end_refresh(key)
+                return shared_value, None
+            return None, {'since_id': self._latest_invalidation_id(), 'claimed': False, 'refreshing': True}
+
+        refreshing = False
+        if lock_on_miss:
+            refreshing = self._begin_refresh(key)
+            if not refreshing:
+                value = self._wait_for_refresh(key)
+                if value is not None:
+                    return value, None
+
+        if self.shared is None:
+            return None, {'since_id': 0, 'claimed': False, 'refreshing': refreshing}
+
+        try:
+            now = time.time()
+            since_id = self.shared.latest_invalidation_id()
+            found = self.shared.get(key, now)
+            claimed = False
+            if found is None:
+                claimed = self.shared.claim_fill(key, now)
+                if not claimed:
+                    found = self.shared.wait_for_fill(key)
+                    since_id = self.shared.latest_invalidation_id()
+        except sqlite3.Error as e:
+            self._shared_failed(e)
+            return None, {'since_id': 0, 'claimed': False, 'refreshing': refreshing, 'local_only': True}
+
+        if found is not None:
+            value, expires_at, tags = found
+            self.shared_hits += 1
+            self.set(key, value, expires_at - time.time(), size=len(value[0]), tags=tags)
+            if refreshing:
+                self._end_refresh(key)
+            return value, None
+        return None, {'since_id': since_id, 'claimed': claimed, 'refreshing': refreshing}
+
+    def store(self, key: str, value: tuple, ttl_seconds: int, size: int, tags: Iterable[str],
+              fill_token: Optional[dict] = None, stale_ttl: int = 0, compute_time: float = 0.0):
+        """写入一级缓存，启用二级缓存时同时写入共享存储"""
+        tags = frozenset(tags)
+        try:
+            self.set(key, value, ttl_seconds, size=size, tags=tags,
+                     stale_ttl=stale_ttl, compute_time=compute_time)
+            if self.shared is None or fill_token is None or fill_token.get('local_only'):
+                return
+            try:
+                # 二级缓存只保存新鲜期，过期后的旧值由各 worker 的一级缓存提供
+                self.shared.put(key, value, time.time() + ttl_seconds, size + len(key), tags,
+                                fill_token['since_id'])
+            except sqlite3.Error as e:
+                self._shared_failed(e)
+        finally:
+            if fill_token and fill_token.get('refreshing'):
+                self._end_refresh(key)
+
+    def abandon_fill(self, key: str, fill_token: Optional[dict]):
+        """响应不可缓存或计算失败时释放刷新权和填充租约，让等待的请求自行计算"""
+        if not fill_token:
+            return
+        if fill_token.get('refreshing'):
+            self._end_refresh(key)
+        if self.shared is None or not fill_token['claimed']:
+            return
+        try:
+            self.shared.release_fill(key)
+        except sqlite3.Error as e:
+            self._shared_failed(e)
+
+    def _get_shared(self, key: str) -> Optional[Any]:
+        """从二级缓存读取新鲜条目并写入一级缓存"""
+        if self.shared is None:
+            return None
+        try:
+            found = self.shared.get(key, time.time())
+        except sqlite3.Error as e:
+            self._shared_failed(e)
+            return None
+        if found is None:
+            return None
+        value, expires_at, tags = found
+        self.shared_hits += 1
+        self.set(key, value, expires_at - time.time(), size=len(value[0]), tags=tags)
+        return value
+
+    def _latest_invalidation_id(self) -> int:
+        if self.shared is None:
+            return 0
+        try:
+            return self.shared.latest_invalidation_id()
+        except sqlite3.Error as e:
+            self._shared_failed(e)
+            return 0
+
+    def _begin_refresh(self, key: str) -> bool:
+        """取得 key 的刷新权（本进程内同一时刻只有一个请求持有）"""
+        with self._refresh_lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing[key] = threading.Event()
+            self.refreshes += 1
+            return True
+
+    def _end_refresh(self, key: str):
+        with self._refresh_lock:
+            event = self._refreshing.pop(key, None)
+        if event is not None:
+            event.set()
+
+    def _wait_for_refresh(self, key: str) -> Optional[Any]:
+        """等待持有刷新权的请求完成，返回其写入的值（超时或未写入时返回 None）"""
+        with self._refresh_lock:
+            event = self._refreshing.get(key)
+        if event is not None:
+            event.wait(self.REFRESH_WAIT_SECONDS)
+        value, _ = self._lookup(key)
+        return value
+
+    def _shard(self, key: str) -> _CacheShard:
+        return self.shards[zlib.crc32(key.encode()) % self.SHARDS]
+
     def get(self, key: str) -> Optional[Any]:
         """
         获取缓存的响应
         :param key: 缓存键
         :return: 缓存的响应数据，如果不存在或过期则返回None
         """
-        if key in self.cache:
-            data, expire_time = self.cache[key]
-            if time.time() < expire_time:
-                self.hit_count += 1
-                current_app.logger.debug(f"✅ Cache HIT: {key}")
-                return data
+        value, fresh = self._lookup(key)
+        return value if fresh else None
+
+    def _lookup(self, key: str, early_expiry_beta: float = 0.0) -> tuple:
+        """
+        查询一级缓存
+        :return: (缓存值或 None, 是否新鲜)；过期但在 stale_ttl 内的条目返回 (旧值, False)
+        """
+        shard = self._shard(key)
+        now = time.time()
+        with shard.lock:
+            self._expire(shard, now)
+            entry = shard.entries.get(key)
+            if entry is None:
+                shard.misses += 1
+                return None, False
+
+            shard.entries.move_to_end(key)
+            value, _, _, _, fresh_until, compute_time = entry
+            fresh = now < fresh_until
+            if fresh and early_expiry_beta > 0 and compute_time > 0:
+                # XFetch：剩余有效期越短、计算越慢，越可能提前刷新
+                fresh = now - compute_time * early_expiry_beta * math.log(random.random() or 1e-12) < fresh_until
+            if fresh:
+                shard.hits += 1
             else:
-                # 缓存已过期，删除
-                del self.cache[key]
-                current_app.logger.debug(f"⏰ Cache EXPIRED: {key}")
-        
-        self.miss_count += 1
-        current_app.logger.debug(f"❌ Cache MISS: {key}")
-        return None
-    
-    def set(self, key: str, value: Any, ttl_seconds: int):
+                shard.stale_hits += 1
+            return value, fresh
+
+    def set(self, key: str, value: Any, ttl_seconds: int, size: int = 0, tags: Iterable[str] = (),
+            stale_ttl: int = 0, compute_time: float = 0.0):
         """
         设置缓存
         :param key: 缓存键
         :param value: 要缓存的响应数据
         :param ttl_seconds: 过期时间（秒）
+        :param size: 条目大小（字节），计入字节预算
+        :param tags: 依赖标签，用于 invalidate_tags
+        :param stale_ttl: 过期后仍可作为旧值返回的时长（秒）
+        :param compute_time: 生成该响应的耗时（秒），用于概率提前刷新
         """
-        expire_time = time.time() + ttl_seconds
-        self.cache[key] = (value, expire_time)
-        current_app.logger.debug(f"💾 Cache SET: {key}, TTL: {ttl_seconds}s")
-    
+        shard = self._shard(key)
+        size = size + len(key)
+        if size > self._shard_bytes:
+            return
+
+        now = time.time()
+        fresh_until = now + ttl_seconds
+        expire_time = fresh_until + stale_ttl
+        tags = frozenset(tags)
+        with shard.lock:
+            self._expire(shard, now)
+            if key in shard.entries:
+                self._remove(shard, key)
+
+            shard.entries[key] = (value, expire_time, size, tags, fresh_until, compute_time)
+            shard.bytes += size
+            for tag in tags:
+                shard.tags.setdefault(tag, set()).add(key)
+            heapq.heappush(shard.expiry_heap, (expire_time, key))
+
+            while len(shard.entries) > self._shard_entries or shard.bytes > self._shard_bytes:
+                oldest_key = next(iter(shard.entries))
+                self._remove(shard, oldest_key)
+                shard.evictions += 1
+
+            # 覆盖写入和 LRU 淘汰会在堆中留下失效项，过多时重建
+            if len(shard.expiry_heap) > 2 * len(shard.entries) + 64:
+                shard.expiry_heap = [(entry[1], k) for k, entry in shard.entries.items()]
+                heapq.heapify(shard.expiry_heap)
+
+    def _remove(self, shard: _CacheShard, key: str):
+        _, _, size, tags, _, _ = shard.entries.pop(key)
+        shard.bytes -= size
+        for tag in tags:
+            keys = shard.tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del shard.tags[tag]
+
+    def _expire(self, shard: _CacheShard, now: float):
+        heap = shard.expiry_heap
+        while heap and heap[0][0] <= now:
+            expire_time, key = heapq.heappop(heap)
+            entry = shard.entries.get(key)
+            # 只删除与堆项对应的那次写入
+            if entry is not None and entry[1] == expire_time:
+                self._remove(shard, key)
+                shard.expirations += 1
+
+    def invalidate_tags(self, *tags: str) -> int:
+        """
+        清除带有任一指定标签的缓存条目（启用二级缓存时广播到所有 worker）
+        :return: 本进程清除的条目数
+        """
+        if self.shared is not None:
+            try:
+                self.shared.publish_invalidation(tags)
+            except sqlite3.Error as e:
+                self._shared_failed(e)
+        return self._invalidate_local(*tags)
+
+    def _invalidate_local(self, *tags: str) -> int:
+        """清除本进程一级缓存中带有指定标签的条目，不传标签时全部清除"""
+        if not tags or '*' in tags:
+            count = 0
+            for shard in self.shards:
+                with shard.lock:
+                    count += len(shard.entries)
+                    shard.invalidations += len(shard.entries)
+                    shard.entries.clear()
+                    shard.tags.clear()
+                    shard.expiry_heap = []
+                    shard.bytes = 0
+            return count
+
+        removed = 0
+        for shard in self.shards:
+            with shard.lock:
+                shard_removed = 0
+                for tag in tags:
+                    for key in list(shard.tags.get(tag, ())):
+                        self._remove(shard, key)
+                        shard_removed += 1
+                shard.invalidations += shard_removed
+            removed += shard_removed
+        if removed:
+            current_app.logger.debug(f"🗑️  Invalidated {removed} cache entries tagged {tags}")
+        return removed
+
     def invalidate(self, pattern: Optional[str] = None):
         """
         清除缓存
-        :param pattern: 如果提供，只清除匹配该模式的键；否则清除所有缓存
+        :param pattern: 如果提供，只清除该视图函数的缓存（等价于标签 endpoint:<pattern>）；否则清除所有缓存
         """
         if pattern:
-            keys_to_delete = [k for k in self.cache.keys() if pattern in k]
-            for key in keys_to_delete:
-                del self.cache[key]
-            current_app.logger.info(f"🗑️  Invalidated {len(keys_to_delete)} cache entries matching '{pattern}'")
-        else:
-            count = len(self.cache)
-            self.cache.clear()
-            current_app.logger.info(f"🗑️  Cleared all {count} cache entries")
-    
+            self.invalidate_tags(f"endpoint:{pattern}")
+            return
+
+        count = self.invalidate_tags('*')
+        current_app.logger.info(f"🗑️  Cleared all {count} cache entries")
+
     def get_stats(self) -> Dict[str, Any]:
         """获取缓存统计信息"""
-        total_requests = self.hit_count + self.miss_count
-        hit_rate = (self.hit_count / total_requests * 100) if total_requests > 0 else 0
-        
-        return {
-            'total_cached_items': len(self.cache),
-            'hit_count': self.hit_count,
-            'miss_count': self.miss_count,
+        totals = {'items': 0, 'bytes': 0, 'hits': 0, 'stale_hits': 0, 'misses': 0,
+                  'evictions': 0, 'expirations': 0, 'invalidations': 0}
+        for shard in self.shards:
+            with shard.lock:
+                totals['items'] += len(shard.entries)
+                totals['bytes'] += shard.bytes
+                totals['hits'] += shard.hits
+                totals['stale_hits'] += shard.stale_hits
+                totals['misses'] += shard.misses
+                totals['evictions'] += shard.evictions
+                totals['expirations'] += shard.expirations
+                totals['invalidations'] += shard.invalidations
+
+        total_requests = totals['hits'] + totals['stale_hits'] + totals['misses']
+        hit_rate = ((totals['hits'] + totals['stale_hits']) / total_requests * 100) if total_requests > 0 else 0
+
+        stats = {
+            'total_cached_items': totals['items'],
+            'total_bytes': totals['bytes'],
+            'max_entries': self.max_entries,
+            'max_bytes': self.max_bytes,
+            'hit_count': totals['hits'],
+            'stale_hit_count': totals['stale_hits'],
+            'refresh_count': self.refreshes,
+            'miss_count': totals['misses'],
+            'eviction_count': totals['evictions'],
+            'expired_count': totals['expirations'],
+            'invalidated_count': totals['invalidations'],
             'hit_rate': f"{hit_rate:.2f}%"
         }
-    
+        if self.shared is not None:
+            try:
+                stats['shared'] = self.shared.get_stats()
+            except sqlite3.Error as e:
+                self._shared_failed(e)
+                stats['shared'] = None
+            stats['shared_hit_count'] = self.shared_hits
+            stats['shared_error_count'] = self.shared_errors
+        return stats
+
     def cleanup_expired(self):
         """清理所有过期的缓存条目"""
         now = time.time()
-        expired_keys = [k for k, (_, expire_time) in self.cache.items() if now >= expire_time]
-        for key in expired_keys:
-            del self.cache[key]
-        
-        if expired_keys:
-            current_app.logger.info(f"🧹 Cleaned up {len(expired_keys)} expired cache entries")
+        before = sum(shard.expirations for shard in self.shards)
+        for shard in self.shards:
+            with shard.lock:
+                self._expire(shard, now)
+        expired = sum(shard.expirations for shard in self.shards) - before
+
+        if expired:
+            current_app.logger.info(f"🧹 Cleaned up {expired} expired cache entries")
+
 
 # 全局缓存实例
 response_cache = ResponseCache()
 
-def cache_response(ttl: int = 60, use_user_id: bool = True, use_query_string: bool = True):
+
+def cache_response(ttl: int = 60, use_user_id: bool = True, use_query_string: bool = True,
+                   tags: Iterable[str] = (), stale_ttl: int = 0, lock_on_miss: bool = False,
+                   early_expiry_beta: float = 0.0):
     """
     响应缓存装饰器
-    
+
     :param ttl: 缓存过期时间（秒），默认60秒
-    :param use_user_id: 是否将用户ID作为缓存key的一部分，默认True
+    :param use_user_id: 是否将用户ID作为缓存key的一部分，默认True（同时自动添加 user:<id> 标签）
     :param use_query_string: 是否将查询字符串作为缓存key的一部分，默认True
-    
+    :param tags: 额外的依赖标签，可包含 {user_id} 占位符
+    :param stale_ttl: 过期后继续返回旧值的时长（秒），期间只有一个请求重新计算
+    :param lock_on_miss: 完全未命中时同一 key 只由一个请求计算，其余请求等待结果
+    :param early_expiry_beta: 概率提前刷新系数（通常为 1.0），0 表示不提前
+
+    缓存的是响应体、状态码和响应头，命中时重新构造响应对象，
+    不会在请求之间共享同一个 Response 实例。
+
     使用示例:
-    @cache_response(ttl=600, use_user_id=False)  # 所有用户共享缓存，10分钟过期
+    @cache_response(ttl=600, use_user_id=False, tags=['settings'])  # 所有用户共享缓存，10分钟过期
     def get_public_data():
         ...
     """
@@ -110,7 +754,8 @@ def cache_response(ttl: int = 60, use_user_id: bool = True, use_query_string: bo
         def decorated_function(*args: Any, **kwargs: Any) -> Any:
             # 生成缓存key
             cache_key_parts = [f.__name__]
-            
+            user_id = None
+
             # 如果需要，添加用户ID
             if use_user_id:
                 from flask_jwt_extended import get_jwt_identity
@@ -120,47 +765,88 @@ def cache_response(ttl: int = 60, use_user_id: bool = True, use_query_string: bo
                 except RuntimeError:
                     # 未认证的请求，使用IP地址
                     cache_key_parts.append(f"ip_{request.remote_addr}")
-            
+
             # 如果需要，添加查询字符串
             if use_query_string and request.query_string:
                 cache_key_parts.append(request.query_string.decode('utf-8'))
-            
+
+            # 外层 user_version_etag 已读取数据版本时一并加入，
+            # 保证带新 ETag 的响应不会取到版本变化前的缓存
+            data_version = g.get('user_data_version')
+            if data_version is not None:
+                cache_key_parts.append(f"v{data_version}")
+
             # 添加请求方法
             cache_key_parts.append(request.method)
-            
+
             # 生成MD5哈希作为缓存key
             cache_key_str = ':'.join(cache_key_parts)
             cache_key = hashlib.md5(cache_key_str.encode()).hexdigest()
-            
-            # 检查缓存
-            cached_response = response_cache.get(cache_key)
-            if cached_response is not None:
-                # 返回缓存的响应
-                return cached_response
-            
+
+            # 检查缓存（一级未命中时查询二级共享缓存）
+            cached, fill_token = response_cache.fetch(cache_key, lock_on_miss, early_expiry_beta)
+            if cached is not None:
+                body, status, headers = cached
+                body, headers = response_compressor.decode_cached(body, headers)
+                return current_app.response_class(body, status=status, headers=headers)
+
             # 执行原函数
-            result = f(*args, **kwargs)
-            
-            # 只缓存成功的响应（状态码200）
-            if isinstance(result, tuple):
-                response_data, status_code = result[0], result[1] if len(result) > 1 else 200
-            else:
-                response_data = result
-                status_code = 200
-            
-            if status_code == 200:
-                response_cache.set(cache_key, result, ttl)
-            
-            return result
-        
+            started = time.perf_counter()
+            try:
+                response = current_app.make_response(f(*args, **kwargs))
+            except Exception:
+                response_cache.abandon_fill(cache_key, fill_token)
+                raise
+            compute_time = time.perf_counter() - started
+
+            try:
+                # 只缓存成功的响应（状态码200），流式响应不缓存
+                if response.status_code == 200 and not response.is_streamed:
+                    # 文本响应以 gzip 形式缓存，命中时不再重复压缩
+                    body, headers = response_compressor.encode_for_cache(response, response.get_data())
+                    entry_tags = {f"endpoint:{f.__name__}"}
+                    if user_id:
+                        entry_tags.add(f"user:{user_id}")
+                    entry_tags.update(tag.format(user_id=user_id) for tag in tags)
+                    response_cache.store(
+                        cache_key,
+                        (body, response.status_code, headers),
+                        ttl,
+                        size=len(body),
+                        tags=entry_tags,
+                        fill_token=fill_token,
+                        stale_ttl=stale_ttl,
+                        compute_time=compute_time
+                    )
+                    fill_token = None
+            finally:
+                # 不可缓存，或编码 / 写入失败时释放刷新权和填充租约，
+                # 否则同一 key 之后的 lock_on_miss 请求都要等满 REFRESH_WAIT_SECONDS
+                response_cache.abandon_fill(cache_key, fill_token)
+
+            return response
+
         return decorated_function
     return decorator
 
+
+def invalidate_cache_tags(*tags: str) -> int:
+    """
+    辅助函数：按标签清除缓存
+    数据变更后调用，清除依赖该数据的缓存响应
+
+    使用示例:
+    Creation.delete(creation_id, user_id)
+    invalidate_cache_tags(f'user:{user_id}')
+    """
+    return response_cache.invalidate_tags(*tags)
+
+
 def invalidate_cache_by_pattern(pattern: str):
     """
-    辅助函数：按模式清除缓存
+    辅助函数：清除指定视图函数的缓存
     可以在视图函数中调用，当数据更新时清除相关缓存
-    
+
     使用示例:
     @app.route('/api/settings', methods=['PUT'])
     def update_settings():
@@ -170,7 +856,7 @@ def invalidate_cache_by_pattern(pattern: str):
     """
     response_cache.invalidate(pattern)
 
+
 def get_cache_stats() -> Dict[str, Any]:
     """获取缓存统计信息"""
     return response_cache.get_stats()
-
@@ -0,0 +1,56 @@
+"""
+次数预留清理线程
+定期过期超时未结算的次数预留并退还次数（见 app.database.CreditHold）
+"""
+import os
+import threading
+
+
+class CreditHoldSweeper:
+    """
+    后台清理线程
+
+    每个进程启动一个守护线程，多进程部署时各自清理也是安全的：
+    预留状态由条件 UPDATE 转换，同一预留只会被过期一次。
+    """
+
+    _thread = None
+    _lock = threading.Lock()
+    _stop_event = threading.Event()
+
+    @classmethod
+    def init_app(cls, app):
+        """按配置启动清理线程（测试环境和 reloader 父进程中不启动）"""
+        interval = app.config.get('CREDIT_HOLD_SWEEP_INTERVAL', 60)
+        if not interval or app.testing:
+            return
+        if app.debug and os.environ.get('WERKZEUG_RUN_MAIN') != 'true':
+            return
+
+        with cls._lock:
+            if cls._thread and cls._thread.is_alive():
+                return
+            cls._stop_event.clear()
+            cls._thread = threading.Thread(
+                target=cls._run, args=(app, interval), name='credit-hold-sweeper', daemon=True
+            )
+            cls._thread.start()
+
+    @classmethod
+    def stop(cls):
+        """停止清理线程"""
+        cls._stop_event.set()
+
+    @classmethod
+    def _run(cls, app, interval: float):
+        from app.database import CreditHold
+
+        # 应用上下文退出时由 teardown_appcontext 关闭数据库连接
+        while not cls._stop_event.wait(interval):
+            with app.app_context():
+                try:
+                    expired = CreditHold.expire_stale()
+                    if expired:
+                        app.logger.info(f"已过期 {expired} 个超时次数预留并退还次数")
+                except Exception as e:
+                    app.logger.error(f"清理次数预留失败: {str(e)}")
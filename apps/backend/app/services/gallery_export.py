@@ -0,0 +1,227 @@
+"""
+画廊导出
+以生成器逐块输出 ZIP 归档：图片按有限并发获取、边获取边写出，不在内存中缓存整个归档
+"""
+import asyncio
+import json
+import mimetypes
+import os
+import tempfile
+import threading
+import zipfile
+from collections import deque
+from datetime import datetime
+from typing import Any, Iterator, Optional, Tuple
+from urllib.parse import urlparse
+
+import aiohttp
+
+
+class _ZipStream:
+    """ZipFile 的只写输出目标（不可 seek，条目使用数据描述符），写入的字节由生成器取走"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+class GalleryExporter:
+    """
+    用户画廊 ZIP 导出
+
+    - 作品按 id 分批读取（keyset 分页），不一次性加载全部记录
+    - 远程图片在后台事件循环中获取，最多 CONCURRENCY 张同时在途；
+      按作品顺序写入归档，内存占用与画廊大小无关
+    - 配置了 MIRROR_DIR 且存在本地镜像（<MIRROR_DIR>/<域名>/<路径>）时直接读取本地文件
+    - 图片以 STORED 方式写入（本身已压缩），manifest.json 记录作品元数据和获取失败的原因；
+      manifest 先写入临时文件，最后放入归档
+    """
+
+    CONCURRENCY = 4
+    MAX_IMAGE_BYTES = 10 * 1024 * 1024
+    FETCH_TIMEOUT = 30
+    BATCH_SIZE = 200
+    CHUNK_SIZE = 64 * 1024
+    MIRROR_DIR = ''
+
+    @classmethod
+    def init_app(cls, app):
+        """读取并发数和本地镜像目录配置"""
+        cls.CONCURRENCY = max(1, int(app.config.get('GALLERY_EXPORT_CONCURRENCY', cls.CONCURRENCY)))
+        cls.MIRROR_DIR = app.config.get('GALLERY_EXPORT_MIRROR_DIR') or ''
+
+    @classmethod
+    def stream(cls, user_id: int) -> Iterator[bytes]:
+        """
+        生成 ZIP 归档的字节块（需要在请求上下文中迭代，见 stream_with_context）
+
+        Args:
+            user_id: 作品所有者
+        """
+        from app.database import Creation
+
+        out = _ZipStream()
+        manifest = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+        loop = asyncio.new_event_loop()
+        loop_thread = threading.Thread(target=loop.run_forever, name='gallery-export', daemon=True)
+        loop_thread.start()
+        session = asyncio.run_coroutine_threadsafe(cls._open_session(), loop).result()
+        window = deque()
+        counts = {'total': 0, 'failed': 0}
+
+        try:
+            # manifest 逐条写入：先写对象头部，creations 数组和计数在结束时补全
+            header = json.dumps({
+                'user_id': user_id,
+                'exported_at': datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+            }, ensure_ascii=False)
+            manifest.write(header[:-1].encode('utf-8') + b', "creations": [')
+
+            with zipfile.ZipFile(out, mode='w', compression=zipfile.ZIP_STORED) as archive:
+                for row in Creation.iter_for_export(user_id, cls.BATCH_SIZE):
+                    local_path = cls._local_path(row['image_url'])
+                    source = local_path or asyncio.run_coroutine_threadsafe(
+                        cls._fetch(session, row['image_url']), loop
+                    )
+                    window.append((row, source))
+                    if len(window) >= cls.CONCURRENCY:
+                        yield from cls._write_creation(archive, out, manifest, counts, *window.popleft())
+
+                while window:
+                    yield from cls._write_creation(archive, out, manifest, counts, *window.popleft())
+
+                manifest.write(f'], "total": {counts["total"]}, "failed": {counts["failed"]}}}'.encode('utf-8'))
+                manifest.seek(0)
+                info = zipfile.ZipInfo('manifest.json', datetime.utcnow().timetuple()[:6])
+                info.compress_type = zipfile.ZIP_DEFLATED
+                yield from cls._write_entry(archive, out, info, iter(lambda: manifest.read(cls.CHUNK_SIZE), b''))
+
+            # 中央目录
+            yield out.take()
+        finally:
+            for _, source in window:
+                if not isinstance(source, str):
+                    source.cancel()
+            asyncio.run_coroutine_threadsafe(session.close(), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+            loop_thread.join()
+            loop.close()
+            manifest.close()
+
+    @classmethod
+    def _write_creation(cls, archive, out, manifest, counts, row, source) -> Iterator[bytes]:
+        """写入一张作品图片并追加 manifest 记录"""
+        entry = {
+            'id': row['id'],
+            'file': None,
+            'prompt': row['prompt'],
+            'image_url': row['image_url'],
+            'model_used': row['model_used'],
+            'size': row['size'],
+            'tags': row['tags'],
+            'category': row['category'],
+            'is_favorite': bool(row['is_favorite']),
+            'created_at': row['created_at']
+        }
+
+        try:
+            if isinstance(source, str):
+                content_type = mimetypes.guess_type(source)[0]
+                chunks = cls._read_file(source)
+            else:
+                content_type, data = source.result()
+                chunks = (data[i:i + cls.CHUNK_SIZE] for i in range(0, len(data), cls.CHUNK_SIZE))
+
+            entry['file'] = f"images/{row['id']}{cls._extension(row['image_url'], content_type)}"
+            info = zipfile.ZipInfo(entry['file'], cls._zip_time(row['created_at']))
+            yield from cls._write_entry(archive, out, info, chunks)
+        except Exception as e:
+            entry['file'] = None
+            entry['error'] = str(e) or type(e).__name__
+            counts['failed'] += 1
+
+        if counts['total']:
+            manifest.write(b', ')
+        manifest.write(json.dumps(entry, ensure_ascii=False).encode('utf-8'))
+        counts['total'] += 1
+
+    @staticmethod
+    def _write_entry(archive, out, info, chunks) -> Iterator[bytes]:
+        with archive.open(info, mode='w') as dest:
+            for chunk in chunks:
+                dest.write(chunk)
+                data = out.take()
+                if data:
+                    yield data
+        yield out.take()
+
+    @classmethod
+    def _read_file(cls, path: str) -> Iterator[bytes]:
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(cls.CHUNK_SIZE)
+                if not chunk:
+                    return
+                yield chunk
+
+    @classmethod
+    def _local_path(cls, url: str) -> Optional[str]:
+        """本地镜像路径：<MIRROR_DIR>/<域名>/<路径>，不存在或越出镜像目录时返回 None"""
+        if not cls.MIRROR_DIR or not url:
+            return None
+        parsed = urlparse(url)
+        root = os.path.realpath(cls.MIRROR_DIR)
+        path = os.path.realpath(os.path.join(root, parsed.netloc, parsed.path.lstrip('/')))
+        if not path.startswith(root + os.sep) or not os.path.isfile(path):
+            return None
+        return path
+
+    @staticmethod
+    async def _open_session() -> aiohttp.ClientSession:
+        return aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=GalleryExporter.FETCH_TIMEOUT))
+
+    @classmethod
+    async def _fetch(cls, session: aiohttp.ClientSession, url: str) -> Tuple[str, bytes]:
+        """获取远程图片（与 /gallery/proxy-image 相同的类型和大小限制）"""
+        if not url or not url.startswith(('http://', 'https://')):
+            raise ValueError('无效的图片URL')
+
+        async with session.get(url) as response:
+            if response.status != 200:
+                raise ValueError(f"HTTP {response.status}")
+            content_type = response.headers.get('content-type', '').split(';')[0].strip()
+            if not content_type.startswith('image/'):
+                raise ValueError(f"不是有效的图片类型: {content_type}")
+
+            data = bytearray()
+            async for chunk in response.content.iter_chunked(cls.CHUNK_SIZE):
+                data.extend(chunk)
+                if len(data) > cls.MAX_IMAGE_BYTES:
+                    raise ValueError('图片文件过大（超过10MB）')
+            return content_type, bytes(data)
+
+    @staticmethod
+    def _extension(url: str, content_type: Optional[str]) -> str:
+        ext = os.path.splitext(urlparse(url).path)[1].lower()
+        if ext in ('.png', '.jpg', '.jpeg', '.webp', '.gif'):
+            return ext
+        return (content_type and mimetypes.guess_extension(content_type)) or '.png'
+
+    @staticmethod
+    def _zip_time(created_at: Any) -> Tuple[int, ...]:
+        try:
+            moment = datetime.strptime(str(created_at)[:19], '%Y-%m-%d %H:%M:%S')
+        except ValueError:
+            moment = datetime.utcnow()
+        return moment.timetuple()[:6] if moment.year >= 1980 else (1980, 1, 1, 0, 0, 0)
@@ -0,0 +1,172 @@
+"""
+密码哈希进程池
+PBKDF2 计算放到独立进程执行，登录高峰不占用请求线程的 CPU 和 GIL
+"""
+import time
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+class PasswordHasherBusy(Exception):
+    """哈希队列已满或等待超时，调用方应返回 503 让客户端稍后重试"""
+
+
+def _hash(password: str) -> str:
+    return generate_password_hash(password, method='pbkdf2:sha256')
+
+
+def _verify(stored_hash: str, password: str) -> bool:
+    return check_password_hash(stored_hash, password)
+
+
+class PasswordHasher:
+    """
+    有界密码哈希进程池
+
+    - 进程池首次使用时创建（spawn 方式，不继承父进程的线程和数据库连接）；
+      spawn 子进程会以 __mp_main__ 重新导入主脚本，入口脚本（app.py / wsgi.py）
+      须把 create_app() 放在 __name__ != '__mp_main__' 判断内，否则每个哈希进程
+      都会初始化数据库并启动后台服务
+    - 排队 + 执行中的任务数不超过 MAX_QUEUE，超出立即拒绝
+    - 单次等待超过 TIMEOUT 秒视为失败
+    - WORKERS 为 0 或测试环境时在当前线程直接计算；
+      未经 init_app 配置时（独立脚本）也在当前线程计算
+    """
+
+    _executor = None
+    _lock = threading.Lock()
+    _slots = None
+
+    WORKERS = 0
+    MAX_QUEUE = 32
+    TIMEOUT = 5.0
+
+    _stats = {'submitted': 0, 'completed': 0, 'rejected': 0, 'timeouts': 0, 'errors': 0}
+    _latencies = deque(maxlen=500)
+    _in_flight = 0
+
+    @classmethod
+    def init_app(cls, app):
+        """读取进程池配置（进程在首次哈希时才启动）"""
+        cls.WORKERS = 0 if app.testing else int(app.config.get('PASSWORD_HASH_WORKERS', 2))
+        cls.MAX_QUEUE = int(app.config.get('PASSWORD_HASH_MAX_QUEUE', cls.MAX_QUEUE))
+        cls.TIMEOUT = float(app.config.get('PASSWORD_HASH_TIMEOUT', cls.TIMEOUT))
+        with cls._lock:
+            cls._slots = threading.BoundedSemaphore(cls.MAX_QUEUE)
+
+    @classmethod
+    def hash(cls, password: str) -> str:
+        """生成 pbkdf2:sha256 哈希"""
+        return cls._call(_hash, password)
+
+    @classmethod
+    def verify(cls, stored_hash: str, password: str) -> bool:
+        """校验密码与 werkzeug 哈希是否匹配"""
+        return cls._call(_verify, stored_hash, password)
+
+    @classmethod
+    def _get_executor(cls):
+        with cls._lock:
+            if cls._slots is None:
+                cls._slots = threading.BoundedSemaphore(cls.MAX_QUEUE)
+            if cls._executor is None:
+                cls._executor = ProcessPoolExecutor(
+                    max_workers=cls.WORKERS,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+            return cls._executor, cls._slots
+
+    @classmethod
+    def _call(cls, fn, *args):
+        if not cls.WORKERS:
+            return fn(*args)
+
+        executor, slots = cls._get_executor()
+        if not slots.acquire(blocking=False):
+            with cls._lock:
+                cls._stats['rejected'] += 1
+            raise PasswordHasherBusy('password hashing queue is full')
+
+        started = time.perf_counter()
+        with cls._lock:
+            cls._stats['submitted'] += 1
+            cls._in_flight += 1
+
+        def _release(_future):
+            with cls._lock:
+                cls._in_flight -= 1
+            slots.release()
+
+        try:
+            future = executor.submit(fn, *args)
+        except BrokenProcessPool:
+            _release(None)
+            cls._reset_executor(executor)
+            raise PasswordHasherBusy('password hashing pool restarted')
+        future.add_done_callback(_release)
+
+        try:
+            result = future.result(timeout=cls.TIMEOUT)
+        except FutureTimeoutError:
+            # 已开始执行的任务无法取消，名额在其结束时由回调释放
+            future.cancel()
+            with cls._lock:
+                cls._stats['timeouts'] += 1
+            raise PasswordHasherBusy('password hashing timed out')
+        except BrokenProcessPool:
+            with cls._lock:
+                cls._stats['errors'] += 1
+            cls._reset_executor(executor)
+            raise PasswordHasherBusy('password hashing pool restarted')
+
+        with cls._lock:
+            cls._stats['completed'] += 1
+            cls._latencies.append(time.perf_counter() - started)
+        return result
+
+    @classmethod
+    def _reset_executor(cls, broken):
+        """工作进程异常退出后丢弃进程池，下次调用时重建"""
+        with cls._lock:
+            if cls._executor is broken:
+                cls._executor = None
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    @classmethod
+    def get_stats(cls) -> Dict[str, Any]:
+        """队列深度和延迟统计（延迟含排队时间，单位毫秒，取最近 500 次）"""
+        with cls._lock:
+            latencies = sorted(cls._latencies)
+            stats = dict(cls._stats)
+            stats.update({
+                'workers': cls.WORKERS,
+                'max_queue': cls.MAX_QUEUE,
+                'timeout_seconds': cls.TIMEOUT,
+                'in_flight': cls._in_flight,
+                'pool_started': cls._executor is not None
+            })
+
+        if latencies:
+            stats['latency_ms'] = {
+                'avg': round(sum(latencies) / len(latencies) * 1000, 1),
+                'p50': round(latencies[len(latencies) // 2] * 1000, 1),
+                'p95': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000, 1),
+                'max': round(latencies[-1] * 1000, 1)
+            }
+        else:
+            stats['latency_ms'] = None
+        return stats
+
+    @classmethod
+    def shutdown(cls):
+        """关闭进程池"""
+        with cls._lock:
+            executor, cls._executor = cls._executor, None
+        if executor:
+            executor.shutdown(wait=False, cancel_futures=True)
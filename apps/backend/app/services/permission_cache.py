@@ -0,0 +1,116 @@
+"""
+角色权限缓存
+按用户缓存角色和权限，require_role / require_permission 不再每次请求执行多表 JOIN
+"""
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+
+class PermissionCache:
+    """
+    进程内用户角色权限缓存（LRU，容量有上限）
+
+    - 以用户ID为键，缓存角色列表和权限集合
+    - 失效依赖 rbac_version 计数（见 app.database.RoleVersion）：
+      每隔 CHECK_INTERVAL 秒读取一次，计数变化时清空整个缓存
+    - 版本表不存在时（未执行角色系统迁移）不缓存，每次直接加载
+
+    角色变更很少发生，全量清空比按用户失效更简单且不会遗漏
+    （角色权限变更会影响该角色下的所有用户）。
+    """
+
+    _entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+    _version: Optional[int] = None
+    _last_check: float = 0
+    _lock = threading.Lock()
+
+    MAX_USERS = 10000
+    # 版本检查间隔（秒）：其他进程的角色变更最多延迟该时长生效
+    CHECK_INTERVAL = 2.0
+
+    @classmethod
+    def init_app(cls, app):
+        """读取缓存容量和版本检查间隔配置"""
+        cls.MAX_USERS = int(app.config.get('PERMISSION_CACHE_MAX_USERS', cls.MAX_USERS))
+        cls.CHECK_INTERVAL = float(app.config.get('PERMISSION_VERSION_CHECK_INTERVAL', cls.CHECK_INTERVAL))
+
+    @classmethod
+    def get(cls, user_id: int, loader: Callable[[int], Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        获取用户的角色权限（需要应用上下文）
+
+        Args:
+            user_id: 用户ID
+            loader: 缓存未命中时从数据库加载的函数
+
+        Returns:
+            loader 返回的字典（调用方不应修改）
+        """
+        now = time.time()
+        if now - cls._last_check >= cls.CHECK_INTERVAL:
+            cls._check_version(now)
+
+        with cls._lock:
+            version = cls._version
+            if version is None:
+                entry = None
+            else:
+                entry = cls._entries.get(user_id)
+                if entry is not None:
+                    cls._entries.move_to_end(user_id)
+        if entry is not None:
+            return entry
+
+        entry = loader(user_id)
+        if version is None:
+            return entry
+
+        with cls._lock:
+            # 加载期间版本已变化则不写入，避免缓存旧数据
+            if cls._version == version:
+                cls._entries[user_id] = entry
+                cls._entries.move_to_end(user_id)
+                while len(cls._entries) > cls.MAX_USERS:
+                    cls._entries.popitem(last=False)
+        return entry
+
+    @classmethod
+    def _check_version(cls, now: float):
+        from app.database import RoleVersion
+
+        version = RoleVersion.get()
+        with cls._lock:
+            if version != cls._version:
+                cls._entries.clear()
+                cls._version = version
+            cls._last_check = now
+
+    @classmethod
+    def invalidate(cls, user_id: int = None):
+        """使缓存失效（不指定用户时清空全部）"""
+        with cls._lock:
+            if user_id is None:
+                cls._entries.clear()
+            else:
+                cls._entries.pop(user_id, None)
+
+    @classmethod
+    def get_cache_info(cls) -> Dict[str, Any]:
+        """获取缓存信息（用于调试和监控）"""
+        with cls._lock:
+            return {
+                'cached_users': len(cls._entries),
+                'max_users': cls.MAX_USERS,
+                'version': cls._version,
+                'seconds_since_check': round(time.time() - cls._last_check, 2) if cls._last_check else None
+            }
+
+    @classmethod
+    def reset(cls):
+        """清空缓存和版本，下次访问时重新检查"""
+        with cls._lock:
+            cls._entries.clear()
+            cls._version = None
+            cls._last_check = 0
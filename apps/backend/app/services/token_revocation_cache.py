@@ -0,0 +1,105 @@
+"""
+JWT 撤销缓存
+进程内保存已撤销的 JTI，认证检查不再每次请求查询 jwt_blacklist
+"""
+import time
+import threading
+from typing import Dict
+
+
+class TokenRevocationCache:
+    """
+    进程内 JWT 撤销集合
+
+    - 首次检查时从 jwt_blacklist 加载未过期的 JTI
+    - 本进程登出时立即写入
+    - 其他 worker 的登出通过黑名单自增 id（MAX(id)）同步：
+      每隔 SYNC_INTERVAL 秒读取一次，变化时只增量加载新记录
+    - 条目在 token 自身的 exp 到期后移除
+
+    集合是精确的，命中即为已撤销；未命中时的唯一误差是其他 worker
+    最近 SYNC_INTERVAL 秒内的登出尚未同步。
+    """
+
+    _revoked: Dict[str, float] = {}
+    _last_id: int = 0
+    _loaded: bool = False
+    _last_sync: float = 0
+    _last_prune: float = 0
+    _lock = threading.Lock()
+
+    # 跨进程同步间隔（秒），可通过 JWT_REVOCATION_SYNC_INTERVAL 配置
+    SYNC_INTERVAL = 2.0
+    PRUNE_INTERVAL = 300
+    # 没有 exp 的旧黑名单记录在本地保留的时长
+    LEGACY_TTL = 7 * 24 * 3600
+
+    @classmethod
+    def init_app(cls, app):
+        """读取同步间隔配置"""
+        cls.SYNC_INTERVAL = float(app.config.get('JWT_REVOCATION_SYNC_INTERVAL', cls.SYNC_INTERVAL))
+
+    @classmethod
+    def is_revoked(cls, jti: str) -> bool:
+        """检查 JTI 是否已撤销（需要应用上下文，同步时会查询数据库）"""
+        now = time.time()
+        if not cls._loaded or now - cls._last_sync >= cls.SYNC_INTERVAL:
+            cls._sync(now)
+
+        expires_at = cls._revoked.get(jti)
+        return expires_at is not None and expires_at > now
+
+    @classmethod
+    def revoke(cls, jti: str, expires_at: int = None):
+        """撤销 JTI：写入黑名单表并立即在本进程生效"""
+        from app.database import JWTBlacklist
+
+        JWTBlacklist.add(jti, expires_at)
+        with cls._lock:
+            cls._revoked[jti] = expires_at or time.time() + cls.LEGACY_TTL
+
+    @classmethod
+    def _sync(cls, now: float):
+        from app.database import JWTBlacklist
+
+        with cls._lock:
+            # 其他线程刚完成同步
+            if cls._loaded and now - cls._last_sync < cls.SYNC_INTERVAL:
+                return
+
+            latest_id = JWTBlacklist.get_latest_id()
+            if not cls._loaded or latest_id != cls._last_id:
+                # 首次加载取全部未过期记录；id 变小说明表被清空重建，同样全量加载
+                since = cls._last_id if cls._loaded and latest_id > cls._last_id else 0
+                if since == 0:
+                    cls._revoked = {}
+                for row in JWTBlacklist.get_since(since, int(now)):
+                    cls._revoked[row['jti']] = row['expires_at'] or now + cls.LEGACY_TTL
+                cls._last_id = latest_id
+                cls._loaded = True
+
+            cls._last_sync = now
+
+            if now - cls._last_prune >= cls.PRUNE_INTERVAL:
+                cls._revoked = {jti: exp for jti, exp in cls._revoked.items() if exp > now}
+                cls._last_prune = now
+
+    @classmethod
+    def get_cache_info(cls) -> Dict[str, float]:
+        """获取缓存信息（用于调试和监控）"""
+        with cls._lock:
+            return {
+                'loaded': cls._loaded,
+                'revoked_count': len(cls._revoked),
+                'last_id': cls._last_id,
+                'seconds_since_sync': round(time.time() - cls._last_sync, 2) if cls._loaded else None
+            }
+
+    @classmethod
+    def reset(cls):
+        """清空缓存，下次检查时重新加载"""
+        with cls._lock:
+            cls._revoked = {}
+            cls._last_id = 0
+            cls._loaded = False
+            cls._last_sync = 0
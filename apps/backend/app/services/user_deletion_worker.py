@@ -0,0 +1,56 @@
+"""
+用户删除后台执行
+在独立线程中分块执行删除任务（见 app.database.UserDeletionJob），管理员请求立即返回
+"""
+import threading
+
+
+class UserDeletionWorker:
+    """
+    用户删除任务执行器
+
+    每个任务一个守护线程；同一进程内同一任务不会重复启动。
+    进程退出导致中断的任务可通过 flask resume-user-deletions
+    或管理员接口重新提交，任务会从剩余数据继续。
+    """
+
+    _running = set()
+    _lock = threading.Lock()
+
+    @classmethod
+    def submit(cls, app, job_id: int) -> bool:
+        """提交任务到后台线程，任务已在本进程执行中时返回 False"""
+        with cls._lock:
+            if job_id in cls._running:
+                return False
+            cls._running.add(job_id)
+
+        thread = threading.Thread(
+            target=cls._run, args=(app, job_id), name=f'user-deletion-{job_id}', daemon=True
+        )
+        thread.start()
+        return True
+
+    @classmethod
+    def is_running(cls, job_id: int) -> bool:
+        """任务是否在本进程执行中"""
+        with cls._lock:
+            return job_id in cls._running
+
+    @classmethod
+    def _run(cls, app, job_id: int):
+        from app.database import UserDeletionJob
+
+        try:
+            with app.app_context():
+                job = UserDeletionJob.run(job_id)
+                if job:
+                    app.logger.info(
+                        f"用户删除任务 {job_id} 完成：用户 {job['user_email']} (ID: {job['user_id']})，"
+                        f"进度 {job['progress']}"
+                    )
+        except Exception as e:
+            app.logger.error(f"用户删除任务 {job_id} 失败: {str(e)}")
+        finally:
+            with cls._lock:
+                cls._running.discard(job_id)
@@ -1,12 +1,16 @@
 """
 权限验证工具模块
 提供装饰器和辅助函数用于权限控制
+
+角色和权限按用户缓存在进程内（见 app.services.permission_cache），
+任何角色权限变更由 rbac_version 计数触发失效
 """
 from functools import wraps
 from flask import g, current_app
 from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity
 from app.database import get_db
 from app.utils.response import APIResponse
+from app.services.permission_cache import PermissionCache
 
 
 def get_current_user_id() -> int:
@@ -21,6 +25,37 @@ def get_current_user_id() -> int:
         return None
 
 
+def _load_user_access(user_id: int) -> dict:
+    """从数据库加载用户的角色和权限（由 PermissionCache 在未命中时调用）"""
+    db = get_db()
+    roles = db.execute('''
+        SELECT r.id, r.name, r.display_name, r.description
+        FROM roles r
+        JOIN user_roles ur ON r.id = ur.role_id
+        WHERE ur.user_id = ?
+    ''', (user_id,)).fetchall()
+
+    permissions = db.execute('''
+        SELECT DISTINCT p.name
+        FROM permissions p
+        JOIN role_permissions rp ON p.id = rp.permission_id
+        JOIN user_roles ur ON rp.role_id = ur.role_id
+        WHERE ur.user_id = ?
+    ''', (user_id,)).fetchall()
+
+    roles = tuple(dict(row) for row in roles)
+    return {
+        'roles': roles,
+        'role_names': frozenset(role['name'] for role in roles),
+        'permissions': frozenset(row['name'] for row in permissions)
+    }
+
+
+def _get_user_access(user_id: int) -> dict:
+    """获取用户的角色和权限（经过缓存，返回值不可修改）"""
+    return PermissionCache.get(user_id, _load_user_access)
+
+
 def get_user_roles(user_id: int) -> list:
     """
     获取用户的所有角色
@@ -31,15 +66,7 @@ def get_user_roles(user_id: int) -> list:
     Returns:
         角色列表，每个角色包含 id, name, display_name
     """
-    db = get_db()
-    roles = db.execute('''
-        SELECT r.id, r.name, r.display_name, r.description
-        FROM roles r
-        JOIN user_roles ur ON r.id = ur.role_id
-        WHERE ur.user_id = ?
-    ''', (user_id,)).fetchall()
-
-    return [dict(row) for row in roles]
+    return [dict(role) for role in _get_user_access(user_id)['roles']]
 
 
 def get_user_permissions(user_id: int) -> set:
@@ -52,16 +79,7 @@ def get_user_permissions(user_id: int) -> set:
     Returns:
         权限标识集合，例如 {'user.view', 'generation.create'}
     """
-    db = get_db()
-    permissions = db.execute('''
-        SELECT DISTINCT p.name
-        FROM permissions p
-        JOIN role_permissions rp ON p.id = rp.permission_id
-        JOIN user_roles ur ON rp.role_id = ur.role_id
-        WHERE ur.user_id = ?
-    ''', (user_id,)).fetchall()
-
-    return {row['name'] for row in permissions}
+    return set(_get_user_access(user_id)['permissions'])
 
 
 def has_role(user_id: int, role_name: str) -> bool:
@@ -75,16 +93,7 @@ def has_role(user_id: int, role_name: str) -> bool:
     Returns:
         True表示拥有该角色，False表示没有
     """
-    db = get_db()
-    result = db.execute('''
-        SELECT 1
-        FROM user_roles ur
-        JOIN roles r ON ur.role_id = r.id
-        WHERE ur.user_id = ? AND r.name = ?
-        LIMIT 1
-    ''', (user_id, role_name)).fetchone()
-
-    return result is not None
+    return role_name in _get_user_access(user_id)['role_names']
 
 
 def has_permission(user_id: int, permission_name: str) -> bool:
@@ -98,8 +107,7 @@ def has_permission(user_id: int, permission_name: str) -> bool:
     Returns:
         True表示拥有该权限，False表示没有
     """
-    permissions = get_user_permissions(user_id)
-    return permission_name in permissions
+    return permission_name in _get_user_access(user_id)['permissions']
 
 
 def require_role(*role_names):
@@ -122,8 +130,9 @@ def require_role(*role_names):
             user_id = int(get_jwt_identity())
 
             # 检查用户是否拥有任一指定角色
+            user_role_names = _get_user_access(user_id)['role_names']
             for role_name in role_names:
-                if has_role(user_id, role_name):
+                if role_name in user_role_names:
                     return fn(*args, **kwargs)
 
             # 没有任何所需角色
@@ -159,7 +168,7 @@ def require_permission(*permission_names):
             user_id = int(get_jwt_identity())
 
             # 检查用户是否拥有任一指定权限
-            user_permissions = get_user_permissions(user_id)
+            user_permissions = _get_user_access(user_id)['permissions']
             for permission_name in permission_names:
                 if permission_name in user_permissions:
                     return fn(*args, **kwargs)
@@ -193,7 +202,7 @@ def require_all_permissions(*permission_names):
             user_id = int(get_jwt_identity())
 
             # 检查用户是否拥有所有指定权限
-            user_permissions = get_user_permissions(user_id)
+            user_permissions = _get_user_access(user_id)['permissions']
             missing_permissions = [
                 p for p in permission_names if p not in user_permissions
             ]
@@ -228,8 +237,9 @@ def load_user_context():
         if user_id_str:
             user_id = int(user_id_str)
             g.user_id = user_id
-            g.user_roles = get_user_roles(user_id)
-            g.user_permissions = get_user_permissions(user_id)
+            access = _get_user_access(user_id)
+            g.user_roles = [dict(role) for role in access['roles']]
+            g.user_permissions = set(access['permissions'])
         else:
             g.user_id = None
             g.user_roles = []
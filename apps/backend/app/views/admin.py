@@ -1,7 +1,7 @@
 """
 管理员相关视图
 """
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify, current_app, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app.database import User, SystemSettings
 from app.utils.permissions import require_role
@@ -9,7 +9,10 @@ from app.repositories.api_config_repository import APIConfigRepository
 from app.services.encryption_service import encryption_service
 import aiohttp
 import asyncio
+import csv
 import re
+import shutil
+import tempfile
 
 admin_bp = Blueprint('admin', __name__)
 
@@ -60,18 +63,22 @@ def add_credits():
                 'error': '用户不存在'
             }), 404
 
-        # 记录充值前的次数
-        old_credits = target_user['credits']
-
-        # 执行充值
-        User.add_credits(target_user['id'], credits)
+        # 执行充值（余额变动与流水在同一事务内写入）
+        result = User.add_credits(
+            target_user['id'], credits, actor_id=current_user_id, note=data.get('reason') or data.get('note', '')
+        )
+        if not result:
+            return jsonify({
+                'success': False,
+                'error': '用户不存在'
+            }), 404
 
-        # 获取充值后的用户信息
-        updated_user = User.get_by_id(target_user['id'])
+        new_credits = result['balance']
+        old_credits = new_credits - credits
 
         current_app.logger.info(
             f"管理员 {current_user_id} 为用户 {user_email} "
-            f"充值 {credits} 次数，从 {old_credits} 增加到 {updated_user['credits']}"
+            f"充值 {credits} 次数，从 {old_credits} 增加到 {new_credits}（流水 {result['ledger_id']}）"
         )
 
         return jsonify({
@@ -82,7 +89,8 @@ def add_credits():
                 'user_id': target_user['id'],
                 'credits_added': credits,
                 'old_credits': old_credits,
-                'new_credits': updated_user['credits']
+                'new_credits': new_credits,
+                'ledger_id': result['ledger_id']
             }
         }), 200
 
@@ -94,6 +102,176 @@ def add_credits():
         }), 500
 
 
+def _decode_csv_lines(stream):
+    """逐行解码 UTF-8（首行去掉 BOM），解码失败时报告物理行号"""
+    for line_no, line in enumerate(stream, start=1):
+        try:
+            yield line.decode('utf-8-sig' if line_no == 1 else 'utf-8')
+        except UnicodeDecodeError:
+            raise ValueError(f'CSV 第 {line_no} 行不是有效的 UTF-8 编码')
+
+
+def _iter_bulk_credit_csv(stream):
+    """
+    流式读取批量充值 CSV：每行"用户ID或邮箱,次数"，首行为表头时跳过；引号不配对等按格式错误处理
+
+    Raises:
+        ValueError: 编码或 CSV 格式错误（附行号）
+    """
+    reader = csv.reader(_decode_csv_lines(stream), strict=True)
+    try:
+        for row_no, row in enumerate(reader, start=1):
+            if not row or not any(cell.strip() for cell in row):
+                continue
+            ident = row[0].strip()
+            amount = row[1].strip() if len(row) > 1 else ''
+            if row_no == 1 and not amount.lstrip('-').isdigit():
+                continue  # 表头
+            yield row_no, ident, int(amount) if amount.lstrip('-').isdigit() else amount
+    except csv.Error as e:
+        raise ValueError(f'CSV 第 {reader.line_num} 行格式错误: {e}')
+
+
+def _spool_bulk_credit_csv(file_storage):
+    """
+    将上传的 CSV 复制到临时文件并完整解析一遍，返回定位到开头的临时文件
+
+    充值按块提交，执行到中途才发现坏行会留下已提交的前几块，管理员修正文件重试时
+    这些用户会被重复充值；预扫描通过后再从临时文件读取执行，出错时不写入任何数据。
+
+    Raises:
+        ValueError: 编码或 CSV 格式错误（附行号）
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    try:
+        shutil.copyfileobj(file_storage.stream, spool)
+        spool.seek(0)
+        for _ in _iter_bulk_credit_csv(spool):
+            pass
+        spool.seek(0)
+    except Exception:
+        spool.close()
+        raise
+    return spool
+
+
+def _iter_bulk_credit_items(items):
+    """读取 JSON 批量充值条目：{"user_id" 或 "user_email", "credits"}"""
+    for row_no, item in enumerate(items, start=1):
+        if not isinstance(item, dict):
+            yield row_no, None, None
+            continue
+        yield row_no, item.get('user_id') or item.get('user_email'), item.get('credits')
+
+
+@admin_bp.route('/admin/add-credits/bulk', methods=['POST'])
+@jwt_required()
+@require_role('admin')
+def bulk_add_credits():
+    """
+    管理员批量充值
+
+    支持两种输入：
+    - JSON: {"items": [{"user_id": 1, "credits": 10}, {"user_email": "a@b.com", "credits": 5}],
+             "reason": "活动赠送", "record_ledger": true}
+    - multipart 上传 CSV 文件（字段 file），每行"用户ID或邮箱,次数"，reason / record_ledger 作为表单字段；
+      文件须为 UTF-8，先完整校验编码和格式，有错误时整份拒绝（400），不会只充值前面的行
+    """
+    spool = None
+    try:
+        current_user_id = int(get_jwt_identity())
+        from app.database import User
+
+        upload = request.files.get('file')
+        if upload:
+            try:
+                spool = _spool_bulk_credit_csv(upload)
+            except ValueError as e:
+                return jsonify({
+                    'success': False,
+                    'error': f'{e}，未执行任何充值'
+                }), 400
+            rows = _iter_bulk_credit_csv(spool)
+            reason = request.form.get('reason', '')
+            record_ledger = request.form.get('record_ledger', 'true').lower() != 'false'
+        else:
+            data = request.get_json(silent=True) or {}
+            items = data.get('items')
+            if not isinstance(items, list) or not items:
+                return jsonify({
+                    'success': False,
+                    'error': '请提供 items 列表或上传 CSV 文件'
+                }), 400
+            rows = _iter_bulk_credit_items(items)
+            reason = data.get('reason', '')
+            record_ledger = data.get('record_ledger', True) is not False
+
+        result = User.bulk_add_credits(
+            rows, actor_id=current_user_id, note=reason, record_ledger=record_ledger
+        )
+
+        current_app.logger.info(
+            f"管理员 {current_user_id} 批量充值：成功 {result['applied']} 行，"
+            f"合计 {result['credits_added']} 次数，失败 {len(result['failed'])} 行"
+        )
+
+        return jsonify({
+            'success': True,
+            'data': {
+                'applied': result['applied'],
+                'credits_added': result['credits_added'],
+                'failed_count': len(result['failed']),
+                'failed': result['failed']
+            }
+        }), 200
+
+    except Exception as e:
+        current_app.logger.error(f"管理员批量充值失败: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': '批量充值失败，请稍后重试'
+        }), 500
+    finally:
+        if spool is not None:
+            spool.close()
+
+
+@admin_bp.route('/admin/users/<int:user_id>/credits/history', methods=['GET'])
+@jwt_required()
+@require_role('admin')
+def get_user_credit_history(user_id):
+    """管理员查看用户次数流水（可选 as_of 查询某时刻余额）"""
+    try:
+        from app.database import CreditLedger
+
+        limit = max(1, min(request.args.get('limit', 50, type=int), 200))
+        before_id = request.args.get('before_id', type=int)
+        as_of = request.args.get('as_of')
+
+        history = CreditLedger.get_history(user_id, limit=limit, before_id=before_id)
+        response = {
+            'success': True,
+            'user_id': user_id,
+            'entries': history['entries'],
+            'next_before_id': history['next_before_id'],
+            'verification': CreditLedger.verify(user_id)
+        }
+        if as_of:
+            response['balance_as_of'] = {
+                'at': as_of,
+                'balance': CreditLedger.balance_at(user_id, at=as_of)
+            }
+
+        return jsonify(response), 200
+
+    except Exception as e:
+        current_app.logger.error(f"获取次数流水失败: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': '获取次数流水失败'
+        }), 500
+
+
 @admin_bp.route('/admin/users/search', methods=['GET'])
 @jwt_required()
 @require_role('admin')
@@ -134,12 +312,11 @@ def search_users():
                 (f'%{query}%',)
             ).fetchall()
 
-        users_list = [dict(user) for user in users]
-
+        # 查询结果行由 JSON provider 直接序列化，无需先转换为 dict
         return jsonify({
             'success': True,
-            'users': users_list,
-            'count': len(users_list)
+            'users': users,
+            'count': len(users)
         }), 200
 
     except Exception as e:
@@ -283,7 +460,9 @@ def update_settings():
         if updated_count > 0:
             try:
                 from app.services.config_cache import ConfigCache
+                from app.middleware.response_cache import invalidate_cache_tags
                 ConfigCache.invalidate()
+                invalidate_cache_tags('settings')
                 current_app.logger.info("✅ AI配置缓存已清除")
             except Exception as cache_error:
                 current_app.logger.warning(f"清除缓存失败: {str(cache_error)}")
@@ -652,10 +831,11 @@ def delete_setting(key):
 def delete_user(user_id):
     """删除用户 - 管理员功能
 
-    级联删除策略：
+    级联删除策略（后台分块执行，请求立即返回 202）：
+    - 立即停用用户
     - 软删除：作品标记为孤儿（保留内容）
     - 硬删除：会话、行为、偏好、推荐、性能指标
-    - 审计日志：记录删除操作和影响范围
+    - 审计日志：全部完成后记录删除操作和影响范围
     """
     try:
         current_user_id = int(get_jwt_identity())
@@ -670,23 +850,26 @@ def delete_user(user_id):
         # 获取可选的删除原因
         reason = request.args.get('reason', '')
 
-        # 执行级联删除
-        result = User.delete_user_cascade(
+        from app.database import UserDeletionJob
+        from app.services.user_deletion_worker import UserDeletionWorker
+
+        # 停用用户并登记任务，分块删除交给后台线程
+        job = UserDeletionJob.create(
             user_id=user_id,
             admin_id=current_user_id,
             reason=reason
         )
+        UserDeletionWorker.submit(current_app._get_current_object(), job['id'])
 
         current_app.logger.info(
-            f"管理员 {current_user_id} 删除了用户 {result['deleted_user']['email']} (ID: {user_id})"
+            f"管理员 {current_user_id} 提交删除用户 {job['user_email']} (ID: {user_id})，任务 {job['id']}"
         )
 
         return jsonify({
             'success': True,
-            'message': result['message'],
-            'deleted_user': result['deleted_user'],
-            'impact': result['impact']
-        }), 200
+            'message': 'User deletion started',
+            'job': job
+        }), 202
 
     except ValueError as e:
         # 用户不存在
@@ -703,6 +886,152 @@ def delete_user(user_id):
             'details': str(e)
         }), 500
 
+
+@admin_bp.route('/admin/user-deletions/<int:job_id>', methods=['GET'])
+@jwt_required()
+@require_role('admin')
+def get_user_deletion_job(job_id):
+    """查询用户删除任务进度"""
+    from app.database import UserDeletionJob
+    from app.services.user_deletion_worker import UserDeletionWorker
+
+    job = UserDeletionJob.get(job_id)
+    if not job:
+        return jsonify({
+            'success': False,
+            'error': '删除任务不存在'
+        }), 404
+
+    return jsonify({
+        'success': True,
+        'job': job,
+        'in_progress': UserDeletionWorker.is_running(job_id)
+    }), 200
+
+
+@admin_bp.route('/admin/user-deletions/<int:job_id>/resume', methods=['POST'])
+@jwt_required()
+@require_role('admin')
+def resume_user_deletion_job(job_id):
+    """继续执行中断或失败的用户删除任务"""
+    from app.database import UserDeletionJob
+    from app.services.user_deletion_worker import UserDeletionWorker
+
+    job = UserDeletionJob.get(job_id)
+    if not job:
+        return jsonify({
+            'success': False,
+            'error': '删除任务不存在'
+        }), 404
+
+    if job['status'] == 'completed':
+        return jsonify({
+            'success': True,
+            'job': job
+        }), 200
+
+    UserDeletionWorker.submit(current_app._get_current_object(), job_id)
+    return jsonify({
+        'success': True,
+        'message': 'User deletion resumed',
+        'job': job
+    }), 202
+
+
+@admin_bp.route('/admin/password-hasher/stats', methods=['GET'])
+@jwt_required()
+@require_role('admin')
+def get_password_hasher_stats():
+    """查询密码哈希进程池的队列深度和延迟（本进程）"""
+    from app.services.password_hasher import PasswordHasher
+
+    return jsonify({
+        'success': True,
+        'stats': PasswordHasher.get_stats()
+    }), 200
+
+
+@admin_bp.route('/admin/rate-limits', methods=['GET'])
+@jwt_required()
+@require_role('admin')
+def get_rate_limit_overview():
+    """查询限流配置、跟踪中的 key 数和被拒绝最多的请求方"""
+    from app.middleware.rate_limiter import rate_limiter
+
+    top = min(request.args.get('top', 20, type=int), 100)
+    return jsonify({
+        'success': True,
+        'rate_limits': rate_limiter.get_overview(top)
+    }), 200
+
+
+@admin_bp.route('/admin/compression/stats', methods=['GET'])
+@jwt_required()
+@require_role('admin')
+def get_compression_stats():
+    """查询响应压缩的压缩率和 CPU 耗时（本进程）"""
+    from app.middleware.compression import response_compressor
+
+    return jsonify({
+        'success': True,
+        'stats': response_compressor.get_stats()
+    }), 200
+
+
+@admin_bp.route('/admin/export/<table>', methods=['GET'])
+@jwt_required()
+@require_role('admin')
+def export_table(table):
+    """
+    流式导出数据表（离线分析用）
+
+    支持的表: creations、performance_metrics、user_behaviors、users
+    查询参数: format=ndjson|csv（默认 ndjson）、start、end（UTC，YYYY-MM-DD 或 YYYY-MM-DD HH:MM:SS，
+    按各表的创建时间过滤，start 含、end 不含）
+    """
+    from app.services.table_export import TableExporter
+    from app.database import get_db_path
+    from datetime import datetime
+
+    if table not in TableExporter.TABLES:
+        return jsonify({
+            'success': False,
+            'error': f"不支持导出的表: {table}"
+        }), 404
+
+    fmt = request.args.get('format', 'ndjson').lower()
+    if fmt not in TableExporter.FORMATS:
+        return jsonify({
+            'success': False,
+            'error': 'format 只支持 ndjson 或 csv'
+        }), 400
+
+    try:
+        start = TableExporter.parse_time(request.args.get('start'))
+        end = TableExporter.parse_time(request.args.get('end'))
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+    current_app.logger.info(
+        f"管理员 {get_jwt_identity()} 导出 {table}（{fmt}，{start or '-'} ~ {end or '-'}）"
+    )
+
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    filename = f"{table}-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}.{fmt}"
+    return current_app.response_class(
+        stream_with_context(TableExporter.stream(get_db_path(), table, fmt, start, end)),
+        mimetype=mimetype,
+        headers={
+            'Content-Disposition': f'attachment; filename="{filename}"',
+            'Cache-Control': 'no-store',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+
 # ========================================
 # API配置管理路由 (API Configuration Management)
 # ========================================
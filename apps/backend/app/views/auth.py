@@ -2,7 +2,6 @@
 认证相关视图
 """
 import re
-import time
 from datetime import datetime
 from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import (
@@ -13,17 +12,13 @@ from flask_jwt_extended import (
     get_jwt
 )
 from app.middleware.rate_limiter import rate_limit
+from app.services.password_hasher import PasswordHasherBusy
 
 auth_bp = Blueprint('auth', __name__)
 
 # 邮箱格式验证正则
 EMAIL_REGEX = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
 
-# 登录失败计数器（防暴力破解）
-login_attempts = {}
-LOGIN_ATTEMPT_LIMIT = 5
-LOGIN_COOLDOWN_SECONDS = 300  # 5分钟冷却期
-
 
 def validate_email(email):
     """验证邮箱格式"""
@@ -48,29 +43,29 @@ def validate_password(password):
 
 
 def check_login_attempts(email):
-    """检查登录尝试次数"""
-    now = time.time()
-    if email in login_attempts:
-        attempts, last_attempt = login_attempts[email]
-        if attempts >= LOGIN_ATTEMPT_LIMIT:
-            if now - last_attempt < LOGIN_COOLDOWN_SECONDS:
-                return False, f"登录尝试过多，请在{int(LOGIN_COOLDOWN_SECONDS - (now - last_attempt))}秒后重试"
-            else:
-                # 冷却期已过，重置计数
-                login_attempts[email] = (0, now)
+    """检查登录尝试次数（计数由所有 worker 共享，见 app.database.LoginFailure）"""
+    from app.database import LoginFailure
+    remaining = LoginFailure.get_lock_remaining(email)
+    if remaining > 0:
+        return False, f"登录尝试过多，请在{remaining}秒后重试"
     return True, ""
 
 
-def record_login_attempt(email, success):
-    """记录登录尝试"""
-    now = time.time()
+def record_login_attempt(email, success, user_id=None):
+    """记录登录尝试（失败且账户存在时同时更新账户锁定状态）"""
+    from app.database import LoginFailure
     if success:
         # 登录成功，清除记录
-        login_attempts.pop(email, None)
+        LoginFailure.clear(email)
     else:
-        # 登录失败，增加计数
-        attempts, _ = login_attempts.get(email, (0, now))
-        login_attempts[email] = (attempts + 1, now)
+        LoginFailure.record_failure(email, user_id)
+
+
+def _password_hasher_busy_response():
+    """密码哈希进程池繁忙时的响应"""
+    response = jsonify({'error': '服务繁忙，请稍后重试'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
 
 
 @auth_bp.route('/register', methods=['POST'])
@@ -103,7 +98,10 @@ def register():
 
         # 创建用户
         from app.database import User
-        user_id = User.create(email, password)
+        try:
+            user_id = User.create(email, password)
+        except PasswordHasherBusy:
+            return _password_hasher_busy_response()
 
         if user_id is None:
             return jsonify({'error': '邮箱已被注册'}), 409
@@ -181,10 +179,14 @@ def login():
         if User.is_locked(user):
             return jsonify({'error': '账户已被锁定，请稍后重试'}), 403
 
-        # 验证密码
-        if not User.verify_password(user, password):
-            record_login_attempt(email, False)
-            User.update_login_info(user['id'], success=False)
+        # 验证密码（哈希进程池繁忙时直接返回 503，不计入失败次数）
+        try:
+            password_ok = User.verify_password(user, password)
+        except PasswordHasherBusy:
+            return _password_hasher_busy_response()
+
+        if not password_ok:
+            record_login_attempt(email, False, user_id=user['id'])
             return jsonify({'error': '邮箱或密码错误'}), 401
 
         # 检查账户状态
@@ -238,12 +240,12 @@ def login():
 def logout():
     """用户登出"""
     try:
-        # 获取当前JWT的JTI
-        jti = get_jwt()['jti']
+        # 获取当前JWT的JTI和过期时间
+        token = get_jwt()
 
-        # 添加到黑名单
-        from app.database import JWTBlacklist
-        JWTBlacklist.add(jti)
+        # 添加到黑名单（记录保留到 token 过期），本进程立即生效
+        from app.services.token_revocation_cache import TokenRevocationCache
+        TokenRevocationCache.revoke(token['jti'], token.get('exp'))
 
         return jsonify({'message': '登出成功'}), 200
 
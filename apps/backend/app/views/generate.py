@@ -2,18 +2,20 @@
 图片生成相关视图
 """
 import asyncio
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify, current_app, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app.services.ai_generator import get_ai_generator_service
 from app.database import get_db
 from app.middleware.rate_limiter import rate_limit
-from app.middleware.response_cache import cache_response
+from app.middleware.response_cache import cache_response, invalidate_cache_tags
+from app.middleware.conditional import user_version_etag
 
 generate_bp = Blueprint('generate', __name__)
 
 
 @generate_bp.route('/generate/models', methods=['GET'])
-@cache_response(ttl=600, use_user_id=False, use_query_string=False)  # 10分钟缓存，所有用户共享
+@cache_response(ttl=600, use_user_id=False, use_query_string=False, tags=['settings'],
+                stale_ttl=600, lock_on_miss=True)  # 10分钟缓存，所有用户共享
 def get_available_models():
     """获取可用的模型和尺寸"""
     try:
@@ -40,17 +42,11 @@ def get_available_models():
 @rate_limit('generate')
 def generate_text_to_image():
     """文生图接口"""
+    hold_id = None
     try:
         # 获取当前用户
         current_user_id = int(get_jwt_identity())
-        from app.database import User
-        user = User.get_by_id(current_user_id)
-        if not user:
-            return jsonify({'error': 'User not found'}), 404
-
-        # 检查用户次数
-        if user['credits'] <= 0:
-            return jsonify({'error': 'Insufficient credits'}), 400
+        from app.database import User, CreditHold
 
         # 获取请求参数
         data = request.get_json()
@@ -61,9 +57,13 @@ def generate_text_to_image():
         if not prompt or not prompt.strip():
             return jsonify({'error': 'Prompt is required'}), 400
 
-        # 预扣除次数
-        if not User.consume_credits(current_user_id, 1):
+        # 预留次数（检查与扣除为同一条条件更新）
+        hold = CreditHold.place(current_user_id, 1)
+        if not hold:
+            if not User.get_by_id(current_user_id):
+                return jsonify({'error': 'User not found'}), 404
             return jsonify({'error': 'Insufficient credits'}), 400
+        hold_id = hold['hold_id']
 
         # 准备生成参数
         generation_params = {
@@ -87,32 +87,30 @@ def generate_text_to_image():
             loop.close()
 
         if not result['success']:
-            # 生成失败，退还次数
-            User.refund_credits(current_user_id, 1)
+            # 生成失败，释放预留
+            CreditHold.release(hold_id)
             return jsonify({
                 'success': False,
                 'error': result.get('error', 'Generation failed')
             }), 500
 
-        # 保存生成记录并获取完整的Creation对象
+        # 批量保存生成记录，一次往返取回完整的Creation对象和剩余次数
         from app.database import Creation
-        created_objects = []
-        for image in result['images']:
-            creation_id = Creation.create(
-                user_id=current_user_id,
-                prompt=generation_params['prompt'],
-                image_url=image['url'],
-                model_used=generation_params['model'],
-                size=generation_params['size'],
-                generation_time=result.get('generation_time')
-            )
-            # 获取完整的创建对象
-            creation = Creation.get_by_id(creation_id)
-            if creation:
-                created_objects.append(creation)
-
-        # 获取更新后的用户次数
-        updated_user = User.get_by_id(current_user_id)
+        saved = Creation.create_many(
+            user_id=current_user_id,
+            prompt=generation_params['prompt'],
+            image_urls=[image['url'] for image in result['images']],
+            model_used=generation_params['model'],
+            size=generation_params['size'],
+            generation_time=result.get('generation_time'),
+            hold_id=hold_id
+        )
+        created_objects = saved['creations']
+        remaining_credits = saved['remaining_credits']
+        if remaining_credits is None:
+            remaining_credits = User.get_by_id(current_user_id)['credits']
+        # 分类、标签、统计等缓存响应依赖该用户的作品
+        invalidate_cache_tags(f'user:{current_user_id}')
 
         return jsonify({
             'success': True,
@@ -121,16 +119,18 @@ def generate_text_to_image():
             'generation_time': result.get('generation_time'),
             'model_used': result.get('model_used'),
             'prompt': result.get('prompt'),
-            'remaining_credits': updated_user['credits']
+            'remaining_credits': remaining_credits
         }), 200
 
     except Exception as e:
         current_app.logger.error(f"文生图失败: {str(e)}")
-        # 发生异常时也要退还次数
-        try:
-            User.refund_credits(current_user_id, 1)
-        except:
-            pass
+        # 发生异常时先回滚未提交的写入，再释放预留（已确认或已释放的预留不会重复退还）
+        if hold_id:
+            try:
+                get_db().rollback()
+                CreditHold.release(hold_id)
+            except Exception:
+                pass
         return jsonify({
             'success': False,
             'error': '生成失败，请稍后重试'
@@ -142,17 +142,11 @@ def generate_text_to_image():
 @rate_limit('generate')
 def generate_image_to_image():
     """图生图接口（支持多图）"""
+    hold_id = None
     try:
         # 获取当前用户
         current_user_id = int(get_jwt_identity())
-        from app.database import User
-        user = User.get_by_id(current_user_id)
-        if not user:
-            return jsonify({'error': 'User not found'}), 404
-
-        # 检查用户次数
-        if user['credits'] <= 0:
-            return jsonify({'error': 'Insufficient credits'}), 400
+        from app.database import User, CreditHold
 
         # 获取请求参数
         prompt = request.form.get('prompt')
@@ -178,9 +172,13 @@ def generate_image_to_image():
             if image_file.content_type not in allowed_types:
                 return jsonify({'error': 'Invalid image format'}), 400
 
-        # 预扣除次数
-        if not User.consume_credits(current_user_id, 1):
+        # 预留次数（检查与扣除为同一条条件更新）
+        hold = CreditHold.place(current_user_id, 1)
+        if not hold:
+            if not User.get_by_id(current_user_id):
+                return jsonify({'error': 'User not found'}), 404
             return jsonify({'error': 'Insufficient credits'}), 400
+        hold_id = hold['hold_id']
 
         # 准备生成参数
         generation_params = {
@@ -202,32 +200,30 @@ def generate_image_to_image():
             loop.close()
 
         if not result['success']:
-            # 生成失败，退还次数
-            User.refund_credits(current_user_id, 1)
+            # 生成失败，释放预留
+            CreditHold.release(hold_id)
             return jsonify({
                 'success': False,
                 'error': result.get('error', 'Generation failed')
             }), 500
 
-        # 保存生成记录并获取完整的Creation对象
+        # 批量保存生成记录，一次往返取回完整的Creation对象和剩余次数
         from app.database import Creation
-        created_objects = []
-        for image in result['images']:
-            creation_id = Creation.create(
-                user_id=current_user_id,
-                prompt=generation_params['prompt'],
-                image_url=image['url'],
-                model_used=generation_params['model'],
-                size='auto',  # 图生图不需要指定尺寸
-                generation_time=result.get('generation_time')
-            )
-            # 获取完整的创建对象
-            creation = Creation.get_by_id(creation_id)
-            if creation:
-                created_objects.append(creation)
-
-        # 获取更新后的用户次数
-        updated_user = User.get_by_id(current_user_id)
+        saved = Creation.create_many(
+            user_id=current_user_id,
+            prompt=generation_params['prompt'],
+            image_urls=[image['url'] for image in result['images']],
+            model_used=generation_params['model'],
+            size='auto',  # 图生图不需要指定尺寸
+            generation_time=result.get('generation_time'),
+            hold_id=hold_id
+        )
+        created_objects = saved['creations']
+        remaining_credits = saved['remaining_credits']
+        if remaining_credits is None:
+            remaining_credits = User.get_by_id(current_user_id)['credits']
+        # 分类、标签、统计等缓存响应依赖该用户的作品
+        invalidate_cache_tags(f'user:{current_user_id}')
 
         return jsonify({
             'success': True,
@@ -236,16 +232,18 @@ def generate_image_to_image():
             'generation_time': result.get('generation_time'),
             'model_used': result.get('model_used'),
             'prompt': result.get('prompt'),
-            'remaining_credits': updated_user['credits']
+            'remaining_credits': remaining_credits
         }), 200
 
     except Exception as e:
         current_app.logger.error(f"图生图失败: {str(e)}")
-        # 发生异常时也要退还次数
-        try:
-            User.refund_credits(current_user_id, 1)
-        except:
-            pass
+        # 发生异常时先回滚未提交的写入，再释放预留（已确认或已释放的预留不会重复退还）
+        if hold_id:
+            try:
+                get_db().rollback()
+                CreditHold.release(hold_id)
+            except Exception:
+                pass
         return jsonify({
             'success': False,
             'error': '生成失败，请稍后重试'
@@ -254,6 +252,7 @@ def generate_image_to_image():
 
 @generate_bp.route('/gallery', methods=['GET'])
 @jwt_required()
+@user_version_etag(date_scoped=True)  # 响应包含按天统计的 recent_week
 def get_user_gallery():
     """获取用户作品画廊（支持筛选和搜索）"""
     try:
@@ -269,14 +268,26 @@ def get_user_gallery():
         tags = request.args.get('tags')  # 标签筛选
         search = request.args.get('search')  # 搜索关键词
         is_favorite = request.args.get('is_favorite')  # 收藏筛选
+        cursor = request.args.get('cursor')  # 搜索结果的 keyset 游标
+        search_mode = request.args.get('search_mode', 'auto')  # auto / prefix / substring
+        fields = request.args.get('fields')  # 逗号分隔的返回列（见 Creation.LIST_COLUMNS）
+        compact = request.args.get('compact', '').lower() in ('1', 'true')  # 精简模式：截断提示词
 
         # 转换收藏参数
         favorite_filter = None
         if is_favorite is not None:
             favorite_filter = is_favorite.lower() == 'true'
 
-        # 获取用户作品（使用新的筛选方法）
         from app.database import Creation
+        try:
+            Creation.list_columns(fields, compact)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+
+        # 获取用户作品（使用新的筛选方法）
         creations = Creation.get_by_user_with_filters(
             user_id=current_user_id,
             limit=per_page,
@@ -284,9 +295,19 @@ def get_user_gallery():
             category=category,
             tags=tags,
             search=search,
-            is_favorite=favorite_filter
+            is_favorite=favorite_filter,
+            cursor=cursor,
+            search_mode=search_mode,
+            fields=fields,
+            compact=compact
         )
 
+        # 搜索结果按相关度排序，返回下一页游标（keyset 分页）
+        next_cursor = None
+        if search and len(creations) == per_page and 'search_rank' in creations[-1].keys():
+            from app.database import CreationSearchIndex
+            next_cursor = CreationSearchIndex.make_cursor(creations[-1])
+
         # 获取用户统计信息
         stats = Creation.get_user_stats(current_user_id)
 
@@ -295,9 +316,15 @@ def get_user_gallery():
             'creations': creations,
             'page': page,
             'per_page': per_page,
+            'next_cursor': next_cursor,
             'stats': stats
         }), 200
 
+    except ValueError:
+        return jsonify({
+            'success': False,
+            'error': '分页参数无效'
+        }), 400
     except Exception as e:
         current_app.logger.error(f"获取用户画廊失败: {str(e)}")
         return jsonify({
@@ -323,6 +350,7 @@ def delete_creation(creation_id):
                 'error': '作品不存在或无权删除'
             }), 404
 
+        invalidate_cache_tags(f'user:{current_user_id}')
         return jsonify({
             'success': True,
             'message': '作品已删除'
@@ -354,6 +382,7 @@ def toggle_favorite(creation_id):
                 'error': '作品不存在或无权修改'
             }), 404
 
+        invalidate_cache_tags(f'user:{current_user_id}')
         return jsonify({
             'success': True,
             'message': '收藏状态已更新'
@@ -385,6 +414,7 @@ def update_creation_tags(creation_id):
                 'error': '作品不存在或无权修改'
             }), 404
 
+        invalidate_cache_tags(f'user:{current_user_id}')
         return jsonify({
             'success': True,
             'message': '标签已更新'
@@ -416,6 +446,7 @@ def update_creation_category(creation_id):
                 'error': '作品不存在或无权修改'
             }), 404
 
+        invalidate_cache_tags(f'user:{current_user_id}')
         return jsonify({
             'success': True,
             'message': '分类已更新'
@@ -429,8 +460,130 @@ def update_creation_category(creation_id):
         }), 500
 
 
+@generate_bp.route('/gallery/batch', methods=['POST'])
+@jwt_required()
+def batch_update_creations():
+    """
+    批量操作作品（多选收藏、标签、分类、删除），一个请求、一次提交
+
+    请求体: {"operations": [{"id": 1, "action": "favorite", "is_favorite": true},
+                            {"id": 2, "action": "tags", "tags": "风景,壁纸"},
+                            {"id": 3, "action": "category", "category": "art"},
+                            {"id": 4, "action": "delete"}]}
+    """
+    try:
+        current_user_id = int(get_jwt_identity())
+        data = request.get_json(silent=True) or {}
+        operations = data.get('operations')
+
+        from app.database import Creation
+        if not isinstance(operations, list) or not operations:
+            return jsonify({
+                'success': False,
+                'error': 'operations 必须是非空列表'
+            }), 400
+        if len(operations) > Creation.MAX_BATCH_OPERATIONS:
+            return jsonify({
+                'success': False,
+                'error': f'单次最多 {Creation.MAX_BATCH_OPERATIONS} 个操作'
+            }), 400
+
+        # 格式无效的操作不执行，在结果中按原顺序标记
+        valid, results = [], []
+        for op in operations:
+            normalized = _normalize_batch_operation(op)
+            if normalized is None:
+                results.append({
+                    'id': op.get('id') if isinstance(op, dict) else None,
+                    'action': op.get('action') if isinstance(op, dict) else None,
+                    'success': False,
+                    'error': '操作格式无效'
+                })
+            else:
+                valid.append(normalized)
+                results.append(None)
+
+        applied = iter(Creation.apply_batch(current_user_id, valid) if valid else [])
+        results = [result if result is not None else next(applied) for result in results]
+
+        succeeded = sum(1 for result in results if result['success'])
+        if succeeded:
+            invalidate_cache_tags(f'user:{current_user_id}')
+
+        return jsonify({
+            'success': True,
+            'results': results,
+            'succeeded': succeeded,
+            'failed': len(results) - succeeded
+        }), 200
+
+    except Exception as e:
+        current_app.logger.error(f"批量操作作品失败: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': '批量操作失败'
+        }), 500
+
+
+def _normalize_batch_operation(op):
+    """校验单个批量操作并补全默认值（与单项接口一致），格式无效返回 None"""
+    from app.database import Creation
+
+    if not isinstance(op, dict):
+        return None
+    creation_id, action = op.get('id'), op.get('action')
+    if not isinstance(creation_id, int) or isinstance(creation_id, bool):
+        return None
+    if action not in Creation.BATCH_ACTIONS:
+        return None
+
+    normalized = {'id': creation_id, 'action': action}
+    if action == 'favorite':
+        normalized['is_favorite'] = bool(op.get('is_favorite', False))
+    elif action == 'tags':
+        tags = op.get('tags', '')
+        if not isinstance(tags, str):
+            return None
+        normalized['tags'] = tags
+    elif action == 'category':
+        category = op.get('category', 'general')
+        if not isinstance(category, str):
+            return None
+        normalized['category'] = category
+    return normalized
+
+
+@generate_bp.route('/gallery/export', methods=['GET'])
+@jwt_required()
+@rate_limit('export')
+def export_gallery():
+    """
+    导出用户全部作品（ZIP 流式下载）
+
+    归档包含 images/<作品ID>.<扩展名> 和 manifest.json（作品元数据、获取失败的原因），
+    边生成边发送，不在服务端缓存整个归档。
+    """
+    current_user_id = int(get_jwt_identity())
+
+    from app.services.gallery_export import GalleryExporter
+    from datetime import datetime
+
+    filename = f"gallery-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}.zip"
+    return current_app.response_class(
+        stream_with_context(GalleryExporter.stream(current_user_id)),
+        mimetype='application/zip',
+        headers={
+            'Content-Disposition': f'attachment; filename="{filename}"',
+            'Cache-Control': 'no-store',
+            # 关闭反向代理缓冲，数据块生成后立即发送
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+
 @generate_bp.route('/gallery/categories', methods=['GET'])
 @jwt_required()
+@user_version_etag
 @cache_response(ttl=300)  # 5分钟缓存
 def get_user_categories():
     """获取用户使用过的分类"""
@@ -455,6 +608,7 @@ def get_user_categories():
 
 @generate_bp.route('/gallery/tags', methods=['GET'])
 @jwt_required()
+@user_version_etag
 @cache_response(ttl=300)  # 5分钟缓存
 def get_user_tags():
     """获取用户常用标签"""
@@ -480,7 +634,8 @@ def get_user_tags():
 
 @generate_bp.route('/gallery/stats', methods=['GET'])
 @jwt_required()
-@cache_response(ttl=120)  # 2分钟缓存，因为统计信息可能变化较频繁
+@user_version_etag(date_scoped=True)  # 响应包含按天统计的 recent_week
+@cache_response(ttl=120, stale_ttl=600, lock_on_miss=True)  # 2分钟缓存，作品变更时按用户标签失效
 def get_user_gallery_stats():
     """获取用户画廊统计信息"""
     try:
@@ -611,23 +766,24 @@ def get_performance_analytics():
         hours = int(request.args.get('hours', 24))  # 默认24小时
         operation_type = request.args.get('operation_type')  # 可选的操作类型筛选
 
-        from app.database import PerformanceMetric
-
-        # 获取平均生成时间
-        avg_generation_time = PerformanceMetric.get_avg_generation_time(operation_type, hours)
-
-        # 获取错误率
-        error_rate = PerformanceMetric.get_error_rate(hours)
+        from app.database import PerformanceRollup
 
-        # 获取峰值负载
-        peak_load = PerformanceMetric.get_peak_load(hours)
+        # 读取分钟 / 小时汇总表（不扫描原始记录）
+        summary = PerformanceRollup.summarize(hours, operation_type)
+        overall = summary if not operation_type else PerformanceRollup.summarize(hours)
 
         return jsonify({
             'success': True,
             'analytics': {
-                'avg_generation_time': round(avg_generation_time, 2),
-                'error_rate': round(error_rate, 2),
-                'peak_server_load': round(peak_load, 3),
+                'avg_generation_time': summary['avg_generation_time'],
+                'min_generation_time': summary['min_generation_time'],
+                'max_generation_time': summary['max_generation_time'],
+                'avg_api_response_time': summary['avg_api_response_time'],
+                'request_count': summary['count'],
+                'error_rate': overall['error_rate'],
+                'peak_server_load': round(overall['peak_load'], 3),
+                'by_model': PerformanceRollup.breakdown(hours, 'model_used', operation_type),
+                'by_size': PerformanceRollup.breakdown(hours, 'image_size', operation_type),
                 'time_range_hours': hours,
                 'operation_type': operation_type or 'all'
             }
@@ -728,18 +884,22 @@ def get_daily_stats():
 
 @generate_bp.route('/analytics/system-insights', methods=['GET'])
 @jwt_required()
+# 全站聚合查询较重：过期后5分钟内先返回旧值，由单个请求刷新
+@cache_response(ttl=60, use_user_id=False, use_query_string=False,
+                stale_ttl=300, lock_on_miss=True, early_expiry_beta=1.0)
 def get_system_insights():
     """获取系统综合洞察"""
     try:
-        from app.database import PerformanceMetric, UserSession, Creation
+        from app.database import PerformanceRollup, UserSession
         current_user_id = int(get_jwt_identity())
 
-        # 获取综合性能指标
+        # 获取综合性能指标（读取汇总表）
+        summary_24h = PerformanceRollup.summarize(hours=24)
         performance_data = {
-            'avg_generation_time_24h': PerformanceMetric.get_avg_generation_time(hours=24),
-            'avg_generation_time_7d': PerformanceMetric.get_avg_generation_time(hours=168),
-            'error_rate_24h': PerformanceMetric.get_error_rate(hours=24),
-            'peak_load_24h': PerformanceMetric.get_peak_load(hours=24),
+            'avg_generation_time_24h': summary_24h['avg_generation_time'],
+            'avg_generation_time_7d': PerformanceRollup.summarize(hours=168)['avg_generation_time'],
+            'error_rate_24h': summary_24h['error_rate'],
+            'peak_load_24h': summary_24h['peak_load'],
             'active_sessions': UserSession.get_active_sessions_count()
         }
 
@@ -1,14 +1,16 @@
 """
 用户相关视图
 """
-from flask import Blueprint, jsonify, current_app
+from flask import Blueprint, jsonify, request, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from app.middleware.conditional import user_version_etag
 
 user_bp = Blueprint('user', __name__)
 
 
 @user_bp.route('/users/me', methods=['GET'])
 @jwt_required()
+@user_version_etag
 def get_current_user():
     """获取当前用户信息"""
     try:
@@ -39,6 +41,7 @@ def get_current_user():
 
 @user_bp.route('/users/me/credits', methods=['GET'])
 @jwt_required()
+@user_version_etag
 def get_user_credits():
     """获取用户次数"""
     try:
@@ -57,4 +60,28 @@ def get_user_credits():
 
     except Exception as e:
         current_app.logger.error(f"获取用户次数失败: {str(e)}")
-        return jsonify({'error': '获取用户次数失败'}), 500
\ No newline at end of file
+        return jsonify({'error': '获取用户次数失败'}), 500
+
+
+@user_bp.route('/users/me/credits/history', methods=['GET'])
+@jwt_required()
+@user_version_etag
+def get_user_credit_history():
+    """获取当前用户次数流水（按流水ID倒序，before_id 翻页）"""
+    try:
+        current_user_id = int(get_jwt_identity())
+
+        from app.database import CreditLedger
+        limit = max(1, min(request.args.get('limit', 20, type=int), 100))
+        before_id = request.args.get('before_id', type=int)
+
+        history = CreditLedger.get_history(current_user_id, limit=limit, before_id=before_id)
+
+        return jsonify({
+            'entries': history['entries'],
+            'next_before_id': history['next_before_id']
+        }), 200
+
+    except Exception as e:
+        current_app.logger.error(f"获取次数流水失败: {str(e)}")
+        return jsonify({'error': '获取次数流水失败'}), 500
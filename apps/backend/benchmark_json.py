@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+JSON 响应序列化基准测试
+在画廊列表和管理后台用户列表形状的数据上对比 Flask 默认序列化、标准库（FastJSONProvider 回退路径）和 orjson
+
+使用方法：
+    python benchmark_json.py [--per-page 50] [--repeat 2000]
+
+数据写入内存 SQLite，以 SELECT * 取出，与 Creation.get_by_user_with_filters 的结果形状一致。
+"""
+import argparse
+import json
+import random
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+# 添加app目录到路径
+sys.path.insert(0, str(Path(__file__).parent))
+
+from flask.json.provider import DefaultJSONProvider
+
+from app.utils.json_provider import _default, orjson
+
+PROMPTS = [
+    '樱花树下穿汉服的少女，柔和的逆光，宫崎骏风格，高清细节，4K 壁纸',
+    'a cyberpunk city street at night, neon reflections on wet asphalt, cinematic lighting, highly detailed',
+    '雪山下的湖泊倒映着星空，长曝光摄影，写实风格，广角镜头',
+    'astronaut riding a horse on the moon, oil painting, dramatic composition, golden hour',
+]
+
+
+def build_rows(per_page: int):
+    """生成一页画廊数据，返回 sqlite3.Row 列表"""
+    conn = sqlite3.connect(':memory:')
+    conn.row_factory = sqlite3.Row
+    conn.execute('''
+        CREATE TABLE creations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            prompt TEXT NOT NULL,
+            image_url TEXT NOT NULL,
+            model_used TEXT NOT NULL,
+            size TEXT NOT NULL,
+            generation_time REAL,
+            is_favorite BOOLEAN NOT NULL DEFAULT 0,
+            tags TEXT DEFAULT '',
+            category TEXT DEFAULT 'general',
+            visibility TEXT DEFAULT 'private',
+            created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    rng = random.Random(42)
+    conn.executemany(
+        'INSERT INTO creations (user_id, prompt, image_url, model_used, size, generation_time, '
+        'is_favorite, tags, category) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+        [(1, rng.choice(PROMPTS) * rng.randint(1, 3),
+          f'https://cdn.example.com/creations/2025/01/{i:08d}-{rng.getrandbits(64):016x}.png',
+          'nano-banana-hd', '16x9', round(rng.uniform(3, 30), 2), rng.random() < 0.2,
+          rng.choice(['风景,壁纸', 'portrait,anime', '', '动物']), rng.choice(['general', 'art', 'photo']))
+         for i in range(per_page)]
+    )
+    return conn.execute('SELECT * FROM creations ORDER BY created_at DESC').fetchall()
+
+
+def gallery_payload(creations):
+    """与 /api/gallery 响应结构一致"""
+    return {
+        'success': True,
+        'creations': creations,
+        'page': 1,
+        'per_page': len(creations),
+        'next_cursor': None,
+        'stats': {'total_creations': 1234, 'favorite_count': 256, 'total_generation_time': 18345.2}
+    }
+
+
+def flask_default(obj):
+    """Flask 默认 provider 的非调试输出（排序键、转义非 ASCII）"""
+    return json.dumps(obj, default=DefaultJSONProvider.default, ensure_ascii=True,
+                      sort_keys=True, separators=(',', ':')).encode('utf-8')
+
+
+def stdlib_fast(obj):
+    """FastJSONProvider 未安装 orjson 时的路径"""
+    return json.dumps(obj, default=_default, ensure_ascii=False,
+                      sort_keys=False, separators=(',', ':')).encode('utf-8')
+
+
+def orjson_fast(obj):
+    """FastJSONProvider 的 orjson 路径"""
+    return orjson.dumps(obj, default=_default,
+                        option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME)
+
+
+def timeit(fn, make_payload, repeat: int):
+    """返回 (平均微秒, 字节数)；make_payload 计入耗时（包含 dict(row) 转换的开销）"""
+    size = len(fn(make_payload()))
+    start = time.process_time()
+    for _ in range(repeat):
+        fn(make_payload())
+    return (time.process_time() - start) / repeat * 1e6, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description='JSON 响应序列化基准测试')
+    parser.add_argument('--per-page', type=int, default=50, help='每页作品数')
+    parser.add_argument('--repeat', type=int, default=2000, help='重复次数')
+    args = parser.parse_args()
+
+    rows = build_rows(args.per_page)
+    cases = [
+        ('Flask 默认 + dict(row)', flask_default, lambda: gallery_payload([dict(row) for row in rows])),
+        ('标准库 + sqlite3.Row', stdlib_fast, lambda: gallery_payload(rows)),
+    ]
+    if orjson is not None:
+        cases += [
+            ('orjson + dict(row)', orjson_fast, lambda: gallery_payload([dict(row) for row in rows])),
+            ('orjson + sqlite3.Row', orjson_fast, lambda: gallery_payload(rows)),
+        ]
+    else:
+        print("⚠️  未安装 orjson，只测试标准库路径（pip install orjson）")
+
+    print(f"📦 画廊响应: {args.per_page} 条作品, 重复 {args.repeat} 次（CPU 时间）")
+    print()
+    print(f"{'序列化方式':<26}{'CPU(μs)':>10}{'大小(B)':>10}{'加速比':>8}")
+    print('-' * 56)
+    baseline = None
+    for label, fn, make_payload in cases:
+        cpu_us, size = timeit(fn, make_payload, args.repeat)
+        baseline = baseline or cpu_us
+        print(f"{label:<22}{cpu_us:>12.1f}{size:>10}{baseline / cpu_us:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+画廊搜索性能基准测试
+在合成语料上对比 FTS5（unicode61 / trigram）索引与 LIKE 回退的查询耗时
+
+使用方法：
+    python benchmark_search.py [--rows 200000] [--users 1000] [--repeat 50]
+
+不连接线上数据库，语料写入临时 SQLite 文件，结束后自动删除。
+用户 1 为重度用户（约占 20% 作品），单独测试其稀有词查询。
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# 添加app目录到路径
+sys.path.insert(0, str(Path(__file__).parent))
+
+from app.database import CreationSearchIndex
+
+CN_SUBJECTS = ['可爱的猫咪', '雪山下的湖泊', '赛博朋克城市', '水墨山水画', '穿汉服的少女',
+               '未来感跑车', '星空下的帐篷', '樱花树下的小狗', '古风庭院', '深海里的鲸鱼']
+CN_STYLES = ['油画风格', '高清摄影', '动漫风格', '宫崎骏风格', '极简主义', '写实风格', '水彩插画']
+EN_SUBJECTS = ['a cute orange cat', 'mountain lake at sunrise', 'cyberpunk city street',
+               'astronaut riding a horse', 'robot reading a book', 'lighthouse in a storm']
+EN_STYLES = ['oil painting', 'high quality', 'detailed', 'cinematic lighting', 'watercolor', '4K']
+TAGS = ['风景', '人物', '动物', 'landscape', 'portrait', 'anime', '壁纸', '']
+RARE_PROMPT = '极光下的驯鹿，aurora borealis'
+
+HEAVY_USER_ID = 1
+HEAVY_USER_SHARE = 0.2
+RARE_SHARE = 0.001
+
+QUERIES = [
+    ('中文子串', '的猫咪'),
+    ('中文子串', '宫崎骏风格'),
+    ('中文短词(2字)', '汉服'),
+    ('英文单词', 'lighthouse'),
+    ('英文前缀', 'cyber'),
+]
+
+HEAVY_QUERIES = [
+    ('重度用户稀有中文', '驯鹿'),
+    ('重度用户稀有中文', '极光下的'),
+    ('重度用户稀有英文', 'aurora'),
+]
+
+
+def build_corpus(conn, rows: int, users: int):
+    """生成合成作品数据"""
+    conn.execute('''
+        CREATE TABLE creations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            prompt TEXT NOT NULL,
+            image_url TEXT NOT NULL,
+            model_used TEXT NOT NULL,
+            size TEXT NOT NULL,
+            generation_time REAL,
+            is_favorite BOOLEAN NOT NULL DEFAULT 0,
+            tags TEXT DEFAULT '',
+            category TEXT DEFAULT 'general',
+            visibility TEXT DEFAULT 'private',
+            created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('CREATE INDEX idx_creations_user_created ON creations(user_id, created_at DESC)')
+
+    rng = random.Random(42)
+
+    def make_row(i):
+        if rng.random() < RARE_SHARE:
+            prompt = RARE_PROMPT
+        elif rng.random() < 0.7:
+            prompt = f"{rng.choice(CN_SUBJECTS)}，{rng.choice(CN_STYLES)}，{rng.choice(CN_STYLES)}"
+        else:
+            prompt = f"{rng.choice(EN_SUBJECTS)}, {rng.choice(EN_STYLES)}, {rng.choice(EN_STYLES)}"
+        if rng.random() < HEAVY_USER_SHARE:
+            user_id = HEAVY_USER_ID
+        else:
+            user_id = rng.randint(2, users)
+        return (user_id, prompt, f'https://example.com/{i}.png',
+                'nano-banana', '1x1', rng.choice(TAGS))
+
+    batch = []
+    for i in range(rows):
+        batch.append(make_row(i))
+        if len(batch) >= 10000:
+            conn.executemany(
+                'INSERT INTO creations (user_id, prompt, image_url, model_used, size, tags) '
+                'VALUES (?, ?, ?, ?, ?, ?)', batch
+            )
+            batch = []
+    if batch:
+        conn.executemany(
+            'INSERT INTO creations (user_id, prompt, image_url, model_used, size, tags) '
+            'VALUES (?, ?, ?, ?, ?, ?)', batch
+        )
+    conn.commit()
+
+
+def like_search(conn, user_id: int, search: str, limit: int = 20):
+    """LIKE 回退路径（与 Creation.get_by_user_with_filters 一致）"""
+    return conn.execute(
+        '''SELECT c.* FROM creations c
+           WHERE c.user_id = ? AND (c.prompt LIKE ? OR c.tags LIKE ?)
+           ORDER BY c.created_at DESC
+           LIMIT ?''',
+        (user_id, f'%{search}%', f'%{search}%', limit)
+    ).fetchall()
+
+
+def fts_search(conn, user_id: int, search: str, limit: int = 20):
+    """FTS5 路径（与 Creation.get_by_user_with_filters 的模式选择一致）"""
+    mode = CreationSearchIndex.resolve_mode(search)
+    table = CreationSearchIndex.TRIGRAM_INDEX if mode == 'substring' else CreationSearchIndex.WORD_INDEX
+    conditions, params = ['c.user_id = ?'], [user_id]
+    if mode == 'substring':
+        for term in CreationSearchIndex.short_terms(search):
+            conditions.append('(c.prompt LIKE ? OR c.tags LIKE ?)')
+            params.extend([f'%{term}%', f'%{term}%'])
+    match_query = CreationSearchIndex.build_match_query(search, mode)
+    if not match_query:
+        return like_search(conn, user_id, search, limit)
+    return CreationSearchIndex.search(conn, user_id, match_query, conditions, params, limit, table=table)
+
+
+def timeit(fn, conn, users: int, search: str, repeat: int, user_id: int = None):
+    """返回 (平均毫秒, 平均命中数)，未指定 user_id 时随机抽取普通用户"""
+    rng = random.Random(7)
+    hits = 0
+    start = time.perf_counter()
+    for _ in range(repeat):
+        hits += len(fn(conn, user_id or rng.randint(2, users), search))
+    elapsed = time.perf_counter() - start
+    return elapsed / repeat * 1000, hits / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description='画廊搜索性能基准测试')
+    parser.add_argument('--rows', type=int, default=200000, help='合成作品数量')
+    parser.add_argument('--users', type=int, default=1000, help='用户数量')
+    parser.add_argument('--repeat', type=int, default=50, help='每个查询重复次数')
+    args = parser.parse_args()
+
+    fd, db_path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+
+    try:
+        conn = sqlite3.connect(db_path)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode = WAL')
+
+        print(f"📝 生成合成语料: {args.rows} 条作品, {args.users} 个用户...")
+        start = time.perf_counter()
+        build_corpus(conn, args.rows, args.users)
+        print(f"   耗时 {time.perf_counter() - start:.2f}秒")
+
+        print("🔨 构建搜索索引...")
+        start = time.perf_counter()
+        CreationSearchIndex.ensure(conn)
+        conn.commit()
+        print(f"   耗时 {time.perf_counter() - start:.2f}秒")
+        print(f"📁 数据库大小: {os.path.getsize(db_path) / 1024 / 1024:.2f} MB")
+        print()
+
+        print(f"{'查询类型':<16}{'关键词':<14}{'LIKE(ms)':>10}{'FTS5(ms)':>10}{'加速比':>8}{'命中/页':>8}")
+        print('-' * 66)
+        for label, search in QUERIES:
+            like_ms, _ = timeit(like_search, conn, args.users, search, args.repeat)
+            fts_ms, hits = timeit(fts_search, conn, args.users, search, args.repeat)
+            speedup = like_ms / fts_ms if fts_ms else float('inf')
+            print(f"{label:<14}{search:<12}{like_ms:>10.3f}{fts_ms:>10.3f}{speedup:>7.1f}x{hits:>8.1f}")
+        for label, search in HEAVY_QUERIES:
+            like_ms, _ = timeit(like_search, conn, args.users, search, args.repeat, HEAVY_USER_ID)
+            fts_ms, hits = timeit(fts_search, conn, args.users, search, args.repeat, HEAVY_USER_ID)
+            speedup = like_ms / fts_ms if fts_ms else float('inf')
+            print(f"{label:<14}{search:<12}{like_ms:>10.3f}{fts_ms:>10.3f}{speedup:>7.1f}x{hits:>8.1f}")
+
+        conn.close()
+    finally:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
+
+
+if __name__ == '__main__':
+    main()
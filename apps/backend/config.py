@@ -15,6 +15,41 @@ class Config:
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY') or SECRET_KEY
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=2)  # 从24h缩短为2h
     JWT_REFRESH_TOKEN_EXPIRES = timedelta(days=30)
+    # JWT撤销缓存跨进程同步间隔（秒）：其他 worker 的登出最多延迟该时长生效
+    JWT_REVOCATION_SYNC_INTERVAL = float(os.environ.get('JWT_REVOCATION_SYNC_INTERVAL', 2))
+    # 角色权限缓存：最多缓存的用户数；版本检查间隔（秒），其他 worker 的角色变更最多延迟该时长生效
+    PERMISSION_CACHE_MAX_USERS = int(os.environ.get('PERMISSION_CACHE_MAX_USERS', 10000))
+    PERMISSION_VERSION_CHECK_INTERVAL = float(os.environ.get('PERMISSION_VERSION_CHECK_INTERVAL', 2))
+    # 密码哈希进程池：进程数（0 表示在请求线程内计算）、排队上限、单次等待超时（秒）
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+    PASSWORD_HASH_MAX_QUEUE = int(os.environ.get('PASSWORD_HASH_MAX_QUEUE', 32))
+    PASSWORD_HASH_TIMEOUT = float(os.environ.get('PASSWORD_HASH_TIMEOUT', 5))
+    # 速率限制：memory 为每个 worker 独立计数；sqlite 为所有 worker 共享（独立数据库文件）
+    RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND', 'memory')
+    RATE_LIMIT_DB_PATH = os.environ.get('RATE_LIMIT_DB_PATH')  # 默认 instance/rate_limits.db
+    RATE_LIMIT_MAX_KEYS = int(os.environ.get('RATE_LIMIT_MAX_KEYS', 100000))
+    # 响应缓存容量（每个 worker）：最大条目数和响应体总字节数
+    RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', 5000))
+    RESPONSE_CACHE_MAX_BYTES = int(os.environ.get('RESPONSE_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+    # 二级响应缓存：sqlite 为同一节点所有 worker 共享（独立数据库文件），留空不启用
+    RESPONSE_CACHE_L2 = os.environ.get('RESPONSE_CACHE_L2', '')
+    RESPONSE_CACHE_L2_PATH = os.environ.get('RESPONSE_CACHE_L2_PATH')  # 默认 instance/response_cache.db
+    RESPONSE_CACHE_L2_MAX_BYTES = int(os.environ.get('RESPONSE_CACHE_L2_MAX_BYTES', 256 * 1024 * 1024))
+    # 失效广播同步间隔（秒）：其他 worker 的一级缓存最多延迟该时长失效
+    RESPONSE_CACHE_L2_SYNC_INTERVAL = float(os.environ.get('RESPONSE_CACHE_L2_SYNC_INTERVAL', 1))
+    # 响应压缩：超过 COMPRESSION_MIN_SIZE 字节的文本/JSON 响应按 Accept-Encoding 进行 gzip 压缩
+    COMPRESSION_ENABLED = os.environ.get('COMPRESSION_ENABLED', 'true').lower() == 'true'
+    COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', 1024))
+    COMPRESSION_LEVEL = int(os.environ.get('COMPRESSION_LEVEL', 6))
+    # 画廊 ZIP 导出：同时获取的图片数；图片本地镜像目录（<目录>/<域名>/<路径>，留空则全部远程获取）
+    GALLERY_EXPORT_CONCURRENCY = int(os.environ.get('GALLERY_EXPORT_CONCURRENCY', 4))
+    GALLERY_EXPORT_MIRROR_DIR = os.environ.get('GALLERY_EXPORT_MIRROR_DIR', '')
+    # JSON 响应序列化：安装了 orjson 时默认使用，设为 false 强制使用标准库 json
+    JSON_FAST_ENCODER = os.environ.get('JSON_FAST_ENCODER', 'true').lower() == 'true'
+    # 性能指标保留期（天）：原始记录降采样进汇总表后删除；分钟汇总 / 小时汇总分别保留（flask prune-performance-metrics）
+    PERFORMANCE_RAW_RETENTION_DAYS = int(os.environ.get('PERFORMANCE_RAW_RETENTION_DAYS', 7))
+    PERFORMANCE_MINUTE_RETENTION_DAYS = int(os.environ.get('PERFORMANCE_MINUTE_RETENTION_DAYS', 3))
+    PERFORMANCE_HOUR_RETENTION_DAYS = int(os.environ.get('PERFORMANCE_HOUR_RETENTION_DAYS', 400))
 
     # 外部API配置
     OPENAI_HK_API_KEY = os.environ.get('OPENAI_HK_API_KEY')
@@ -29,6 +64,9 @@ class Config:
     # 上传配置
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB
 
+    # 次数预留清理间隔（秒），0 表示不启动后台清理线程
+    CREDIT_HOLD_SWEEP_INTERVAL = int(os.environ.get('CREDIT_HOLD_SWEEP_INTERVAL', 60))
+
 
 class DevelopmentConfig(Config):
     """开发环境配置"""
@@ -22,6 +22,10 @@ def fix_user_id_constraint():
         # 1. 开始事务
         cursor.execute('BEGIN TRANSACTION')
 
+        # 搜索索引的内容视图引用 creations，重建表前先删除；
+        # 视图和 creations 上的触发器会在应用启动时由 init_db 重新创建
+        cursor.execute('DROP VIEW IF EXISTS creations_search_source')
+
         # 2. 创建新表 (user_id 允许 NULL)
         cursor.execute('''
             CREATE TABLE creations_new (
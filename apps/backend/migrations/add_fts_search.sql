@@ -1,44 +1,85 @@
 -- ========================================
 -- SQLite FTS5 全文搜索优化迁移脚本
 -- 用于优化画廊搜索性能（适用于 1000+ 作品）
+-- 应用启动时 init_db 会自动执行同样的迁移，本脚本用于手动维护
 -- ========================================
 
--- 1. 创建 FTS5 虚拟表（简化版，不使用外部内容表）
+-- 1. 索引内容视图：外部内容表读取的列必须与触发器写入的值一致
+CREATE VIEW IF NOT EXISTS creations_search_source AS
+SELECT id, prompt, COALESCE(tags, '') AS tags, '<' || user_id || '>' AS owner
+FROM creations;
+
+-- 2. 分词索引（unicode61），英文按词 / 前缀搜索
 CREATE VIRTUAL TABLE IF NOT EXISTS creations_fts USING fts5(
-    creation_id,  -- 作品ID（用于关联）
     prompt,       -- 索引提示词
-    tags          -- 索引标签
+    tags,         -- 索引标签
+    owner,        -- 作者标记 "<user_id>"，查询时与搜索词求交集
+    content='creations_search_source',
+    content_rowid='id'
 );
 
--- 2. 触发器：同步 INSERT 操作
-CREATE TRIGGER IF NOT EXISTS creations_fts_insert 
-AFTER INSERT ON creations 
+CREATE TRIGGER IF NOT EXISTS creations_fts_insert
+AFTER INSERT ON creations
 BEGIN
-    INSERT INTO creations_fts(creation_id, prompt, tags)
-    VALUES (new.id, new.prompt, COALESCE(new.tags, ''));
+    INSERT INTO creations_fts(rowid, prompt, tags, owner)
+    VALUES (new.id, new.prompt, COALESCE(new.tags, ''), '<' || new.user_id || '>');
 END;
 
--- 3. 触发器：同步 UPDATE 操作
-CREATE TRIGGER IF NOT EXISTS creations_fts_update 
-AFTER UPDATE ON creations 
+-- 仅 prompt / tags / user_id 变化时同步，收藏、分类更新不触碰索引
+CREATE TRIGGER IF NOT EXISTS creations_fts_update
+AFTER UPDATE OF prompt, tags, user_id ON creations
 BEGIN
-    DELETE FROM creations_fts WHERE creation_id = old.id;
-    INSERT INTO creations_fts(creation_id, prompt, tags)
-    VALUES (new.id, new.prompt, COALESCE(new.tags, ''));
+    INSERT INTO creations_fts(creations_fts, rowid, prompt, tags, owner)
+    VALUES ('delete', old.id, old.prompt, COALESCE(old.tags, ''), '<' || old.user_id || '>');
+    INSERT INTO creations_fts(rowid, prompt, tags, owner)
+    VALUES (new.id, new.prompt, COALESCE(new.tags, ''), '<' || new.user_id || '>');
 END;
 
--- 4. 触发器：同步 DELETE 操作
-CREATE TRIGGER IF NOT EXISTS creations_fts_delete 
-AFTER DELETE ON creations 
+CREATE TRIGGER IF NOT EXISTS creations_fts_delete
+AFTER DELETE ON creations
 BEGIN
-    DELETE FROM creations_fts WHERE creation_id = old.id;
+    INSERT INTO creations_fts(creations_fts, rowid, prompt, tags, owner)
+    VALUES ('delete', old.id, old.prompt, COALESCE(old.tags, ''), '<' || old.user_id || '>');
 END;
 
--- 5. 初始化：导入现有数据到 FTS5 表
-INSERT INTO creations_fts(creation_id, prompt, tags)
-SELECT id, prompt, COALESCE(tags, '') 
-FROM creations;
+-- 3. trigram 子串索引：unicode61 不对中文分词，中文提示词走该索引做子串匹配
+CREATE VIRTUAL TABLE IF NOT EXISTS creations_fts_trigram USING fts5(
+    prompt,       -- 索引提示词
+    tags,         -- 索引标签
+    owner,        -- 作者标记 "<user_id>"，查询时与搜索词求交集
+    content='creations_search_source',
+    content_rowid='id',
+    tokenize='trigram'
+);
 
--- 6. 优化 FTS5 索引（可选，提升查询性能）
-INSERT INTO creations_fts(creations_fts) VALUES('optimize');
+CREATE TRIGGER IF NOT EXISTS creations_fts_trigram_insert
+AFTER INSERT ON creations
+BEGIN
+    INSERT INTO creations_fts_trigram(rowid, prompt, tags, owner)
+    VALUES (new.id, new.prompt, COALESCE(new.tags, ''), '<' || new.user_id || '>');
+END;
 
+-- 仅 prompt / tags / user_id 变化时同步，收藏、分类更新不触碰索引
+CREATE TRIGGER IF NOT EXISTS creations_fts_trigram_update
+AFTER UPDATE OF prompt, tags, user_id ON creations
+BEGIN
+    INSERT INTO creations_fts_trigram(creations_fts_trigram, rowid, prompt, tags, owner)
+    VALUES ('delete', old.id, old.prompt, COALESCE(old.tags, ''), '<' || old.user_id || '>');
+    INSERT INTO creations_fts_trigram(rowid, prompt, tags, owner)
+    VALUES (new.id, new.prompt, COALESCE(new.tags, ''), '<' || new.user_id || '>');
+END;
+
+CREATE TRIGGER IF NOT EXISTS creations_fts_trigram_delete
+AFTER DELETE ON creations
+BEGIN
+    INSERT INTO creations_fts_trigram(creations_fts_trigram, rowid, prompt, tags, owner)
+    VALUES ('delete', old.id, old.prompt, COALESCE(old.tags, ''), '<' || old.user_id || '>');
+END;
+
+-- 4. 初始化：从 creations 重建索引
+INSERT INTO creations_fts(creations_fts) VALUES('rebuild');
+INSERT INTO creations_fts_trigram(creations_fts_trigram) VALUES('rebuild');
+
+-- 5. 优化 FTS5 索引（可选，提升查询性能；线上可改用 flask search-index optimize 增量合并）
+INSERT INTO creations_fts(creations_fts) VALUES('optimize');
+INSERT INTO creations_fts_trigram(creations_fts_trigram) VALUES('optimize');
@@ -150,5 +150,84 @@ JOIN role_permissions rp ON r.id = rp.role_id
 JOIN permissions p ON rp.permission_id = p.id
 WHERE u.is_active = 1;
 
+-- 11. 角色权限版本计数（应用内权限缓存据此失效，任何角色/权限变更都会递增）
+CREATE TABLE IF NOT EXISTS rbac_version (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    version INTEGER NOT NULL DEFAULT 0
+);
+INSERT OR IGNORE INTO rbac_version (id, version) VALUES (1, 0);
+
+CREATE TRIGGER IF NOT EXISTS user_roles_rbac_version_insert
+AFTER INSERT ON user_roles
+BEGIN
+    UPDATE rbac_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS user_roles_rbac_version_update
+AFTER UPDATE ON user_roles
+BEGIN
+    UPDATE rbac_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS user_roles_rbac_version_delete
+AFTER DELETE ON user_roles
+BEGIN
+    UPDATE rbac_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS role_permissions_rbac_version_insert
+AFTER INSERT ON role_permissions
+BEGIN
+    UPDATE rbac_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS role_permissions_rbac_version_update
+AFTER UPDATE ON role_permissions
+BEGIN
+    UPDATE rbac_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS role_permissions_rbac_version_delete
+AFTER DELETE ON role_permissions
+BEGIN
+    UPDATE rbac_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS roles_rbac_version_insert
+AFTER INSERT ON roles
+BEGIN
+    UPDATE rbac_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS roles_rbac_version_update
+AFTER UPDATE ON roles
+BEGIN
+    UPDATE rbac_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS roles_rbac_version_delete
+AFTER DELETE ON roles
+BEGIN
+    UPDATE rbac_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS permissions_rbac_version_insert
+AFTER INSERT ON permissions
+BEGIN
+    UPDATE rbac_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS permissions_rbac_version_update
+AFTER UPDATE ON permissions
+BEGIN
+    UPDATE rbac_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS permissions_rbac_version_delete
+AFTER DELETE ON permissions
+BEGIN
+    UPDATE rbac_version SET version = version + 1 WHERE id = 1;
+END;
+
 -- 完成迁移
 SELECT 'Role system migration completed successfully!' AS status;
\ No newline at end of file
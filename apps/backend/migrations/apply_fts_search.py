@@ -72,7 +72,12 @@ def apply_fts_search(force=False):
             cursor.execute("DROP TRIGGER IF EXISTS creations_fts_insert")
             cursor.execute("DROP TRIGGER IF EXISTS creations_fts_update")
             cursor.execute("DROP TRIGGER IF EXISTS creations_fts_delete")
+            cursor.execute("DROP TRIGGER IF EXISTS creations_fts_trigram_insert")
+            cursor.execute("DROP TRIGGER IF EXISTS creations_fts_trigram_update")
+            cursor.execute("DROP TRIGGER IF EXISTS creations_fts_trigram_delete")
             cursor.execute("DROP TABLE IF EXISTS creations_fts")
+            cursor.execute("DROP TABLE IF EXISTS creations_fts_trigram")
+            cursor.execute("DROP VIEW IF EXISTS creations_search_source")
             conn.commit()
         
         # 执行 SQL 脚本
@@ -98,21 +103,20 @@ def apply_fts_search(force=False):
             WHERE type='trigger' AND name LIKE 'creations_fts_%'
         """)
         triggers = cursor.fetchall()
-        if len(triggers) != 3:
-            raise Exception(f"触发器创建不完整，预期 3 个，实际 {len(triggers)} 个")
+        if len(triggers) != 6:
+            raise Exception(f"触发器创建不完整，预期 6 个，实际 {len(triggers)} 个")
         print(f"   ✓ {len(triggers)} 个触发器创建成功")
         
         # 统计导入的数据
         cursor.execute("SELECT COUNT(*) as count FROM creations")
         total_creations = cursor.fetchone()['count']
         
-        cursor.execute("SELECT COUNT(*) as count FROM creations_fts")
-        total_fts = cursor.fetchone()['count']
-        
-        print(f"   ✓ 数据导入成功: {total_fts} / {total_creations} 条记录")
-        
-        if total_fts != total_creations:
-            print(f"   ⚠️  警告：FTS 记录数与作品数不一致")
+        # 外部内容表的 COUNT(*) 直接读 creations，改用 integrity-check 校验索引与内容一致
+        cursor.execute("INSERT INTO creations_fts(creations_fts, rank) VALUES('integrity-check', 1)")
+        cursor.execute(
+            "INSERT INTO creations_fts_trigram(creations_fts_trigram, rank) VALUES('integrity-check', 1)"
+        )
+        print(f"   ✓ 索引校验通过: {total_creations} 条记录")
         
         conn.close()
         
@@ -122,12 +126,13 @@ def apply_fts_search(force=False):
         print()
         print("📊 迁移统计:")
         print(f"   - 总作品数: {total_creations}")
-        print(f"   - FTS索引数: {total_fts}")
         print(f"   - 触发器数: {len(triggers)}")
         print()
         print("🎯 性能优化:")
         print("   - 搜索速度预计提升 90%+")
-        print("   - 支持多关键词搜索")
+        print("   - 支持多关键词搜索，按 BM25 相关度排序")
+        print("   - 中文提示词支持子串搜索（trigram 索引）")
+        print("   - 按作者列过滤，查询成本与平台总作品量无关")
         print("   - 自动同步新数据")
         print("=" * 60)
         
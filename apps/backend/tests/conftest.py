@@ -0,0 +1,40 @@
+"""
+测试公共夹具
+"""
+import pytest
+from flask import Flask
+
+
+@pytest.fixture
+def db_app(tmp_path):
+    """使用临时 instance 目录（独立 SQLite 文件）的最小应用，已建好全部表和触发器"""
+    from app.database import close_db, init_db
+
+    app = Flask('app', instance_path=str(tmp_path))
+    app.config['TESTING'] = True
+    app.teardown_appcontext(close_db)
+    with app.app_context():
+        init_db()
+    return app
+
+
+@pytest.fixture
+def db(db_app):
+    """应用上下文内的数据库连接"""
+    from app.database import get_db
+
+    with db_app.app_context():
+        yield get_db()
+
+
+@pytest.fixture
+def make_user(db):
+    """创建用户并返回 id"""
+    def _make_user(email='user@example.com', credits=0):
+        user_id = db.execute(
+            'INSERT INTO users (email, password_hash, credits) VALUES (?, ?, ?) RETURNING id',
+            (email, 'hash', credits)
+        ).fetchone()['id']
+        db.commit()
+        return user_id
+    return _make_user
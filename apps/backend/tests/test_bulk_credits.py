@@ -0,0 +1,125 @@
+"""
+批量充值测试
+"""
+import io
+import sqlite3
+
+import pytest
+from flask import g
+
+from app.database import CreditLedger, User
+
+
+class FailingLookupConnection:
+    """第 fail_on 次用户查询时抛出 sqlite3.Error，其余调用转发给真实连接"""
+
+    def __init__(self, conn, fail_on):
+        self._conn = conn
+        self._lookups = 0
+        self._fail_on = fail_on
+
+    def execute(self, sql, *args):
+        if sql.startswith('SELECT id') and 'IN (' in sql:
+            self._lookups += 1
+            if self._lookups == self._fail_on:
+                raise sqlite3.OperationalError('database is locked')
+        return self._conn.execute(sql, *args)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+class TestBulkAddCredits:
+    """分块充值"""
+
+    def test_applies_and_reports_per_row(self, db, make_user):
+        alice = make_user('alice@example.com')
+        bob = make_user('bob@example.com')
+
+        result = User.bulk_add_credits([
+            (1, str(alice), 3),
+            (2, 'bob@example.com', 2),
+            (3, 'nobody@example.com', 1),
+            (4, 'bob@example.com', 0),
+        ], chunk_size=2)
+
+        assert result['applied'] == 2
+        assert result['credits_added'] == 5
+        assert [(f['row'], f['error']) for f in result['failed']] == [
+            (3, '用户不存在'), (4, '充值次数必须是 1-1000 的整数')
+        ]
+        assert CreditLedger.verify(alice)['credits'] == 3
+        assert CreditLedger.verify(bob)['consistent'] is True
+
+    def test_lookup_failure_only_fails_its_chunk(self, db, make_user):
+        ids = [make_user(f'user{i}@example.com') for i in range(4)]
+        g.db = FailingLookupConnection(db, fail_on=1)
+
+        result = User.bulk_add_credits([(i + 1, user_id, 1) for i, user_id in enumerate(ids)], chunk_size=2)
+
+        assert result['applied'] == 2
+        assert [f['row'] for f in result['failed']] == [1, 2]
+        assert all(f['error'].startswith('写入失败') for f in result['failed'])
+        credits = [db.execute('SELECT credits FROM users WHERE id = ?', (i,)).fetchone()[0] for i in ids]
+        assert credits == [0, 0, 1, 1]
+
+
+@pytest.fixture
+def admin_views(monkeypatch):
+    """导入管理员视图（加密服务在导入时读取密钥），跳过 JWT 和角色校验"""
+    monkeypatch.setenv('ENCRYPTION_MASTER_KEY', 'test-master-key')
+    monkeypatch.setenv('ENCRYPTION_SALT', 'test-salt')
+    from app.views import admin
+
+    monkeypatch.setattr(admin, 'get_jwt_identity', lambda: '1')
+    view = admin.bulk_add_credits
+    while hasattr(view, '__wrapped__'):
+        view = view.__wrapped__
+    return view
+
+
+def upload_csv(db_app, view, content):
+    with db_app.test_request_context(
+        '/admin/add-credits/bulk', method='POST',
+        data={'file': (io.BytesIO(content), 'credits.csv')}, content_type='multipart/form-data'
+    ):
+        response, status = view()
+        return status, response.get_json()
+
+
+class TestBulkCreditCsv:
+    """CSV 上传先完整校验再执行"""
+
+    def test_corrupt_row_rejects_whole_file(self, db_app, db, make_user, admin_views):
+        ids = [make_user(f'user{i}@example.com') for i in range(800)]
+        lines = [b'user,credits'] + [f'{user_id},1'.encode() for user_id in ids]
+        lines[700] = b'\xff\xfe,1'
+
+        status, body = upload_csv(db_app, admin_views, b'\n'.join(lines))
+
+        assert status == 400
+        assert '第 701 行' in body['error']
+        # 前 500 行所在的块也没有提交
+        assert db.execute('SELECT SUM(credits) FROM users').fetchone()[0] == 0
+        assert db.execute('SELECT COUNT(*) FROM credit_ledger').fetchone()[0] == 0
+
+    def test_malformed_csv_rejected(self, db_app, db, make_user, admin_views):
+        user_id = make_user()
+        content = f'{user_id},1\n{user_id},"2\n'.encode()
+
+        status, body = upload_csv(db_app, admin_views, content)
+
+        assert status == 400
+        assert '格式错误' in body['error']
+        assert db.execute('SELECT credits FROM users WHERE id = ?', (user_id,)).fetchone()[0] == 0
+
+    def test_valid_csv_applied(self, db_app, db, make_user, admin_views):
+        alice = make_user('alice@example.com')
+        content = '﻿用户,次数\nalice@example.com,3\n\nnobody@example.com,1\n'.encode()
+
+        status, body = upload_csv(db_app, admin_views, content)
+
+        assert status == 200
+        assert body['data']['applied'] == 1
+        assert [f['row'] for f in body['data']['failed']] == [4]
+        assert CreditLedger.verify(alice) == {'credits': 3, 'ledger_balance': 3, 'consistent': True}
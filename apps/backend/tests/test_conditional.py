@@ -0,0 +1,88 @@
+"""
+用户数据版本与条件请求测试
+"""
+from datetime import datetime
+
+import pytest
+from flask import jsonify
+
+from app.database import UserDataVersion
+from app.middleware import conditional
+from app.middleware.conditional import user_version_etag
+
+
+class FrozenDatetime(datetime):
+    """utcnow 返回可调整的固定时间"""
+    now_value = datetime(2026, 1, 1, 23, 59)
+
+    @classmethod
+    def utcnow(cls):
+        return cls.now_value
+
+
+@pytest.fixture
+def client(db_app, make_user, monkeypatch):
+    """/plain 只按数据版本，/daily 同时按日期；身份固定为用户 1"""
+    with db_app.app_context():
+        make_user('owner@example.com')
+    monkeypatch.setattr(conditional, 'get_jwt_identity', lambda: '1')
+    monkeypatch.setattr(conditional, 'datetime', FrozenDatetime)
+    monkeypatch.setattr(FrozenDatetime, 'now_value', datetime(2026, 1, 1, 23, 59))
+
+    db_app.add_url_rule('/plain', 'plain', user_version_etag(lambda: jsonify({'ok': True})))
+    db_app.add_url_rule('/daily', 'daily', user_version_etag(date_scoped=True)(lambda: jsonify({'ok': True})))
+    return db_app.test_client()
+
+
+def revalidate(client, path):
+    etag = client.get(path).headers['ETag']
+    return client.get(path, headers={'If-None-Match': etag}).status_code, etag
+
+
+class TestUserVersionEtag:
+    """304 与 ETag 变化"""
+
+    def test_unchanged_version_returns_304(self, client):
+        status, etag = revalidate(client, '/plain')
+        assert status == 304
+        assert etag.startswith('W/')
+
+    def test_write_changes_etag(self, db_app, client):
+        etag = client.get('/plain').headers['ETag']
+        with db_app.app_context():
+            from app.database import get_db
+            get_db().execute('UPDATE users SET credits = credits + 1 WHERE id = 1')
+            get_db().commit()
+
+        assert client.get('/plain', headers={'If-None-Match': etag}).status_code == 200
+
+    def test_date_scoped_etag_changes_after_midnight(self, client, monkeypatch):
+        status, etag = revalidate(client, '/daily')
+        assert status == 304
+
+        monkeypatch.setattr(FrozenDatetime, 'now_value', datetime(2026, 1, 2, 0, 1))
+        response = client.get('/daily', headers={'If-None-Match': etag})
+        assert response.status_code == 200
+        assert response.headers['ETag'] != etag
+        # 版本未变的普通端点不受日期影响
+        assert revalidate(client, '/plain')[0] == 304
+
+
+class TestUserDataVersionTriggers:
+    """作品写入递增所有者版本"""
+
+    def test_creation_update_bumps_old_and_new_owner(self, db, make_user):
+        first = make_user('first@example.com')
+        second = make_user('second@example.com')
+        db.execute("INSERT INTO creations (user_id, prompt, image_url, model_used, size) "
+                   "VALUES (?, 'p', 'u', 'm', '1x1')", (first,))
+        db.commit()
+        before = (UserDataVersion.get(first), UserDataVersion.get(second))
+
+        db.execute('UPDATE creations SET is_favorite = 1')
+        db.commit()
+        assert (UserDataVersion.get(first), UserDataVersion.get(second)) == (before[0] + 1, before[1])
+
+        db.execute('UPDATE creations SET user_id = ?', (second,))
+        db.commit()
+        assert (UserDataVersion.get(first), UserDataVersion.get(second)) == (before[0] + 2, before[1] + 1)
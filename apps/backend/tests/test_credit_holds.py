@@ -0,0 +1,111 @@
+"""
+次数预留测试
+"""
+import pytest
+
+from app.database import CreditHold, Creation, CreationTag
+
+
+def credits_of(db, user_id):
+    return db.execute('SELECT credits FROM users WHERE id = ?', (user_id,)).fetchone()['credits']
+
+
+def status_of(db, hold_id):
+    return db.execute('SELECT status FROM credit_holds WHERE id = ?', (hold_id,)).fetchone()['status']
+
+
+class TestCreditHold:
+    """预留 / 确认 / 释放 / 过期"""
+
+    def test_place_deducts_credits(self, db, make_user):
+        user_id = make_user(credits=3)
+        hold = CreditHold.place(user_id, 2)
+
+        assert hold['available'] == 1
+        assert credits_of(db, user_id) == 1
+        assert status_of(db, hold['hold_id']) == 'held'
+
+    def test_place_insufficient_credits(self, db, make_user):
+        user_id = make_user(credits=1)
+
+        assert CreditHold.place(user_id, 2) is None
+        assert credits_of(db, user_id) == 1
+        assert db.execute('SELECT COUNT(*) FROM credit_holds').fetchone()[0] == 0
+
+    def test_confirm_keeps_deduction(self, db, make_user):
+        user_id = make_user(credits=3)
+        hold_id = CreditHold.place(user_id, 1)['hold_id']
+
+        assert CreditHold.confirm(hold_id) is True
+        assert credits_of(db, user_id) == 2
+        # 已确认的预留不能再释放
+        assert CreditHold.release(hold_id) is False
+        assert credits_of(db, user_id) == 2
+
+    def test_release_refunds_once(self, db, make_user):
+        user_id = make_user(credits=3)
+        hold_id = CreditHold.place(user_id, 1)['hold_id']
+
+        assert CreditHold.release(hold_id) is True
+        assert CreditHold.release(hold_id) is False
+        assert credits_of(db, user_id) == 3
+        assert status_of(db, hold_id) == 'released'
+        # 已释放的预留不能再确认
+        assert CreditHold.confirm(hold_id) is False
+
+    def test_expire_stale_refunds_only_expired(self, db, make_user):
+        user_id = make_user(credits=5)
+        stale = CreditHold.place(user_id, 2)['hold_id']
+        fresh = CreditHold.place(user_id, 1)['hold_id']
+        db.execute("UPDATE credit_holds SET expires_at = datetime('now', '-1 minute') WHERE id = ?", (stale,))
+        db.commit()
+
+        assert CreditHold.expire_stale() == 1
+        assert credits_of(db, user_id) == 4
+        assert status_of(db, stale) == 'expired'
+        assert status_of(db, fresh) == 'held'
+        # 过期后确认失败，次数不会被扣两次
+        assert CreditHold.confirm(stale) is False
+        assert CreditHold.expire_stale() == 0
+        assert credits_of(db, user_id) == 4
+
+
+class TestCreateManyWithHold:
+    """保存作品时的预留结算"""
+
+    def test_confirms_hold_with_creations(self, db, make_user):
+        user_id = make_user(credits=2)
+        hold_id = CreditHold.place(user_id, 1)['hold_id']
+
+        saved = Creation.create_many(user_id, 'prompt', ['u1', 'u2'], 'model', '1x1', hold_id=hold_id)
+
+        assert [c['image_url'] for c in saved['creations']] == ['u1', 'u2']
+        assert saved['remaining_credits'] == 1
+        assert status_of(db, hold_id) == 'confirmed'
+
+    def test_no_images_releases_hold(self, db, make_user):
+        user_id = make_user(credits=2)
+        hold_id = CreditHold.place(user_id, 1)['hold_id']
+
+        saved = Creation.create_many(user_id, 'prompt', [], 'model', '1x1', hold_id=hold_id)
+
+        assert saved['creations'] == []
+        assert status_of(db, hold_id) == 'released'
+        assert credits_of(db, user_id) == 2
+
+    def test_failure_rolls_back_before_release(self, db, make_user, monkeypatch):
+        user_id = make_user(credits=2)
+        hold_id = CreditHold.place(user_id, 1)['hold_id']
+
+        def fail(*args, **kwargs):
+            raise RuntimeError('tag sync failed')
+        monkeypatch.setattr(CreationTag, 'sync', staticmethod(fail))
+
+        with pytest.raises(RuntimeError):
+            Creation.create_many(user_id, 'prompt', ['u1'], 'model', '1x1', tags='a', hold_id=hold_id)
+        # 视图的异常分支：释放预留
+        assert CreditHold.release(hold_id) is True
+
+        assert db.execute('SELECT COUNT(*) FROM creations').fetchone()[0] == 0
+        assert credits_of(db, user_id) == 2
+        assert status_of(db, hold_id) == 'released'
@@ -0,0 +1,87 @@
+"""
+次数流水测试
+"""
+from app.database import CreditHold, CreditLedger, User
+
+
+def ledger_ids(db, user_id):
+    return [row['id'] for row in db.execute(
+        'SELECT id FROM credit_ledger WHERE user_id = ? ORDER BY id', (user_id,)
+    )]
+
+
+class TestCreditLedger:
+    """流水余额推算与核对"""
+
+    def _history(self, db, make_user):
+        """注册 +5、消费 -1、退还 +1、充值 +10、预留 -2 后释放 +2"""
+        user_id = make_user(credits=0)
+        db.execute('UPDATE users SET credits = 5 WHERE id = ?', (user_id,))
+        CreditLedger.record(db, user_id, 5, 'signup')
+        db.commit()
+
+        User.consume_credits(user_id, 1)
+        User.refund_credits(user_id, 1)
+        User.add_credits(user_id, 10, note='top up')
+        CreditHold.release(CreditHold.place(user_id, 2)['hold_id'])
+        return user_id
+
+    def test_verify_consistent_after_every_writer(self, db, make_user):
+        user_id = self._history(db, make_user)
+
+        assert CreditLedger.verify(user_id) == {'credits': 15, 'ledger_balance': 15, 'consistent': True}
+
+    def test_verify_detects_untracked_change(self, db, make_user):
+        user_id = self._history(db, make_user)
+        db.execute('UPDATE users SET credits = credits + 3 WHERE id = ?', (user_id,))
+        db.commit()
+
+        result = CreditLedger.verify(user_id)
+        assert result['consistent'] is False
+        assert result['credits'] == 18
+        assert result['ledger_balance'] == 15
+
+    def test_balance_at_each_entry(self, db, make_user):
+        user_id = self._history(db, make_user)
+        expected = [5, 4, 5, 15, 13, 15]
+
+        ids = ledger_ids(db, user_id)
+        assert [CreditLedger.balance_at(user_id, ledger_id=i) for i in ids] == expected
+
+    def test_balance_at_uses_snapshots(self, db, make_user):
+        user_id = self._history(db, make_user)
+        assert CreditLedger.take_snapshots() >= 1
+        # 没有新流水时不重复写快照
+        assert CreditLedger.take_snapshots() == 0
+
+        User.consume_credits(user_id, 4)
+        ids = ledger_ids(db, user_id)
+
+        assert CreditLedger.balance_at(user_id) == 11
+        assert CreditLedger.balance_at(user_id, ledger_id=ids[3]) == 15
+        assert CreditLedger.balance_at(user_id, ledger_id=ids[-1]) == 11
+        assert CreditLedger.take_snapshots() == 1
+        assert CreditLedger.verify(user_id)['consistent'] is True
+
+    def test_balance_at_time(self, db, make_user):
+        user_id = self._history(db, make_user)
+        ids = ledger_ids(db, user_id)
+        # 前三条流水在一天前，其余在现在
+        db.execute(
+            "UPDATE credit_ledger SET created_at = datetime('now', '-1 day') WHERE id <= ?", (ids[2],)
+        )
+        db.commit()
+
+        at = db.execute("SELECT datetime('now', '-1 hour')").fetchone()[0]
+        assert CreditLedger.balance_at(user_id, at=at) == 5
+
+    def test_history_balance_after_and_paging(self, db, make_user):
+        user_id = self._history(db, make_user)
+
+        first = CreditLedger.get_history(user_id, limit=4)
+        assert [e['balance_after'] for e in first['entries']] == [15, 13, 15, 5]
+        assert [e['delta'] for e in first['entries']] == [2, -2, 10, 1]
+
+        second = CreditLedger.get_history(user_id, limit=4, before_id=first['next_before_id'])
+        assert [e['balance_after'] for e in second['entries']] == [4, 5]
+        assert second['next_before_id'] is None
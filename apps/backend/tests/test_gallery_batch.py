@@ -0,0 +1,197 @@
+"""
+画廊批量操作测试
+"""
+import sqlite3
+
+import pytest
+from flask import g
+
+from app.database import Creation, get_db_path
+
+
+def make_creations(user_id, count, tags=''):
+    saved = Creation.create_many(user_id, 'prompt', [f'u{i}' for i in range(count)], 'model', '1x1', tags=tags)
+    return [creation['id'] for creation in saved['creations']]
+
+
+def creation_row(db, creation_id):
+    row = db.execute(
+        'SELECT user_id, is_favorite, tags, category FROM creations WHERE id = ?', (creation_id,)
+    ).fetchone()
+    return dict(row) if row else None
+
+
+class LockProbeConnection:
+    """所有权查询执行后，用另一个连接尝试写入，记录是否被写锁挡住"""
+
+    def __init__(self, conn, path):
+        self._conn = conn
+        self._path = path
+        self.blocked = None
+
+    def execute(self, sql, *args):
+        cursor = self._conn.execute(sql, *args)
+        if sql.startswith('SELECT id FROM creations WHERE user_id = ?'):
+            other = sqlite3.connect(self._path, timeout=0)
+            try:
+                other.execute('UPDATE creations SET user_id = user_id')
+                other.commit()
+                self.blocked = False
+            except sqlite3.OperationalError:
+                self.blocked = True
+            finally:
+                other.close()
+        return cursor
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+class TestApplyBatch:
+    """Creation.apply_batch"""
+
+    def test_mixed_actions_in_request_order(self, db, make_user):
+        user_id = make_user()
+        a, b, c, d = make_creations(user_id, 4)
+
+        results = Creation.apply_batch(user_id, [
+            {'id': d, 'action': 'delete'},
+            {'id': a, 'action': 'favorite', 'is_favorite': True},
+            {'id': c, 'action': 'category', 'category': 'art'},
+            {'id': b, 'action': 'tags', 'tags': '风景,壁纸'},
+        ])
+
+        assert [(r['id'], r['action'], r['success']) for r in results] == [
+            (d, 'delete', True), (a, 'favorite', True), (c, 'category', True), (b, 'tags', True)
+        ]
+        assert creation_row(db, d) is None
+        assert creation_row(db, a)['is_favorite'] == 1
+        assert creation_row(db, c)['category'] == 'art'
+        assert creation_row(db, b)['tags'] == '风景,壁纸'
+        tags = db.execute('SELECT tag FROM creation_tags WHERE creation_id = ? ORDER BY tag', (b,)).fetchall()
+        assert sorted(row['tag'] for row in tags) == ['壁纸', '风景']
+
+    def test_other_users_creations_untouched(self, db, make_user):
+        owner = make_user('owner@example.com')
+        intruder = make_user('intruder@example.com')
+        (theirs,) = make_creations(owner, 1)
+        (mine,) = make_creations(intruder, 1)
+
+        results = Creation.apply_batch(intruder, [
+            {'id': theirs, 'action': 'delete'},
+            {'id': mine, 'action': 'favorite', 'is_favorite': True},
+            {'id': 9999, 'action': 'category', 'category': 'art'},
+        ])
+
+        assert [r['success'] for r in results] == [False, True, False]
+        assert results[0]['error'] == '作品不存在或无权修改'
+        assert creation_row(db, theirs) == {'user_id': owner, 'is_favorite': 0, 'tags': '', 'category': 'general'}
+        assert creation_row(db, mine)['is_favorite'] == 1
+
+    def test_ownership_checked_under_write_lock(self, db, make_user):
+        user_id = make_user()
+        (creation_id,) = make_creations(user_id, 1)
+        probe = LockProbeConnection(db, get_db_path())
+        g.db = probe
+
+        Creation.apply_batch(user_id, [{'id': creation_id, 'action': 'favorite', 'is_favorite': True}])
+        g.db = db
+
+        # 所有权检查到提交之间其他连接无法转移作品
+        assert probe.blocked is True
+        assert creation_row(db, creation_id)['is_favorite'] == 1
+
+    def test_duplicate_ids_last_value_wins(self, db, make_user):
+        user_id = make_user()
+        (creation_id,) = make_creations(user_id, 1)
+
+        results = Creation.apply_batch(user_id, [
+            {'id': creation_id, 'action': 'category', 'category': 'first'},
+            {'id': creation_id, 'action': 'favorite', 'is_favorite': True},
+            {'id': creation_id, 'action': 'category', 'category': 'second'},
+        ])
+
+        assert [r['success'] for r in results] == [True, True, True]
+        row = creation_row(db, creation_id)
+        assert (row['category'], row['is_favorite']) == ('second', 1)
+
+    def test_modify_then_delete_deletes(self, db, make_user):
+        user_id = make_user()
+        (creation_id,) = make_creations(user_id, 1, tags='old')
+
+        results = Creation.apply_batch(user_id, [
+            {'id': creation_id, 'action': 'tags', 'tags': 'new'},
+            {'id': creation_id, 'action': 'delete'},
+        ])
+
+        assert [r['success'] for r in results] == [True, True]
+        assert creation_row(db, creation_id) is None
+        assert db.execute('SELECT COUNT(*) FROM creation_tags').fetchone()[0] == 0
+        assert db.execute('SELECT COUNT(*) FROM user_tag_counts').fetchone()[0] == 0
+
+    def test_failure_rolls_back_whole_batch(self, db, make_user, monkeypatch):
+        user_id = make_user()
+        a, b = make_creations(user_id, 2)
+
+        def fail(*args, **kwargs):
+            raise RuntimeError('tag sync failed')
+        monkeypatch.setattr('app.database.CreationTag.sync', fail)
+
+        with pytest.raises(RuntimeError):
+            Creation.apply_batch(user_id, [
+                {'id': a, 'action': 'delete'},
+                {'id': b, 'action': 'tags', 'tags': 'x'},
+            ])
+
+        assert creation_row(db, a) is not None
+        assert creation_row(db, b)['tags'] == ''
+
+
+@pytest.fixture
+def batch_view(monkeypatch):
+    """导入画廊视图（加密服务在导入时读取密钥），跳过 JWT 校验"""
+    monkeypatch.setenv('ENCRYPTION_MASTER_KEY', 'test-master-key')
+    monkeypatch.setenv('ENCRYPTION_SALT', 'test-salt')
+    from app.views import generate
+
+    def call(db_app, user_id, operations):
+        monkeypatch.setattr(generate, 'get_jwt_identity', lambda: str(user_id))
+        view = generate.batch_update_creations
+        while hasattr(view, '__wrapped__'):
+            view = view.__wrapped__
+        with db_app.test_request_context('/gallery/batch', method='POST', json={'operations': operations}):
+            response, status = view()
+            return status, response.get_json()
+    return call
+
+
+class TestBatchView:
+    """POST /gallery/batch"""
+
+    def test_malformed_items_keep_their_position(self, db_app, db, make_user, batch_view):
+        user_id = make_user()
+        a, b = make_creations(user_id, 2)
+
+        status, body = batch_view(db_app, user_id, [
+            'not an object',
+            {'id': a, 'action': 'favorite', 'is_favorite': True},
+            {'id': True, 'action': 'delete'},
+            {'id': b, 'action': 'rename'},
+            {'id': b, 'action': 'tags', 'tags': 5},
+            {'id': b, 'action': 'category'},
+        ])
+
+        assert status == 200
+        assert [(r['id'], r['success']) for r in body['results']] == [
+            (None, False), (a, True), (True, False), (b, False), (b, False), (b, True)
+        ]
+        assert body['results'][3]['error'] == '操作格式无效'
+        assert (body['succeeded'], body['failed']) == (2, 4)
+        assert creation_row(db, b)['category'] == 'general'
+
+    def test_rejects_empty_and_oversized(self, db_app, db, make_user, batch_view):
+        user_id = make_user()
+
+        assert batch_view(db_app, user_id, [])[0] == 400
+        too_many = [{'id': 1, 'action': 'delete'}] * (Creation.MAX_BATCH_OPERATIONS + 1)
+        assert batch_view(db_app, user_id, too_many)[0] == 400
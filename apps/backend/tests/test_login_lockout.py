@@ -0,0 +1,76 @@
+"""
+登录失败计数与账户锁定测试
+"""
+import time
+
+import pytest
+
+from app.database import LoginFailure, User
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """可前进的 time.time"""
+    now = [time.time()]
+    monkeypatch.setattr(time, 'time', lambda: now[0])
+
+    def advance(seconds):
+        now[0] += seconds
+    return advance
+
+
+def get_user(db, user_id):
+    return dict(db.execute('SELECT * FROM users WHERE id = ?', (user_id,)).fetchone())
+
+
+class TestLoginLockout:
+    """邮箱冷却（窗口）与账户锁定（累计）"""
+
+    def test_fast_guessing_cools_down_email(self, db, make_user, clock):
+        for _ in range(LoginFailure.LIMIT):
+            result = LoginFailure.record_failure('nobody@example.com')
+
+        assert result['account'] is None
+        assert LoginFailure.get_lock_remaining('nobody@example.com') == LoginFailure.LOCK_SECONDS
+
+        clock(LoginFailure.LOCK_SECONDS + 1)
+        assert LoginFailure.get_lock_remaining('nobody@example.com') == 0
+
+    def test_account_locks_at_limit(self, db, make_user, clock):
+        user_id = make_user('victim@example.com')
+
+        for _ in range(LoginFailure.LIMIT - 1):
+            LoginFailure.record_failure('victim@example.com', user_id)
+        assert User.is_locked(get_user(db, user_id)) is False
+
+        LoginFailure.record_failure('victim@example.com', user_id)
+        assert User.is_locked(get_user(db, user_id)) is True
+
+    def test_slow_guessing_still_locks_account(self, db, make_user, clock):
+        user_id = make_user('victim@example.com')
+
+        # 每个窗口只猜 LIMIT - 1 次，邮箱冷却永远不会触发
+        for _ in range(3):
+            for _ in range(LoginFailure.LIMIT - 1):
+                assert LoginFailure.get_lock_remaining('victim@example.com') == 0
+                if User.is_locked(get_user(db, user_id)):
+                    break
+                LoginFailure.record_failure('victim@example.com', user_id)
+            clock(LoginFailure.WINDOW_SECONDS + 1)
+
+        user = get_user(db, user_id)
+        assert user['login_attempts'] == LoginFailure.LIMIT
+        assert User.is_locked(user) is True
+
+    def test_success_resets_account_counter(self, db, make_user, clock):
+        user_id = make_user('victim@example.com')
+        for _ in range(LoginFailure.LIMIT - 1):
+            LoginFailure.record_failure('victim@example.com', user_id)
+
+        LoginFailure.clear('victim@example.com')
+        User.update_login_info(user_id, success=True)
+        LoginFailure.record_failure('victim@example.com', user_id)
+
+        user = get_user(db, user_id)
+        assert user['login_attempts'] == 1
+        assert User.is_locked(user) is False
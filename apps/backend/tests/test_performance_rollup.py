@@ -0,0 +1,133 @@
+"""
+性能指标汇总测试
+"""
+import pytest
+
+from app.database import PerformanceRollup
+
+# (距现在的时间, 操作类型, 模型, 尺寸, 成功, 生成耗时, API 响应时间, 负载)
+METRICS = [
+    ('-20 minutes', 'text_to_image', 'model-a', '1x1', 1, 4.0, 0.5, 0.3),
+    ('-25 minutes', 'text_to_image', 'model-a', '1x1', 1, 2.5, None, None),
+    ('-30 minutes', 'text_to_image', 'model-b', None, 0, 9.0, 1.5, 0.9),
+    ('-35 minutes', 'image_to_image', None, '16x9', 1, None, 0.2, 0.4),
+    ('-2 hours', 'text_to_image', 'model-a', '1x1', 1, 6.5, 0.7, 0.2),
+    ('-2 hours', 'image_to_image', 'model-b', '16x9', 0, None, None, 0.95),
+    ('-10 hours', 'text_to_image', 'model-b', '1x1', 1, 1.25, 0.1, 0.1),
+    ('-10 hours', 'text_to_image', None, None, 1, 3.0, 0.3, None),
+    ('-30 hours', 'text_to_image', 'model-a', '1x1', 1, 20.0, 5.0, 1.0),
+    ('-2 days', 'image_to_image', 'model-a', '1x1', 0, 30.0, 6.0, 0.5),
+]
+
+
+@pytest.fixture
+def metrics(db):
+    db.executemany(
+        '''INSERT INTO performance_metrics
+           (timestamp, operation_type, model_used, image_size, success,
+            generation_time, api_response_time, server_load)
+           VALUES (datetime('now', ?), ?, ?, ?, ?, ?, ?, ?)''',
+        METRICS
+    )
+    db.commit()
+    return db
+
+
+def raw_summary(db, hours, operation_type=None):
+    """旧版直接在原始记录上计算的口径"""
+    condition = 'AND operation_type = ?' if operation_type else ''
+    row = db.execute(
+        f'''SELECT COUNT(*) AS count, COALESCE(SUM(success), 0) AS success_count,
+                   AVG(CASE WHEN success THEN generation_time END) AS avg_gen,
+                   MIN(CASE WHEN success THEN generation_time END) AS min_gen,
+                   MAX(CASE WHEN success THEN generation_time END) AS max_gen,
+                   AVG(api_response_time) AS avg_api, MAX(server_load) AS peak_load
+            FROM performance_metrics
+            WHERE timestamp >= datetime('now', ?) {condition}''',
+        (f'-{hours} hours',) + ((operation_type,) if operation_type else ())
+    ).fetchone()
+    count = row['count']
+    return {
+        'count': count,
+        'success_count': row['success_count'],
+        'error_rate': round((count - row['success_count']) / count * 100, 2) if count else 0.0,
+        'avg_generation_time': round(row['avg_gen'], 2) if row['avg_gen'] is not None else 0.0,
+        'min_generation_time': row['min_gen'],
+        'max_generation_time': row['max_gen'],
+        'avg_api_response_time': round(row['avg_api'], 3) if row['avg_api'] is not None else None,
+        'peak_load': row['peak_load'] or 0.0
+    }
+
+
+def rollup_rows(db):
+    return [tuple(row) for row in db.execute(
+        'SELECT * FROM performance_rollups ORDER BY resolution, bucket, operation_type, model_used, image_size'
+    )]
+
+
+WINDOWS = [(1, None), (1, 'text_to_image'), (6, None), (24, None), (24, 'text_to_image'), (24, 'image_to_image')]
+
+
+class TestPerformanceRollup:
+    """触发器增量汇总与重建、查询、清理"""
+
+    def test_summarize_matches_raw_aggregates(self, metrics):
+        for hours, operation_type in WINDOWS:
+            assert PerformanceRollup.summarize(hours, operation_type) == raw_summary(metrics, hours, operation_type)
+
+        # 24 小时内 8 条记录，失败 2 条；失败记录的生成耗时不计入
+        day = PerformanceRollup.summarize(24)
+        assert (day['count'], day['success_count']) == (8, 6)
+        assert (day['min_generation_time'], day['max_generation_time']) == (1.25, 6.5)
+
+    def test_rebuild_matches_trigger(self, metrics):
+        incremental = rollup_rows(metrics)
+        assert incremental
+
+        assert PerformanceRollup.rebuild() == len(incremental)
+        assert rollup_rows(metrics) == incremental
+        for hours, operation_type in WINDOWS:
+            assert PerformanceRollup.summarize(hours, operation_type) == raw_summary(metrics, hours, operation_type)
+
+    def test_partial_rebuild_keeps_older_buckets(self, metrics):
+        incremental = rollup_rows(metrics)
+        since = metrics.execute("SELECT datetime('now', '-5 hours')").fetchone()[0]
+
+        PerformanceRollup.rebuild(since=since)
+
+        assert rollup_rows(metrics) == incremental
+
+    def test_breakdown_by_model(self, metrics):
+        rows = {row['model_used']: row for row in PerformanceRollup.breakdown(24, 'model_used')}
+
+        assert set(rows) == {'model-a', 'model-b', None}
+        assert rows['model-a']['count'] == 3
+        assert rows['model-a']['avg_generation_time'] == round((4.0 + 2.5 + 6.5) / 3, 2)
+        assert rows['model-b']['error_rate'] == round(2 / 3 * 100, 2)
+        assert rows[None]['count'] == 2
+
+        with pytest.raises(ValueError):
+            PerformanceRollup.breakdown(24, 'user_id')
+
+    def test_prune_keeps_rollups(self, metrics):
+        before = {hours: PerformanceRollup.summarize(hours) for hours in (1, 24, 72)}
+        hour_buckets = metrics.execute(
+            "SELECT COUNT(*) FROM performance_rollups WHERE resolution = 'hour'"
+        ).fetchone()[0]
+
+        removed = PerformanceRollup.prune(raw_days=1, minute_days=1, batch_size=1)
+
+        # 原始记录删除 2 条（30 小时前、2 天前），对应的分钟桶一并过期，小时桶全部保留
+        assert removed == {'raw': 2, 'minute': 2, 'hour': 0}
+        assert metrics.execute('SELECT COUNT(*) FROM performance_metrics').fetchone()[0] == len(METRICS) - 2
+        assert metrics.execute(
+            "SELECT COUNT(*) FROM performance_rollups WHERE resolution = 'hour'"
+        ).fetchone()[0] == hour_buckets
+        assert {hours: PerformanceRollup.summarize(hours) for hours in (1, 24, 72)} == before
+        assert PerformanceRollup.summarize(72)['count'] == len(METRICS)
+
+    def test_prune_keeps_at_least_one_day_of_minute_buckets(self, metrics):
+        PerformanceRollup.prune(raw_days=0, minute_days=0)
+
+        assert metrics.execute('SELECT COUNT(*) FROM performance_metrics').fetchone()[0] == 0
+        assert PerformanceRollup.summarize(1)['count'] == 4
@@ -0,0 +1,299 @@
+"""
+响应缓存测试
+"""
+import threading
+import time
+
+import pytest
+from flask import Flask, jsonify
+
+from app.middleware import response_cache as response_cache_module
+from app.middleware.compression import response_compressor
+from app.middleware.response_cache import ResponseCache, SharedResponseStore, cache_response
+
+
+@pytest.fixture
+def app_ctx():
+    """缓存的日志输出需要应用上下文"""
+    app = Flask(__name__)
+    with app.app_context():
+        yield app
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """可前进的 time.time"""
+    now = [time.time()]
+    monkeypatch.setattr(time, 'time', lambda: now[0])
+
+    def advance(seconds):
+        now[0] += seconds
+    return advance
+
+
+def single_shard_cache(max_entries, max_bytes=1024 * 1024):
+    """只有一个分片的缓存，容量上限即分片上限，便于验证 LRU 顺序"""
+    cache = ResponseCache()
+    cache.SHARDS = 1
+    cache.shards = cache.shards[:1]
+    cache.configure(max_entries, max_bytes)
+    return cache
+
+
+class TestLRUEviction:
+    """容量上限与 LRU 淘汰"""
+
+    def test_evicts_least_recently_used(self, app_ctx):
+        cache = single_shard_cache(max_entries=3)
+        for key in ('a', 'b', 'c'):
+            cache.set(key, key.upper(), 60)
+
+        # 读取 a 使其成为最近使用，写入 d 时淘汰 b
+        assert cache.get('a') == 'A'
+        cache.set('d', 'D', 60)
+
+        assert cache.get('b') is None
+        assert [cache.get(key) for key in ('a', 'c', 'd')] == ['A', 'C', 'D']
+        assert cache.get_stats()['eviction_count'] == 1
+
+    def test_evicts_to_byte_budget(self, app_ctx):
+        cache = single_shard_cache(max_entries=100, max_bytes=100)
+        cache.set('a', 'A', 60, size=40)
+        cache.set('b', 'B', 60, size=40)
+        cache.set('c', 'C', 60, size=40)
+
+        stats = cache.get_stats()
+        assert cache.get('a') is None
+        assert stats['total_cached_items'] == 2
+        assert stats['total_bytes'] <= 100
+
+    def test_oversized_entry_not_cached(self, app_ctx):
+        cache = single_shard_cache(max_entries=100, max_bytes=100)
+        cache.set('a', 'A', 60, size=40)
+        cache.set('big', 'BIG', 60, size=500)
+
+        assert cache.get('big') is None
+        assert cache.get('a') == 'A'
+
+    def test_expired_entries_removed(self, app_ctx, clock):
+        cache = single_shard_cache(max_entries=10)
+        cache.set('short', 1, 10)
+        cache.set('long', 2, 100)
+
+        clock(11)
+        assert cache.get('short') is None
+        assert cache.get('long') == 2
+        assert cache.get_stats()['expired_count'] == 1
+
+
+class TestTagInvalidation:
+    """按标签失效"""
+
+    def test_invalidates_only_tagged_entries(self, app_ctx):
+        cache = ResponseCache()
+        cache.set('gallery:1', 'g1', 60, tags={'user:1', 'endpoint:get_gallery'})
+        cache.set('stats:1', 's1', 60, tags={'user:1'})
+        cache.set('gallery:2', 'g2', 60, tags={'user:2', 'endpoint:get_gallery'})
+        cache.set('models', 'm', 60, tags={'settings'})
+
+        assert cache.invalidate_tags('user:1') == 2
+        assert cache.get('gallery:1') is None
+        assert cache.get('stats:1') is None
+        assert cache.get('gallery:2') == 'g2'
+
+        assert cache.invalidate_tags('endpoint:get_gallery') == 1
+        assert cache.get('gallery:2') is None
+        assert cache.get('models') == 'm'
+
+    def test_invalidate_all(self, app_ctx):
+        cache = ResponseCache()
+        for i in range(20):
+            cache.set(f'k{i}', i, 60, tags={f'user:{i}'})
+
+        cache.invalidate()
+
+        stats = cache.get_stats()
+        assert stats['total_cached_items'] == 0
+        assert stats['total_bytes'] == 0
+
+    def test_overwrite_drops_old_tags(self, app_ctx):
+        cache = ResponseCache()
+        cache.set('k', 'v1', 60, tags={'user:1'})
+        cache.set('k', 'v2', 60, tags={'user:2'})
+
+        assert cache.invalidate_tags('user:1') == 0
+        assert cache.get('k') == 'v2'
+        assert cache.invalidate_tags('user:2') == 1
+
+
+@pytest.fixture
+def workers(tmp_path):
+    """共享同一个二级缓存文件的两个 worker"""
+    def make_worker():
+        cache = ResponseCache()
+        cache.shared = SharedResponseStore(str(tmp_path / 'response_cache.db'), sync_interval=0)
+        return cache
+    return make_worker(), make_worker()
+
+
+RESPONSE = (b'{"ok": true}', 200, [('Content-Type', 'application/json')])
+
+
+class TestSharedStore:
+    """二级共享缓存"""
+
+    def test_hit_from_other_worker(self, app_ctx, workers):
+        first, second = workers
+
+        value, token = first.fetch('k')
+        assert value is None and token['claimed'] is True
+        first.store('k', RESPONSE, 60, size=len(RESPONSE[0]), tags={'user:1'}, fill_token=token)
+
+        value, token = second.fetch('k')
+        assert value == RESPONSE
+        assert token is None
+        assert second.shared_hits == 1
+        # 二级命中后写入本进程一级缓存，再次读取不经过共享存储
+        assert second.get('k') == RESPONSE
+
+    def test_expired_entry_is_miss(self, app_ctx, workers, clock):
+        first, second = workers
+        _, token = first.fetch('k')
+        first.store('k', RESPONSE, 30, size=len(RESPONSE[0]), tags=(), fill_token=token)
+
+        clock(31)
+        value, token = second.fetch('k')
+        assert value is None
+        assert token['claimed'] is True
+        assert second.shared.get_stats()['items'] == 1
+        second.shared.prune()
+        assert second.shared.get_stats()['items'] == 0
+
+    def test_invalidation_reaches_other_worker(self, app_ctx, workers, clock):
+        first, second = workers
+        _, token = first.fetch('k')
+        first.store('k', RESPONSE, 60, size=len(RESPONSE[0]), tags={'user:1'}, fill_token=token)
+        assert second.fetch('k')[0] == RESPONSE
+
+        first.invalidate_tags('user:1')
+        clock(1)
+
+        value, token = second.fetch('k')
+        assert value is None
+        assert second.get_stats()['invalidated_count'] == 1
+
+    def test_store_skipped_when_invalidated_during_compute(self, app_ctx, workers):
+        first, second = workers
+        _, token = first.fetch('k')
+        # 计算期间另一个 worker 使相关标签失效，旧数据不能写入共享存储
+        second.invalidate_tags('user:1')
+        first.store('k', RESPONSE, 60, size=len(RESPONSE[0]), tags={'user:1'}, fill_token=token)
+
+        assert first.shared.get('k', time.time()) is None
+
+
+class SlowView:
+    """被缓存的视图：统计调用次数，gate 关闭时阻塞直到放行"""
+
+    def __init__(self):
+        self.calls = 0
+        self.entered = threading.Event()
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def __call__(self):
+        self.calls += 1
+        self.entered.set()
+        self.gate.wait(5)
+        return jsonify({'n': self.calls})
+
+
+@pytest.fixture
+def cached_app(monkeypatch):
+    """以全新缓存实例挂载两个缓存视图：/swr（过期后返回旧值）和 /locked（未命中加锁）"""
+    cache = ResponseCache()
+    monkeypatch.setattr(response_cache_module, 'response_cache', cache)
+
+    app = Flask(__name__)
+    view = SlowView()
+    app.add_url_rule('/swr', 'swr', cache_response(ttl=10, use_user_id=False, stale_ttl=60)(
+        lambda: view()))
+    app.add_url_rule('/locked', 'locked', cache_response(ttl=60, use_user_id=False, lock_on_miss=True)(
+        lambda: view()))
+    return app, cache, view
+
+
+def get_json(app, path, results=None):
+    response = app.test_client().get(path)
+    data = response.get_json() if response.status_code == 200 else None
+    if results is not None:
+        results.append(data)
+    return response.status_code, data
+
+
+class TestRefreshCoordination:
+    """过期旧值与未命中加锁"""
+
+    def test_stale_while_revalidate(self, cached_app, clock):
+        app, cache, view = cached_app
+        assert get_json(app, '/swr') == (200, {'n': 1})
+
+        clock(11)
+        view.gate.clear()
+        view.entered.clear()
+        refresher = threading.Thread(target=get_json, args=(app, '/swr'))
+        refresher.start()
+        assert view.entered.wait(2)
+
+        # 刷新进行中，其余请求立即拿到旧值，不会再次计算
+        assert get_json(app, '/swr') == (200, {'n': 1})
+        assert view.calls == 2
+
+        view.gate.set()
+        refresher.join()
+        assert get_json(app, '/swr') == (200, {'n': 2})
+        assert cache.get_stats()['stale_hit_count'] >= 1
+
+    def test_stale_value_not_served_past_stale_ttl(self, cached_app, clock):
+        app, cache, view = cached_app
+        get_json(app, '/swr')
+
+        clock(10 + 61)
+        assert get_json(app, '/swr') == (200, {'n': 2})
+
+    def test_lock_on_miss_computes_once(self, cached_app):
+        app, cache, view = cached_app
+        view.gate.clear()
+        results = []
+        threads = [threading.Thread(target=get_json, args=(app, '/locked', results)) for _ in range(4)]
+        threads[0].start()
+        assert view.entered.wait(2)
+        for thread in threads[1:]:
+            thread.start()
+
+        view.gate.set()
+        for thread in threads:
+            thread.join()
+
+        assert view.calls == 1
+        assert results == [{'n': 1}] * 4
+
+    def test_claim_released_when_caching_fails(self, cached_app, monkeypatch):
+        app, cache, view = cached_app
+        original = response_compressor.encode_for_cache
+        failures = []
+
+        def fail_once(response, data):
+            if not failures:
+                failures.append(True)
+                raise ValueError('encode failed')
+            return original(response, data)
+        monkeypatch.setattr(response_compressor, 'encode_for_cache', fail_once)
+
+        assert get_json(app, '/locked')[0] == 500
+        assert cache._refreshing == {}
+
+        # 下一个请求直接计算，不会等待已失败请求遗留的刷新权
+        started = time.monotonic()
+        assert get_json(app, '/locked') == (200, {'n': 2})
+        assert time.monotonic() - started < 1
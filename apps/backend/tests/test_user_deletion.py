@@ -0,0 +1,159 @@
+"""
+用户删除任务测试
+"""
+import pytest
+from flask import g
+
+from app.database import Creation, CreationSearchIndex, UserDeletionJob, close_db, get_db, init_db
+
+
+class CrashingConnection:
+    """执行到第 crash_on 条分块语句时模拟进程退出（SystemExit 不会被任务的异常处理捕获）"""
+
+    def __init__(self, conn, crash_on):
+        self._conn = conn
+        self._chunks = 0
+        self._crash_on = crash_on
+
+    def execute(self, sql, *args):
+        if any(sql == step_sql for _, step_sql in UserDeletionJob.STEPS):
+            self._chunks += 1
+            if self._chunks == self._crash_on:
+                raise SystemExit('worker killed')
+        return self._conn.execute(sql, *args)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+@pytest.fixture
+def doomed_user(db, make_user):
+    """待删除用户：3 个作品、3 个会话、4 条性能指标"""
+    admin_id = make_user('admin@example.com')
+    user_id = make_user('doomed@example.com')
+    Creation.create_many(user_id, 'sunset', ['u1', 'u2', 'u3'], 'model', '1x1', tags='sky')
+    db.executemany('INSERT INTO user_sessions (user_id, session_id) VALUES (?, ?)',
+                   [(user_id, f't{i}') for i in range(3)])
+    db.executemany("INSERT INTO performance_metrics (user_id, operation_type) VALUES (?, 'text_to_image')",
+                   [(user_id,)] * 4)
+    db.commit()
+    return admin_id, user_id
+
+
+def count(db, table, user_id):
+    return db.execute(f'SELECT COUNT(*) FROM {table} WHERE user_id = ?', (user_id,)).fetchone()[0]
+
+
+class TestUserDeletionJob:
+    """分块删除与中断恢复"""
+
+    def test_create_deactivates_and_dedupes(self, db, doomed_user):
+        admin_id, user_id = doomed_user
+
+        job = UserDeletionJob.create(user_id, admin_id)
+        assert job['status'] == 'pending'
+        assert db.execute('SELECT is_active FROM users WHERE id = ?', (user_id,)).fetchone()[0] == 0
+        assert UserDeletionJob.create(user_id, admin_id)['id'] == job['id']
+
+        with pytest.raises(ValueError):
+            UserDeletionJob.create(admin_id, admin_id)
+
+    def test_resume_after_crash(self, db, doomed_user):
+        admin_id, user_id = doomed_user
+        job_id = UserDeletionJob.create(user_id, admin_id)['id']
+
+        # 第 4 块（两个作品块之后的第二个会话块）执行前进程退出：作品和前 2 个会话已提交
+        g.db = CrashingConnection(db, crash_on=4)
+        with pytest.raises(SystemExit):
+            UserDeletionJob.run(job_id, chunk_size=2, pause_seconds=0)
+        g.db = db
+
+        job = UserDeletionJob.get(job_id)
+        assert job['status'] == 'running'
+        assert job['progress'] == {'creations_orphaned': 3, 'sessions_deleted': 2}
+        assert count(db, 'user_sessions', user_id) == 1
+        assert UserDeletionJob.get_unfinished() == [job_id]
+
+        job = UserDeletionJob.run(job_id, chunk_size=2, pause_seconds=0)
+
+        assert job['status'] == 'completed'
+        assert job['progress']['sessions_deleted'] == 3
+        assert job['progress']['performance_metrics_deleted'] == 4
+        assert count(db, 'user_sessions', user_id) == 0
+        assert count(db, 'performance_metrics', user_id) == 0
+        assert db.execute('SELECT 1 FROM users WHERE id = ?', (user_id,)).fetchone() is None
+        assert UserDeletionJob.get_unfinished() == []
+
+        # 已完成的任务重复执行不会再写审计记录
+        UserDeletionJob.run(job_id)
+        audits = db.execute('SELECT creations_orphaned FROM user_deletions WHERE deleted_user_id = ?',
+                            (user_id,)).fetchall()
+        assert [row[0] for row in audits] == [3]
+
+    def test_creations_kept_as_orphans(self, db, doomed_user):
+        admin_id, user_id = doomed_user
+        job_id = UserDeletionJob.create(user_id, admin_id)['id']
+
+        job = UserDeletionJob.run(job_id, chunk_size=2, pause_seconds=0)
+
+        assert job['status'] == 'completed'
+        assert job['progress']['creations_orphaned'] == 3
+        rows = db.execute('SELECT user_id, is_orphaned FROM creations').fetchall()
+        assert [tuple(row) for row in rows] == [(None, 1)] * 3
+        # 孤儿作品的标签和计数随所有者一起清理
+        assert db.execute('SELECT COUNT(*) FROM creation_tags').fetchone()[0] == 0
+        assert db.execute('SELECT COUNT(*) FROM user_gallery_stats').fetchone()[0] == 0
+
+    def test_failed_job_is_resumable(self, db, doomed_user):
+        admin_id, user_id = doomed_user
+        job_id = UserDeletionJob.create(user_id, admin_id)['id']
+        db.execute('DROP TABLE performance_metrics')
+        db.commit()
+
+        with pytest.raises(Exception):
+            UserDeletionJob.run(job_id, chunk_size=2, pause_seconds=0)
+        job = UserDeletionJob.get(job_id)
+        assert job['status'] == 'failed'
+        assert job['error']
+        assert job['progress']['sessions_deleted'] == 3
+        assert UserDeletionJob.get_unfinished() == [job_id]
+
+
+class TestNullableOwnerMigration:
+    """旧库 creations.user_id 为 NOT NULL 时由 init_db 重建"""
+
+    def _restore_not_null(self, db):
+        """把已建好的库改回旧版约束（只改表定义，数据不动）"""
+        db.execute('PRAGMA writable_schema = ON')
+        db.execute(
+            "UPDATE sqlite_master SET sql = replace(sql, 'user_id INTEGER,', 'user_id INTEGER NOT NULL,') "
+            "WHERE type = 'table' AND name = 'creations'"
+        )
+        db.commit()
+        db.execute('PRAGMA writable_schema = OFF')
+        close_db()
+
+    def test_init_db_rebuilds_creations(self, db, doomed_user):
+        admin_id, user_id = doomed_user
+        db.execute('DELETE FROM creations WHERE image_url = ?', ('u3',))
+        db.commit()
+        self._restore_not_null(db)
+
+        db = get_db()
+        owner = [row for row in db.execute('PRAGMA table_info(creations)') if row['name'] == 'user_id'][0]
+        assert owner['notnull'] == 1
+
+        init_db()
+
+        owner = [row for row in db.execute('PRAGMA table_info(creations)') if row['name'] == 'user_id'][0]
+        assert owner['notnull'] == 0
+        # 数据、标签和搜索索引保留，自增序列不回退
+        assert [row['image_url'] for row in db.execute('SELECT image_url FROM creations ORDER BY id')] == ['u1', 'u2']
+        assert db.execute('SELECT COUNT(*) FROM creation_tags').fetchone()[0] == 2
+        index = CreationSearchIndex.WORD_INDEX
+        assert db.execute(f"SELECT COUNT(*) FROM {index} WHERE {index} MATCH 'sunset'").fetchone()[0] == 2
+        assert Creation.create_many(user_id, 'p', ['u4'], 'model', '1x1')['creations'][0]['id'] == 4
+
+        job_id = UserDeletionJob.create(user_id, admin_id)['id']
+        assert UserDeletionJob.run(job_id, pause_seconds=0)['status'] == 'completed'
+        assert db.execute('SELECT COUNT(*) FROM creations WHERE user_id IS NULL').fetchone()[0] == 3
@@ -265,6 +265,31 @@ export const galleryApi = {
     return response.data
   },
 
+  // 批量操作（多选收藏/标签/分类/删除，一个请求）- 清理缓存
+  batchUpdate: async (operations: Array<{
+    id: number
+    action: 'favorite' | 'tags' | 'category' | 'delete'
+    is_favorite?: boolean
+    tags?: string
+    category?: string
+  }>): Promise<{
+    success: boolean
+    results?: Array<{ id: number; action: string; success: boolean; error?: string }>
+    succeeded?: number
+    failed?: number
+    error?: string
+  }> => {
+    const response = await api.post('/gallery/batch', { operations })
+    apiCache.deletePattern('/gallery')
+    return response.data
+  },
+
+  // 导出全部作品（ZIP，含 manifest.json）
+  exportGallery: async (): Promise<Blob> => {
+    const response = await api.get('/gallery/export', { responseType: 'blob', timeout: 0 })
+    return response.data
+  },
+
   // 获取可用分类 - 带缓存
   getCategories: async (): Promise<{ success: boolean; categories: string[]; error?: string }> => {
     return withCache(
@@ -746,17 +771,10 @@ export const adminApi = {
   deleteUser: async (userId: number, reason?: string): Promise<{
     success: boolean;
     message?: string;
-    deleted_user?: {
+    job?: {
       id: number;
-      email: string;
-      deleted_at: string;
-    };
-    impact?: {
-      creations_orphaned: number;
-      sessions_deleted: number;
-      behaviors_deleted: number;
-      preferences_deleted: number;
-      performance_metrics_deleted: number;
+      status: 'pending' | 'running' | 'completed' | 'failed';
+      progress: Record<string, number>;
     };
     error?: string;
   }> => {
@@ -25,20 +25,30 @@ export interface AdminStats {
   creations_today: number;
 }
 
+export interface UserDeletionJob {
+  id: number;
+  user_id: number;
+  user_email: string;
+  admin_id: number;
+  reason: string | null;
+  status: 'pending' | 'running' | 'completed' | 'failed';
+  current_step: string | null;
+  progress: {
+    creations_orphaned?: number;
+    sessions_deleted?: number;
+    behaviors_deleted?: number;
+    preferences_deleted?: number;
+    recommendations_deleted?: number;
+    performance_metrics_deleted?: number;
+  };
+  error: string | null;
+  created_at: string;
+  updated_at: string;
+  completed_at: string | null;
+}
+
 export interface DeleteUserResponse {
   success: boolean;
   message: string;
-  deleted_user: {
-    id: number;
-    email: string;
-    deleted_at: string;
-  };
-  impact: {
-    creations_orphaned: number;
-    sessions_deleted: number;
-    behaviors_deleted: number;
-    preferences_deleted: number;
-    recommendations_deleted: number;
-    performance_metrics_deleted: number;
-  };
+  job: UserDeletionJob;
 }
\ No newline at end of file
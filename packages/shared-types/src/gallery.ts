@@ -16,6 +16,7 @@ export interface Creation {
   visibility: string;
   created_at: string;
   updated_at: string;
+  search_rank?: number; // 仅搜索结果返回（BM25，越小越相关）
 }
 
 export interface GalleryStats {
@@ -30,6 +31,7 @@ export interface GalleryResponse {
   creations: Creation[];
   page: number;
   per_page: number;
+  next_cursor?: string | null; // 搜索结果的下一页游标
   stats: GalleryStats;
   error?: string;
 }
@@ -41,4 +43,5 @@ export interface GalleryFilters {
   tags?: string;
   search?: string;
   is_favorite?: boolean;
+  cursor?: string;
 }
\ No newline at end of file
@@ -66,6 +66,28 @@ export interface UserProfile {
   roles?: Role[];
 }
 
+/**
+ * 次数流水条目
+ */
+export interface CreditLedgerEntry {
+  id: number;
+  delta: number;
+  entry_type: 'signup' | 'consume' | 'refund' | 'admin_add' | 'hold' | 'hold_release' | 'hold_expire';
+  reference: string | null;
+  actor_id: number | null;
+  note: string | null;
+  created_at: string;
+  balance_after: number;
+}
+
+/**
+ * 次数流水响应接口（before_id 翻页）
+ */
+export interface CreditHistoryResponse {
+  entries: CreditLedgerEntry[];
+  next_before_id: number | null;
+}
+
 /**
  * 用户权限响应接口
  */